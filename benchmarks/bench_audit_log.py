@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+# Micro-benchmark: 10k audit inserts with the old per-call connection pattern
+# versus the pooled thread-local connection.
+#
+#   python benchmarks/bench_audit_log.py [count]
+
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from certledger import db  # noqa: E402
+
+
+def _legacy_log_audit(data_dir: Path, i: int) -> None:
+    # Mirrors the old db.connect() + log_audit(): mkdirs, PRAGMAs, commit, close.
+    for d in (data_dir, data_dir / "pdfs", data_dir / "logs"):
+        d.mkdir(exist_ok=True)
+    con = sqlite3.connect(data_dir / "certs.sqlite3", timeout=30)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA foreign_keys = ON;")
+    con.execute("PRAGMA journal_mode = WAL;")
+    con.execute("PRAGMA busy_timeout = 30000;")
+    con.execute(
+        "INSERT INTO audit_log(ts, actor, action, entity_type, entity_id, before_json, after_json, result, message) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (db.now_iso(), "bench", "BENCH", "CERT", f"C-{i}", None, None, "OK", "benchmark"),
+    )
+    con.commit()
+    con.close()
+
+
+def _run(label: str, count: int, fn) -> None:
+    t0 = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<32} {count / elapsed:>10.0f} ops/sec  ({elapsed:.2f}s)")
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        db.set_database_file(data_dir / "certs.sqlite3")
+        db.init_db()
+
+        _run("before: connect per call", count, lambda i: _legacy_log_audit(data_dir, i))
+        _run("after: pooled connection", count,
+             lambda i: db.log_audit("BENCH", "CERT", f"C-{i}", "OK", "benchmark", actor="bench"))
+
+        t0 = time.perf_counter()
+        with db.transaction():
+            for i in range(count):
+                db.log_audit("BENCH", "CERT", f"C-{i}", "OK", "benchmark", actor="bench")
+        elapsed = time.perf_counter() - t0
+        print(f"{'after: one outer transaction':<32} {count / elapsed:>10.0f} ops/sec  ({elapsed:.2f}s)")
+
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+# End-to-end check of the background MailboxWatcher against a local fake IMAP
+# server (plain text, no network): a signature reply announced in the same
+# packet as the IDLE continuation, or pushed during IDLE, is applied, a reply with an empty body does not hold up later ones, a dropped
+# connection is reconnected, a settings change moves the
+# watcher to another server (whose UIDs start below the first one's), NOOP
+# polling works when IDLE is not offered, lowering last_imap_uid in settings
+# rescans, a new UIDVALIDITY rescans the folder, and stop() returns promptly. Runs in a throwaway app root with a credentials
+# file, so neither the real database nor the OS keyring is touched.
+#
+#   python benchmarks/check_mailbox_watcher.py [-v]
+#
+# Exits non-zero if any check fails. The "Mailbox watcher error" traceback
+# logged after the dropped connection is expected; -v logs everything.
+
+import imaplib
+import logging
+import re
+import select
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from certledger import credentials, db, emailer, paths  # noqa: E402
+from certledger.settings_store import Settings, save_settings, update_settings  # noqa: E402
+from certledger.watcher import MailboxWatcher  # noqa: E402
+
+SYSTEM_EMAIL = "ledger@example.com"
+SIGNER_EMAIL = "signer@example.com"
+
+
+def _uid_set(spec: str, uids: list[int]) -> list[int]:
+    out = set()
+    for part in spec.split(","):
+        lo, _, hi = part.partition(":")
+        hi = hi or lo
+        lo_n = int(lo)
+        hi_n = (uids[-1] if uids else 0) if hi == "*" else int(hi)
+        out.update(u for u in uids if min(lo_n, hi_n) <= u <= max(lo_n, hi_n))
+    return sorted(out)
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    # Just enough IMAP4rev1 for CertLedger: LOGIN, SELECT, UID SEARCH/FETCH,
+    # NOOP, LOGOUT and (unless idle=False) IDLE with EXISTS pushes.
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, idle: bool = True):
+        super().__init__(("127.0.0.1", 0), _ImapHandler)
+        self.idle = idle
+        self.uidvalidity = 1
+        self.messages: dict[int, bytes] = {}
+        self.logins = 0
+        self.noops = 0
+        self.idling: list[threading.Event] = []
+        self.with_next_idle: list[tuple[int, bytes]] = []
+        self.connections: list[socket.socket] = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def deliver(self, uid: int, raw: bytes) -> None:
+        with self.lock:
+            self.messages[uid] = raw
+            for event in self.idling:
+                event.set()
+
+    def deliver_with_next_idle(self, uid: int, raw: bytes) -> None:
+        # Arrives as the next IDLE starts; its EXISTS is written together with
+        # "+ idling", so the client reads both lines from one packet.
+        with self.lock:
+            self.with_next_idle.append((uid, raw))
+
+    def renumber(self, messages: dict[int, bytes]) -> None:
+        # Replaces the folder's contents under a new UIDVALIDITY.
+        with self.lock:
+            self.uidvalidity += 1
+            self.messages = dict(messages)
+
+    def drop_connections(self) -> None:
+        with self.lock:
+            for sock in self.connections:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class _ImapHandler(socketserver.StreamRequestHandler):
+    server: FakeImapServer
+
+    def write(self, data: str | bytes) -> None:
+        self.wfile.write(data.encode() if isinstance(data, str) else data)
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        srv = self.server
+        with srv.lock:
+            srv.connections.append(self.connection)
+        try:
+            self.write("* OK fake IMAP ready\r\n")
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                tag, cmd, *rest = line.decode().strip().split(" ", 2)
+                if not self.command(tag, cmd.upper(), rest[0] if rest else ""):
+                    return
+        except OSError:
+            pass
+        finally:
+            with srv.lock:
+                srv.connections.remove(self.connection)
+
+    def command(self, tag: str, cmd: str, args: str) -> bool:
+        srv = self.server
+        if cmd == "CAPABILITY":
+            self.write(f"* CAPABILITY IMAP4rev1{' IDLE' if srv.idle else ''}\r\n{tag} OK done\r\n")
+        elif cmd == "LOGIN":
+            with srv.lock:
+                srv.logins += 1
+            self.write(f"{tag} OK logged in\r\n")
+        elif cmd == "SELECT":
+            self.write(
+                f"* {len(srv.messages)} EXISTS\r\n* OK [UIDVALIDITY {srv.uidvalidity}] UIDs valid\r\n"
+                f"{tag} OK [READ-WRITE] selected\r\n"
+            )
+        elif cmd == "NOOP":
+            with srv.lock:
+                srv.noops += 1
+            self.write(f"{tag} OK noop\r\n")
+        elif cmd == "LOGOUT":
+            self.write(f"* BYE\r\n{tag} OK bye\r\n")
+            return False
+        elif cmd == "IDLE" and srv.idle:
+            return self.idle(tag)
+        elif cmd == "UID":
+            self.uid(tag, *args.split(" ", 1))
+        else:
+            self.write(f"{tag} BAD unknown command\r\n")
+        return True
+
+    def idle(self, tag: str) -> bool:
+        srv = self.server
+        event = threading.Event()
+        with srv.lock:
+            srv.idling.append(event)
+            arrived, srv.with_next_idle = srv.with_next_idle, []
+            srv.messages.update(arrived)
+        try:
+            self.write(f"+ idling\r\n* {len(srv.messages)} EXISTS\r\n" if arrived else "+ idling\r\n")
+            while True:
+                readable, _, _ = select.select([self.connection], [], [], 0.1)
+                if event.is_set():
+                    event.clear()
+                    self.write(f"* {len(srv.messages)} EXISTS\r\n")
+                if readable:
+                    line = self.rfile.readline()
+                    if not line:
+                        return False
+                    if line.strip().upper() == b"DONE":
+                        break
+        finally:
+            with srv.lock:
+                srv.idling.remove(event)
+        self.write(f"{tag} OK idle done\r\n")
+        return True
+
+    def uid(self, tag: str, sub: str, args: str) -> None:
+        with self.server.lock:
+            messages = dict(self.server.messages)
+        uids = sorted(messages)
+        if sub.upper() == "SEARCH":
+            found = _uid_set(args.split()[-1], uids)
+            self.write("* SEARCH " + " ".join(map(str, found)) + "\r\n")
+        else:
+            uid_set, items = args.split(" ", 1)
+            for uid in _uid_set(uid_set, uids):
+                head, _, body = messages[uid].partition(b"\r\n\r\n")
+                fields = re.search(r"HEADER\.FIELDS \(([^)]*)\)", items)
+                if fields:
+                    wanted = fields.group(1).lower().split()
+                    lines = [h for h in head.split(b"\r\n") if h.split(b":")[0].decode().lower() in wanted]
+                    literal = b"\r\n".join(lines) + b"\r\n\r\n"
+                else:
+                    literal = body[:int(re.search(r"<0\.(\d+)>", items).group(1))]
+                if not literal:
+                    # Like most servers, send an empty body as a quoted string.
+                    self.write(f'* {uid} FETCH (UID {uid} BODY[TEXT]<0> "")\r\n')
+                    continue
+                self.write(f"* {uid} FETCH (UID {uid} BODY[] {{{len(literal)}}}\r\n".encode() + literal + b")\r\n")
+        self.write(f"{tag} OK uid done\r\n")
+
+
+def _reply(subject: str, body: str) -> bytes:
+    msg = EmailMessage()
+    msg["From"] = SIGNER_EMAIL
+    msg["Subject"] = subject
+    if body:
+        msg.set_content(body)
+    return msg.as_bytes().replace(b"\n", b"\r\n")
+
+
+def _status(cert_number: str) -> str:
+    row = db.get_connection().execute("SELECT status FROM certificates WHERE cert_number=?", (cert_number,)).fetchone()
+    return row["status"]
+
+
+def _evidence() -> int:
+    return db.get_connection().execute("SELECT COUNT(*) FROM email_evidence").fetchone()[0]
+
+
+def _wait_for(predicate: Callable[[], bool], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def _seed(count: int) -> list[str]:
+    now = db.now_iso()
+    db.upsert_person(dict(
+        person_id="P-000001", gov_id_number="G-1", date_of_birth="1990-01-01", official_name="Signer",
+        email=SIGNER_EMAIL, created_at=now, updated_at=now,
+    ))
+    numbers = []
+    for i in range(1, count + 1):
+        number = f"C-2026-{i:06d}"
+        db.create_certificate(dict(
+            cert_number=number, cert_type="Check", issued_at=now, valid_until=now,
+            receiver_person_id="P-000001", giver_person_id="P-000001",
+            receiver_name_used="Signer", giver_name_used="Signer",
+            status="SIGN_REQUESTED", sign_code=f"S-{i}",
+        ))
+        numbers.append(number)
+    return numbers
+
+
+def main() -> int:
+    verbose = "-v" in sys.argv[1:]
+    logging.basicConfig(
+        level=logging.INFO if verbose else logging.WARNING, format="%(asctime)s %(threadName)s %(message)s"
+    )
+    logger = logging.getLogger("check")
+    failures = 0
+
+    def check(label: str, ok: bool, detail: str = "") -> None:
+        nonlocal failures
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'}  {label}{f' ({detail})' if detail else ''}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Settings and the database live under the app root; point it here.
+        paths.app_root = lambda: Path(tmp)
+        credentials.set_provider(credentials.FileProvider(Path(tmp) / "credentials.json"))
+        db.init_db()
+        certs = _seed(7)
+
+        first = FakeImapServer(idle=True)
+        second = FakeImapServer(idle=False)
+        save_settings(Settings(system_email=SYSTEM_EMAIL, imap_host="127.0.0.1", imap_port=first.port))
+        emailer.set_app_password(SYSTEM_EMAIL, "app-password")
+        first.deliver(1, _reply("Hello", "not a signature"))
+        first.deliver_with_next_idle(2, _reply(certs[5], "S-6"))
+
+        watcher = MailboxWatcher(logger, imap_factory=imaplib.IMAP4, poll_interval=0.2, max_backoff=1.0)
+        watcher.start()
+        try:
+            check("connects and idles", _wait_for(lambda: bool(first.idling), 5), f"{first.logins} login(s)")
+            signed = _wait_for(lambda: _status(certs[5]) == "SIGNED", 5)
+            check("EXISTS in the same packet as the IDLE continuation is seen", signed)
+
+            started = time.monotonic()
+            first.deliver(3, _reply(certs[0], "S-1"))
+            signed = _wait_for(lambda: _status(certs[0]) == "SIGNED", 5)
+            check("IDLE push is applied", signed, f"{time.monotonic() - started:.2f}s")
+
+            first.deliver(4, _reply(certs[1], ""))
+            first.deliver(5, _reply(certs[1], "S-2"))
+            signed = _wait_for(lambda: _status(certs[1]) == "SIGNED", 5)
+            check("an empty body does not hold up later signatures", signed)
+
+            first.drop_connections()
+            first.deliver(6, _reply(certs[2], "S-3"))
+            signed = _wait_for(lambda: _status(certs[2]) == "SIGNED", 10)
+            check("reconnects after a dropped connection", signed and first.logins == 2, f"{first.logins} logins")
+
+            second.deliver(1, _reply(certs[3], "S-4"))
+            update_settings(imap_port=second.port)
+            signed = _wait_for(lambda: _status(certs[3]) == "SIGNED", 10)
+            check("follows a settings change to another server", signed and second.logins == 1)
+
+            polled = _wait_for(lambda: second.noops > 0, 5)
+            second.deliver(2, _reply(certs[4], "S-5"))
+            signed = _wait_for(lambda: _status(certs[4]) == "SIGNED", 5)
+            check("NOOP polling without IDLE", polled and signed, f"{second.noops} NOOP(s)")
+
+            before = _evidence()
+            update_settings(last_imap_uid=0)
+            rescanned = _wait_for(lambda: _evidence() == before + 2, 5)
+            check("lowering last_imap_uid rescans", rescanned, f"{_evidence() - before} email(s) again")
+
+            second.renumber({1: _reply(certs[6], "S-7")})
+            second.drop_connections()
+            signed = _wait_for(lambda: _status(certs[6]) == "SIGNED", 10)
+            check("a new UIDVALIDITY rescans the folder", signed)
+        finally:
+            started = time.monotonic()
+            watcher.stop(5)
+            check("stops promptly", not watcher.is_alive(), f"{time.monotonic() - started:.2f}s")
+            first.shutdown()
+            second.shutdown()
+            db.close_connection()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+# End-to-end check of dispatcher.dispatch_emails against a local SMTP stub
+# (plain text, no network): 4xx replies are retried, a 5xx refusal is final
+# and reported as permanent, sessions are reused, the rate limit spaces
+# sends, a rejected login is tried once per batch, and a refused connection
+# is retried a bounded number of times. Every outcome must reach the audit
+# log. Runs in a throwaway app root with a credentials file, so neither the
+# real database nor the OS keyring is touched.
+#
+#   python benchmarks/check_smtp_dispatch.py [-v]
+#
+# Exits non-zero if any check fails.
+
+import logging
+import smtplib
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from certledger import credentials, db, emailer, paths  # noqa: E402
+from certledger.dispatcher import SignatureRequest, dispatch_signature_requests  # noqa: E402
+from certledger.settings_store import Settings, save_settings  # noqa: E402
+
+SYSTEM_EMAIL = "ledger@example.com"
+PASSWORD = "app-password"
+BOUNCE = "bounce@example.com"
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    # Accepts every message except for BOUNCE (550). With tempfail_every=n,
+    # every n-th RCPT gets a 451; with accept_login=False every AUTH gets 535.
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, tempfail_every: int = 0, accept_login: bool = True):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.tempfail_every = tempfail_every
+        self.accept_login = accept_login
+        self.connections = 0
+        self.logins = 0
+        self.recipients = 0
+        self.delivered = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def session(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP("127.0.0.1", self.port, timeout=10)
+        smtp.login(SYSTEM_EMAIL, PASSWORD)
+        return smtp
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    server: SmtpStub
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        srv = self.server
+        with srv.lock:
+            srv.connections += 1
+        self.reply("220 stub ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-stub\r\n250 AUTH PLAIN")
+            elif verb == "AUTH":
+                with srv.lock:
+                    srv.logins += 1
+                self.reply("235 2.7.0 accepted" if srv.accept_login else "535 5.7.8 bad credentials")
+            elif verb == "RCPT":
+                with srv.lock:
+                    srv.recipients += 1
+                    tempfail = srv.tempfail_every and srv.recipients % srv.tempfail_every == 0
+                if BOUNCE in cmd.lower():
+                    self.reply("550 5.1.1 no such user")
+                elif tempfail:
+                    self.reply("451 4.3.0 try again later")
+                else:
+                    self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with srv.lock:
+                    srv.delivered += 1
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+def _requests(count: int, bounce_at: int = -1) -> list[SignatureRequest]:
+    return [
+        SignatureRequest(f"C-2026-{i:06d}", BOUNCE if i == bounce_at else f"user{i}@example.com", f"S-{i}", "Check")
+        for i in range(count)
+    ]
+
+
+def _audit_rows() -> int:
+    return db.get_connection().execute("SELECT COUNT(*) FROM audit_log WHERE action='SEND_SIGN_EMAIL'").fetchone()[0]
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main() -> int:
+    verbose = "-v" in sys.argv[1:]
+    logging.basicConfig(level=logging.INFO if verbose else logging.CRITICAL, format="%(asctime)s %(threadName)s %(message)s")
+    logger = logging.getLogger("check")
+    failures = 0
+
+    def check(label: str, ok: bool, detail: str = "") -> None:
+        nonlocal failures
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'}  {label}{f' ({detail})' if detail else ''}")
+
+    def dispatch(requests, factory: Callable[[], smtplib.SMTP], **options):
+        before = _audit_rows()
+        options = {"workers": 4, "rate_per_second": 0, "retries": 3, "retry_delay": 0.01, **options}
+        results = dispatch_signature_requests(requests, logger, session_factory=factory, **options)
+        return results, _audit_rows() - before
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Settings and the database live under the app root; point it here.
+        paths.app_root = lambda: Path(tmp)
+        credentials.set_provider(credentials.FileProvider(Path(tmp) / "credentials.json"))
+        db.init_db()
+        save_settings(Settings(system_email=SYSTEM_EMAIL))
+        emailer.set_app_password(SYSTEM_EMAIL, PASSWORD)
+
+        stub = SmtpStub(tempfail_every=7)
+        results, audited = dispatch(_requests(40, bounce_at=5), stub.session)
+        failed = [r for r in results if not r.ok]
+        retried = sum(r.ok and r.attempts > 1 for r in results)
+        check(
+            "451 replies are retried",
+            retried > 0 and len(failed) == 1 and stub.delivered == len(results) - 1,
+            f"{stub.delivered} delivered, {retried} on a retry",
+        )
+        check(
+            "a 550 refusal is final and permanent",
+            len(failed) == 1 and failed[0].to_email == BOUNCE and failed[0].attempts == 1 and failed[0].permanent,
+        )
+        check("sessions are reused", stub.connections < len(results) / 2, f"{stub.connections} connections")
+        check("every outcome is audited", audited == len(results), f"{audited} rows")
+        stub.shutdown()
+
+        stub = SmtpStub()
+        started = time.monotonic()
+        results, _ = dispatch(_requests(11), stub.session, rate_per_second=20)
+        elapsed = time.monotonic() - started
+        check("the rate limit spaces sends", all(r.ok for r in results) and elapsed >= 0.45, f"{elapsed:.2f}s for 11 at 20/s")
+        stub.shutdown()
+
+        stub = SmtpStub(accept_login=False)
+        results, audited = dispatch(_requests(20), stub.session)
+        check(
+            "a rejected login ends the batch after one attempt",
+            stub.logins == 1 and not any(r.ok for r in results) and audited == len(results),
+            f"{stub.logins} login(s), {audited} rows",
+        )
+        stub.shutdown()
+
+        connects = 0
+        port = _closed_port()
+
+        def refused() -> smtplib.SMTP:
+            nonlocal connects
+            connects += 1
+            return smtplib.SMTP("127.0.0.1", port, timeout=2)
+
+        results, audited = dispatch(_requests(40), refused, retries=3)
+        check(
+            "a refused connection is retried a bounded number of times",
+            connects == 4 and not any(r.ok for r in results) and audited == len(results),
+            f"{connects} connects, {audited} rows",
+        )
+        db.close_connection()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
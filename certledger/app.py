@@ -2,24 +2,42 @@ from __future__ import annotations
 
 import json
 import os
-import secrets
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from PySide6 import QtWidgets
+from PySide6 import QtCore, QtGui, QtWidgets
 
 from .logging_setup import setup_logging
-from .settings_store import load_settings, save_settings
+from .settings_store import changed_fields, load_settings, subscribe, update_settings
 from .paths import ensure_dirs
+from . import backup
+from . import credentials
 from . import db
 from . import emailer
+from . import exporter
+from . import importer
+from . import ledger
+from . import pdfstore
+from . import stats
+from .audit import AuditSink
+from .expiry import ExpiryScheduler
+from .workers import TaskRunner
+from .models import AuditLogModel, CertTableModel
 
 
 class CertLedgerWindow(QtWidgets.QMainWindow):
+    # Emitted from the watcher thread; Qt queues it onto the GUI thread.
+    mailbox_scanned = QtCore.Signal(int, int)
+    certificates_expired = QtCore.Signal(int)
+    # (old, new) Settings; emitted from whichever thread saved them.
+    settings_changed = QtCore.Signal(object, object)
+
     def __init__(self):
         super().__init__()
-        self.logger = setup_logging()
+        self.logger = setup_logging(json_lines=load_settings().log_json)
         ensure_dirs()
         db.init_db()
+        # Audit rows written outside a transaction are group-committed in the background.
+        self.audit_sink = AuditSink(logger=self.logger).install()
 
         self.setWindowTitle("CertLedger")
         self.resize(1100, 700)
@@ -27,56 +45,280 @@ class CertLedgerWindow(QtWidgets.QMainWindow):
         self.stack = QtWidgets.QStackedWidget()
         self.setCentralWidget(self.stack)
 
-        self.home = HomePage(self)
-        self.people = PeoplePage(self)
-        self.certs = CertsPage(self)
-        self.create_person = CreatePersonPage(self)
-        self.create_cert = CreateCertPage(self)
-        self.logs = LogsPage(self)
-        self.settings = SettingsPage(self)
+        # Pages are built on first navigation (see _page); only Home is needed to paint.
+        self._pages: dict[str, QtWidgets.QWidget] = {}
+        self.show_home()
 
-        for w in [self.home, self.certs, self.people, self.create_person, self.create_cert, self.logs, self.settings]:
-            self.stack.addWidget(w)
+        # Background work (mailbox scans, sends); progress shows in the status bar.
+        self.tasks = TaskRunner(self.logger, parent=self)
+        self.status_label = QtWidgets.QLabel("")
+        self.btn_cancel_scan = QtWidgets.QPushButton("Cancel scan")
+        self.btn_cancel_scan.clicked.connect(lambda: self.tasks.cancel("scan"))
+        self.btn_cancel_scan.hide()
+        self.statusBar().addWidget(self.status_label, 1)
+        self.statusBar().addPermanentWidget(self.btn_cancel_scan)
+
+        self.mailbox_scanned.connect(self._on_mailbox_scanned)
+        self.certificates_expired.connect(self._on_certificates_expired)
+        self.settings_changed.connect(self._on_settings_changed)
+        self._unsubscribe_settings = subscribe(self.settings_changed.emit)
+        self.watcher = None
+        self.expiry = None
+        self.checkpoints = None
+        # The startup scan, the mailbox watcher and the expiry scheduler start
+        # once the window has painted (safe: emailer skips if not configured).
+        QtCore.QTimer.singleShot(0, self._start_background)
+
+    def _start_background(self):
+        # Imported here: the watcher pulls in imaplib/ssl, which the first paint does not need.
+        from .watcher import MailboxWatcher
+
+        self.start_mailbox_scan(startup=True)
+
+        # Push-driven signature confirmation while the window is open.
+        self.watcher = MailboxWatcher(self.logger, on_scan=self.mailbox_scanned.emit)
+        self.watcher.start()
+
+        # Marks expired certificates and sends renewal notices (if enabled).
+        self.expiry = ExpiryScheduler(self.logger, on_change=self.certificates_expired.emit)
+        self.expiry.start()
+
+        # Keeps the WAL short between backups and after bulk writes.
+        self.checkpoints = backup.CheckpointScheduler(self.logger)
+        self.checkpoints.start()
+
+    def _page(self, name: str) -> QtWidgets.QWidget:
+        page = self._pages.get(name)
+        if page is None:
+            page = self._pages[name] = _PAGES[name](self)
+            self.stack.addWidget(page)
+        return page
+
+    def _current_page(self, name: str) -> QtWidgets.QWidget | None:
+        # The named page if it exists and is on screen.
+        page = self._pages.get(name)
+        return page if page is not None and self.stack.currentWidget() is page else None
+
+    def closeEvent(self, event):
+        self.statusBar().showMessage("Shutting down...")
+        self._unsubscribe_settings()
+        self.tasks.shutdown()
+        for thread in (self.watcher, self.expiry, self.checkpoints):
+            if thread is not None:
+                thread.stop(timeout=5)
+        self.audit_sink.close()
+        super().closeEvent(event)
+
+    def _on_mailbox_scanned(self, matched: int, processed: int):
+        self.statusBar().showMessage(f"Mailbox: processed {processed} emails, matched {matched}.", 10000)
+        page = self._current_page("certs") or self._current_page("home")
+        if matched and page is not None:
+            page.refresh()
+
+    def _on_certificates_expired(self, count: int):
+        self.statusBar().showMessage(f"{count} certificate(s) expired.", 10000)
+        page = self._current_page("certs") or self._current_page("home")
+        if page is not None:
+            page.refresh()
+
+    def _on_settings_changed(self, old, new):
+        # Pages read settings when shown; only an open Settings page needs
+        # refreshing, and not for the IMAP checkpoint the scans keep moving.
+        page = self._current_page("settings")
+        if page is not None and changed_fields(old, new) - {"last_imap_uid"}:
+            page.load_into_form()
+
+    def start_mailbox_scan(self, startup: bool = False):
+        # At most one scan in flight; a second click just reports it.
+        if self.tasks.is_running("scan"):
+            self.statusBar().showMessage("A mailbox scan is already running.", 5000)
+            return
 
-        self.show_home()
+        def run(task):
+            return emailer.scan_inbox_and_apply_signatures(
+                self.logger,
+                progress=lambda done, total: task.report(f"Scanning mailbox... {done}/{total}"),
+                should_stop=lambda: task.cancelled,
+            )
 
-        # Startup mailbox scan (safe: emailer should skip if not configured)
-        try:
-            matched, processed = emailer.scan_inbox_and_apply_signatures(self.logger)
-            if processed:
+        def done(result):
+            self._scan_finished()
+            matched, processed = result
+            self._on_mailbox_scanned(matched, processed)
+            if processed or not startup:
                 QtWidgets.QMessageBox.information(
                     self, "Mailbox scan", f"Processed {processed} emails, matched {matched}."
                 )
-        except Exception as e:
-            self.logger.exception("Startup mailbox scan failed.")
-            QtWidgets.QMessageBox.warning(self, "Mailbox scan failed", str(e))
+
+        def failed(message):
+            self._scan_finished()
+            QtWidgets.QMessageBox.warning(self, "Mailbox scan failed", message)
+
+        self.status_label.setText("Scanning mailbox...")
+        self.btn_cancel_scan.show()
+        self.tasks.submit(run, on_done=done, on_error=failed, on_progress=self.status_label.setText, key="scan")
+
+    def _scan_finished(self):
+        self.status_label.setText("")
+        self.btn_cancel_scan.hide()
+
+    def run_bulk_import(self, title: str, import_fn, on_imported):
+        # import_fn is importer.import_certificates or importer.import_people.
+        # Validates the whole file first (dry run), then confirms and imports;
+        # both passes stream the file on a background thread.
+        if self.tasks.is_running("import"):
+            QtWidgets.QMessageBox.information(self, title, "An import is already running.")
+            return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, title, "", "CSV / JSON lines (*.csv *.jsonl *.ndjson);;All files (*)"
+        )
+        if not path:
+            return
+        source = os.path.basename(path)
+        status = self.statusBar()
+
+        def job(dry_run: bool):
+            return lambda task: import_fn(
+                importer.read_records(path),
+                dry_run=dry_run,
+                source=source,
+                progress=lambda n: task.report(f"{'Checking' if dry_run else 'Importing'} {source}... {n} rows"),
+                should_stop=lambda: task.cancelled,
+            )
+
+        def error_text(report) -> str:
+            lines = [f"Line {e.line}: {e.message}" for e in report.errors[:10]]
+            if len(report.errors) > 10:
+                lines.append(f"... and {len(report.errors) - 10} more")
+            return "\n".join(lines)
+
+        def checked(report):
+            status.clearMessage()
+            if not report.imported:
+                QtWidgets.QMessageBox.warning(self, title, f"{report.summary()}\n\n{error_text(report)}")
+                return
+            reply = QtWidgets.QMessageBox.question(
+                self, title,
+                f"{report.summary()}\n\n{error_text(report)}\n\nImport {report.imported} rows now?",
+                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+            )
+            if reply == QtWidgets.QMessageBox.Yes:
+                self.tasks.submit(job(False), on_done=imported, on_error=failed, on_progress=status.showMessage, key="import")
+
+        def imported(report):
+            status.clearMessage()
+            text = report.summary()
+            if report.errors:
+                report_path = ensure_dirs()["logs"] / datetime.now().strftime("import_errors_%Y-%m-%d_%H%M%S.csv")
+                importer.write_error_report(report.errors, report_path)
+                text += f"\n\nError report: {report_path}"
+            QtWidgets.QMessageBox.information(self, title, text)
+            on_imported()
+
+        def failed(message):
+            status.clearMessage()
+            QtWidgets.QMessageBox.critical(self, f"{title} failed", message)
+
+        self.tasks.submit(job(True), on_done=checked, on_error=failed, on_progress=status.showMessage, key="import")
+
+    def run_export(self, title: str, dataset: str, filters: dict):
+        # Streams the dataset on a background thread; the file type follows the
+        # chosen name (.csv, .jsonl, .parquet, optionally .gz).
+        if self.tasks.is_running("export"):
+            QtWidgets.QMessageBox.information(self, title, "An export is already running.")
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, title, f"{dataset}.csv",
+            "CSV (*.csv);;Compressed CSV (*.csv.gz);;JSON lines (*.jsonl);;Compressed JSON lines (*.jsonl.gz);;Parquet (*.parquet)",
+        )
+        if not path:
+            return
+        status = self.statusBar()
+
+        def run(task):
+            return exporter.export(
+                dataset, path,
+                progress=lambda n: task.report(f"Exporting {dataset}... {n} rows"),
+                should_stop=lambda: task.cancelled,
+                **filters,
+            )
+
+        def done(count):
+            status.showMessage(f"Exported {count} {dataset} rows to {path}", 10000)
+
+        def failed(message):
+            status.clearMessage()
+            QtWidgets.QMessageBox.critical(self, f"{title} failed", message)
+
+        self.tasks.submit(run, on_done=done, on_error=failed, on_progress=status.showMessage, key="export")
+
+    def run_backup(self):
+        # Online backup on a background thread; the app stays usable meanwhile.
+        title = "Back up database"
+        if self.tasks.is_running("backup"):
+            QtWidgets.QMessageBox.information(self, title, "A backup is already running.")
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, title, str(backup.default_backup_path()),
+            "SQLite database (*.sqlite3);;Compressed (*.sqlite3.gz)",
+        )
+        if not path:
+            return
+        status = self.statusBar()
+
+        def run(task):
+            return backup.backup(
+                path,
+                progress=lambda done, total: task.report(f"Backing up... {done * 100 // max(total, 1)}%"),
+                should_stop=lambda: task.cancelled,
+            )
+
+        def done(info):
+            status.clearMessage()
+            QtWidgets.QMessageBox.information(
+                self, title, f"Backup written and verified:\n{info.path}\n({info.size:,} bytes, {info.seconds:.1f}s)"
+            )
+
+        def failed(message):
+            status.clearMessage()
+            QtWidgets.QMessageBox.critical(self, f"{title} failed", message)
+
+        self.tasks.submit(run, on_done=done, on_error=failed, on_progress=status.showMessage, key="backup")
 
     def show_home(self):
-        self.stack.setCurrentWidget(self.home)
+        page = self._page("home")
+        page.refresh()
+        self.stack.setCurrentWidget(page)
 
     def show_people(self):
-        self.people.refresh()
-        self.stack.setCurrentWidget(self.people)
+        page = self._page("people")
+        page.refresh()
+        self.stack.setCurrentWidget(page)
 
     def show_certs(self):
-        self.certs.refresh()
-        self.stack.setCurrentWidget(self.certs)
+        page = self._page("certs")
+        page.refresh()
+        self.stack.setCurrentWidget(page)
 
     def show_create_person(self):
-        self.create_person.reset_form()
-        self.stack.setCurrentWidget(self.create_person)
+        page = self._page("create_person")
+        page.reset_form()
+        self.stack.setCurrentWidget(page)
 
     def show_create_cert(self):
-        self.create_cert.reset_form()
-        self.stack.setCurrentWidget(self.create_cert)
+        page = self._page("create_cert")
+        page.reset_form()
+        self.stack.setCurrentWidget(page)
 
     def show_logs(self):
-        self.logs.refresh()
-        self.stack.setCurrentWidget(self.logs)
+        page = self._page("logs")
+        page.refresh()
+        self.stack.setCurrentWidget(page)
 
     def show_settings(self):
-        self.settings.load_into_form()
-        self.stack.setCurrentWidget(self.settings)
+        page = self._page("settings")
+        page.load_into_form()
+        self.stack.setCurrentWidget(page)
 
 
 class HomePage(QtWidgets.QWidget):
@@ -85,6 +327,24 @@ class HomePage(QtWidgets.QWidget):
         self.main = main
         layout = QtWidgets.QVBoxLayout(self)
 
+        # Counts come from trigger-maintained counters, so refreshing is cheap.
+        overview = QtWidgets.QGroupBox("Overview")
+        form = QtWidgets.QFormLayout(overview)
+        self.lbl_total = QtWidgets.QLabel()
+        self.lbl_pending = QtWidgets.QLabel()
+        self.lbl_expiring = QtWidgets.QLabel()
+        self.lbl_unmatched = QtWidgets.QLabel()
+        self.lbl_by_status = QtWidgets.QLabel()
+        self.lbl_by_type = QtWidgets.QLabel()
+        self.lbl_by_type.setWordWrap(True)
+        form.addRow("Certificates", self.lbl_total)
+        form.addRow("Awaiting signature", self.lbl_pending)
+        form.addRow("Expiring this month", self.lbl_expiring)
+        form.addRow("Unmatched emails", self.lbl_unmatched)
+        form.addRow("By status", self.lbl_by_status)
+        form.addRow("By type", self.lbl_by_type)
+        layout.addWidget(overview)
+
         btn_certs = QtWidgets.QPushButton("Existing certificates")
         btn_people = QtWidgets.QPushButton("Person list")
         btn_new_cert = QtWidgets.QPushButton("Create certificate")
@@ -105,8 +365,24 @@ class HomePage(QtWidgets.QWidget):
 
         layout.addStretch(1)
 
+    def refresh(self):
+        d = stats.dashboard()
+
+        def breakdown(counts: dict[str, int]) -> str:
+            return ", ".join(f"{k} {v:,}" for k, v in sorted(counts.items())) or "-"
+
+        self.lbl_total.setText(f"{d.total:,}")
+        self.lbl_pending.setText(f"{d.pending_signatures:,}")
+        self.lbl_expiring.setText(f"{d.expiring_this_month:,}")
+        self.lbl_unmatched.setText(f"{d.unmatched_evidence:,}")
+        self.lbl_by_status.setText(breakdown(d.by_status))
+        self.lbl_by_type.setText(breakdown(d.by_type))
+
 
 class PeoplePage(QtWidgets.QWidget):
+    SEARCH_DEBOUNCE_MS = 200
+    SEARCH_LIMIT = 200
+
     def __init__(self, main: CertLedgerWindow):
         super().__init__()
         self.main = main
@@ -115,16 +391,28 @@ class PeoplePage(QtWidgets.QWidget):
         top = QtWidgets.QHBoxLayout()
         self.search = QtWidgets.QLineEdit()
         self.search.setPlaceholderText("Search name / gov id / person id / nationality")
-        self.search.textChanged.connect(self.refresh)
+
+        # Query once typing pauses rather than on every keystroke.
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self.refresh)
+        self.search.textChanged.connect(lambda _: self._search_timer.start())
 
         btn_edit = QtWidgets.QPushButton("Edit selected")
         btn_edit.clicked.connect(self.edit_selected)
 
+        btn_import = QtWidgets.QPushButton("Bulk import...")
+        btn_import.clicked.connect(
+            lambda: main.run_bulk_import("Bulk import people", importer.import_people, self.refresh)
+        )
+
         btn_back = QtWidgets.QPushButton("Back")
         btn_back.clicked.connect(main.show_home)
 
         top.addWidget(self.search)
         top.addWidget(btn_edit)
+        top.addWidget(btn_import)
         top.addWidget(btn_back)
         layout.addLayout(top)
 
@@ -136,18 +424,14 @@ class PeoplePage(QtWidgets.QWidget):
         layout.addWidget(self.table)
 
     def refresh(self):
-        q = self.search.text().strip().lower()
-        con = db.connect()
-        rows = con.execute("SELECT * FROM people ORDER BY person_id DESC").fetchall()
-        con.close()
+        self._search_timer.stop()
+        rows = db.search_people(self.search.text(), limit=self.SEARCH_LIMIT)
 
         filtered = []
         for r in rows:
             display = (r["call_name"] or r["official_name"]).strip()
             nat = (r["nationality"] or "").strip()
-            hay = f"{display} {r['official_name']} {r['gov_id_number']} {r['person_id']} {nat}".lower()
-            if not q or q in hay:
-                filtered.append((display, r["gov_id_number"], r["person_id"], nat))
+            filtered.append((display, r["gov_id_number"], r["person_id"], nat))
 
         self.table.setRowCount(len(filtered))
         for i, (d, gov, pid, nat) in enumerate(filtered):
@@ -194,87 +478,107 @@ class CertsPage(QtWidgets.QWidget):
         btn_check = QtWidgets.QPushButton("Check mailbox now")
         btn_check.clicked.connect(self.check_mailbox_now)
 
+        btn_import = QtWidgets.QPushButton("Bulk import...")
+        btn_import.clicked.connect(self.bulk_import)
+
         top.addWidget(btn_back)
         top.addStretch(1)
+        btn_export = QtWidgets.QPushButton("Export...")
+        btn_export.clicked.connect(lambda: main.run_export("Export certificates", "certificates", {}))
+
+        top.addWidget(btn_import)
+        top.addWidget(btn_export)
         top.addWidget(btn_check)
         layout.addLayout(top)
 
-        self.table = QtWidgets.QTableWidget(0, 8)
-        self.table.setHorizontalHeaderLabels([
-            "Cert #", "Type", "Receiver", "Giver", "Issued", "Valid until", "Valid?", "Status"
-        ])
+        self.model = CertTableModel(self)
+        self.table = QtWidgets.QTableView()
+        self.table.setModel(self.model)
         self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        # Sorting is done in SQL by the model; keep the default newest-first order.
+        self.table.horizontalHeader().setSortIndicator(0, QtCore.Qt.DescendingOrder)
+        self.table.setSortingEnabled(True)
         layout.addWidget(self.table)
 
         bottom = QtWidgets.QHBoxLayout()
 
+        self.btn_import_pdf = QtWidgets.QPushButton("Import PDF")
+        self.btn_import_pdf.clicked.connect(self.import_pdf)
+
         self.btn_open_pdf = QtWidgets.QPushButton("Open PDF")
         self.btn_open_pdf.clicked.connect(self.open_pdf)
 
+        self.btn_verify_pdfs = QtWidgets.QPushButton("Verify PDFs")
+        self.btn_verify_pdfs.clicked.connect(self.verify_pdfs)
+
         self.btn_manual_sign = QtWidgets.QPushButton("Mark as signed (manual)")
         self.btn_manual_sign.clicked.connect(self.manual_sign)
 
+        bottom.addWidget(self.btn_import_pdf)
         bottom.addWidget(self.btn_open_pdf)
         bottom.addWidget(self.btn_manual_sign)
         bottom.addStretch(1)
+        bottom.addWidget(self.btn_verify_pdfs)
         layout.addLayout(bottom)
 
     def refresh(self):
-        con = db.connect()
-        rows = con.execute("""
-        SELECT c.*,
-               pr.official_name AS r_off, pr.call_name AS r_call,
-               pg.official_name AS g_off, pg.call_name AS g_call
-          FROM certificates c
-          JOIN people pr ON pr.person_id = c.receiver_person_id
-          JOIN people pg ON pg.person_id = c.giver_person_id
-         ORDER BY c.cert_number DESC
-        """).fetchall()
-        con.close()
-
-        now = datetime.utcnow()
-        self.table.setRowCount(len(rows))
-        for i, r in enumerate(rows):
-            receiver = (r["r_call"] or r["r_off"]).strip()
-            giver = (r["g_call"] or r["g_off"]).strip()
-            issued = r["issued_at"]
-            valid_until = r["valid_until"]
-
-            try:
-                vu = datetime.fromisoformat(valid_until.replace("Z", ""))
-                valid = now <= vu
-            except Exception:
-                valid = False
-
-            self.table.setItem(i, 0, QtWidgets.QTableWidgetItem(r["cert_number"]))
-            self.table.setItem(i, 1, QtWidgets.QTableWidgetItem(r["cert_type"]))
-            self.table.setItem(i, 2, QtWidgets.QTableWidgetItem(receiver))
-            self.table.setItem(i, 3, QtWidgets.QTableWidgetItem(giver))
-            self.table.setItem(i, 4, QtWidgets.QTableWidgetItem(issued))
-            self.table.setItem(i, 5, QtWidgets.QTableWidgetItem(valid_until))
-            self.table.setItem(i, 6, QtWidgets.QTableWidgetItem("VALID" if valid else "EXPIRED"))
-            self.table.setItem(i, 7, QtWidgets.QTableWidgetItem(r["status"]))
-
+        self.model.refresh()
         self.table.resizeColumnsToContents()
 
     def selected_cert_number(self) -> str | None:
         sel = self.table.selectionModel().selectedRows()
         if not sel:
             return None
-        row = sel[0].row()
-        return self.table.item(row, 0).text()
+        return self.model.cert_number_at(sel[0].row())
 
     def open_pdf(self):
         cert = self.selected_cert_number()
         if not cert:
             QtWidgets.QMessageBox.warning(self, "No selection", "Select a certificate first.")
             return
-        pdf_path = ensure_dirs()["pdfs"] / f"{cert}.pdf"
-        if not pdf_path.exists():
-            QtWidgets.QMessageBox.warning(self, "No PDF", f"Missing: {pdf_path}")
+        pdf_path = pdfstore.pdf_path(cert)
+        if pdf_path is None:
+            QtWidgets.QMessageBox.warning(self, "No PDF", f"No PDF imported for {cert}.")
             return
-        os.startfile(str(pdf_path))  # Windows only
+        QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(str(pdf_path)))
+
+    def import_pdf(self):
+        cert = self.selected_cert_number()
+        if not cert:
+            QtWidgets.QMessageBox.warning(self, "No selection", "Select a certificate first.")
+            return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, f"PDF for {cert}", "", "PDF files (*.pdf)")
+        if not path:
+            return
+        try:
+            info = pdfstore.attach_pdf(cert, path)
+            QtWidgets.QMessageBox.information(self, "PDF imported", f"{cert}: {info.size} bytes, SHA-256 {info.sha256}")
+        except Exception as e:
+            self.main.logger.exception("PDF import failed.")
+            db.log_audit("ATTACH_PDF", "CERT", cert, "ERROR", str(e))
+            QtWidgets.QMessageBox.critical(self, "Error", str(e))
+
+    def verify_pdfs(self):
+        status = self.main.statusBar()
+
+        def done(report):
+            status.clearMessage()
+            db.log_audit("VERIFY_PDFS", "FILE", "pdfs", "OK" if report.ok else "ERROR", report.summary())
+            lines = [f"Missing: {c}" for c in report.missing[:20]] + [f"Mismatched: {c}" for c in report.mismatched[:20]]
+            box = QtWidgets.QMessageBox.information if report.ok else QtWidgets.QMessageBox.warning
+            box(self, "Verify PDFs", "\n".join([report.summary(), *lines]))
+
+        def failed(message):
+            status.clearMessage()
+            QtWidgets.QMessageBox.critical(self, "Verify PDFs failed", message)
+
+        task = self.main.tasks.submit(
+            lambda task: pdfstore.verify_store(progress=lambda n, total: task.report(f"Verifying PDFs... {n}/{total}")),
+            on_done=done, on_error=failed, on_progress=status.showMessage, key="verify_pdfs",
+        )
+        if task is None:
+            status.showMessage("PDF verification is already running.", 5000)
 
     def manual_sign(self):
         cert = self.selected_cert_number()
@@ -292,13 +596,11 @@ class CertsPage(QtWidgets.QWidget):
             return
 
         try:
-            con = db.connect()
-            con.execute(
-                "UPDATE certificates SET status='SIGNED', signed_at=? WHERE cert_number=?",
-                (db.now_iso(), cert),
-            )
-            con.commit()
-            con.close()
+            with db.transaction() as con:
+                con.execute(
+                    "UPDATE certificates SET status='SIGNED', signed_at=? WHERE cert_number=?",
+                    (db.now_iso(), cert),
+                )
 
             db.log_audit("MANUAL_SIGN", "CERT", cert, "OK", "Certificate manually marked as signed.")
             QtWidgets.QMessageBox.information(self, "Done", f"{cert} marked as SIGNED.")
@@ -309,13 +611,10 @@ class CertsPage(QtWidgets.QWidget):
             QtWidgets.QMessageBox.critical(self, "Error", str(e))
 
     def check_mailbox_now(self):
-        try:
-            matched, processed = emailer.scan_inbox_and_apply_signatures(self.main.logger)
-            QtWidgets.QMessageBox.information(self, "Mailbox scan", f"Processed {processed} emails, matched {matched}.")
-            self.refresh()
-        except Exception as e:
-            self.main.logger.exception("Mailbox scan failed.")
-            QtWidgets.QMessageBox.warning(self, "Mailbox scan failed", str(e))
+        self.main.start_mailbox_scan()
+
+    def bulk_import(self):
+        self.main.run_bulk_import("Bulk import certificates", importer.import_certificates, self.refresh)
 
 
 class LogsPage(QtWidgets.QWidget):
@@ -327,32 +626,73 @@ class LogsPage(QtWidgets.QWidget):
         top = QtWidgets.QHBoxLayout()
         btn_back = QtWidgets.QPushButton("Back")
         btn_back.clicked.connect(main.show_home)
+        btn_export = QtWidgets.QPushButton("Export...")
+        btn_export.clicked.connect(lambda: main.run_export("Export audit log", "audit", self._filters()))
         top.addWidget(btn_back)
         top.addStretch(1)
+        top.addWidget(btn_export)
         layout.addLayout(top)
 
-        self.table = QtWidgets.QTableWidget(0, 5)
-        self.table.setHorizontalHeaderLabels(["Timestamp", "Action", "Entity", "Result", "Message"])
+        filters = QtWidgets.QHBoxLayout()
+        self.f_action = QtWidgets.QLineEdit()
+        self.f_action.setPlaceholderText("Action (e.g. CONFIRM_SIGN)")
+        self.f_entity_type = QtWidgets.QComboBox()
+        self.f_entity_type.addItems(["", "CERT", "PERSON", "SETTINGS", "FILE"])
+        self.f_entity_id = QtWidgets.QLineEdit()
+        self.f_entity_id.setPlaceholderText("Entity id (e.g. C-2025-000001)")
+        self.f_result = QtWidgets.QComboBox()
+        self.f_result.addItems(["", "OK", "ERROR", "PARTIAL"])
+        self.f_since = QtWidgets.QLineEdit()
+        self.f_since.setPlaceholderText("From (YYYY-MM-DD)")
+        self.f_until = QtWidgets.QLineEdit()
+        self.f_until.setPlaceholderText("Before (YYYY-MM-DD)")
+        btn_apply = QtWidgets.QPushButton("Filter")
+        btn_apply.clicked.connect(self.refresh)
+
+        for w in [self.f_action, self.f_entity_id, self.f_since, self.f_until]:
+            w.returnPressed.connect(self.refresh)
+        for label, w in [
+            ("Action", self.f_action),
+            ("Entity", self.f_entity_type),
+            ("", self.f_entity_id),
+            ("Result", self.f_result),
+            ("Time", self.f_since),
+            ("", self.f_until),
+        ]:
+            if label:
+                filters.addWidget(QtWidgets.QLabel(label))
+            filters.addWidget(w)
+        filters.addWidget(btn_apply)
+        layout.addLayout(filters)
+
+        self.model = AuditLogModel(self)
+        self.table = QtWidgets.QTableView()
+        self.table.setModel(self.model)
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         layout.addWidget(self.table)
 
-    def refresh(self):
-        con = db.connect()
-        rows = con.execute(
-            "SELECT ts, action, entity_type, entity_id, result, message "
-            "FROM audit_log ORDER BY ts DESC LIMIT 2000"
-        ).fetchall()
-        con.close()
+    def _filters(self) -> dict:
+        return {
+            "action": self.f_action.text().strip().upper(),
+            "entity_type": self.f_entity_type.currentText(),
+            "entity_id": self.f_entity_id.text().strip(),
+            "result": self.f_result.currentText(),
+            "since": self.f_since.text().strip(),
+            "until": self.f_until.text().strip(),
+        }
 
-        self.table.setRowCount(len(rows))
-        for i, r in enumerate(rows):
-            self.table.setItem(i, 0, QtWidgets.QTableWidgetItem(r["ts"]))
-            self.table.setItem(i, 1, QtWidgets.QTableWidgetItem(r["action"]))
-            self.table.setItem(i, 2, QtWidgets.QTableWidgetItem(f"{r['entity_type']} {r['entity_id']}"))
-            self.table.setItem(i, 3, QtWidgets.QTableWidgetItem(r["result"]))
-            self.table.setItem(i, 4, QtWidgets.QTableWidgetItem(r["message"]))
+    def refresh(self):
+        # Rows still queued in the audit sink are flushed on a worker thread
+        # first (the sink may be busy for a while), then the first page loads.
+        # While a flush is in flight, its reload picks up the current filters.
+        self.main.tasks.submit(
+            lambda task: db.flush_audit(timeout=2),
+            on_done=lambda _: self._load(), on_error=lambda _: self._load(), key="flush_audit",
+        )
 
+    def _load(self):
+        self.model.set_filters(**self._filters())
         self.table.resizeColumnsToContents()
 
 
@@ -396,6 +736,13 @@ class CreatePersonPage(QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(self, "Missing fields", "Gov ID, DOB, and Official name are required.")
             return
 
+        existing = db.find_person_by_gov_id(self.gov.text().strip())
+        if existing:
+            QtWidgets.QMessageBox.warning(
+                self, "Duplicate Gov ID", f"{existing['person_id']} already has this Gov ID number."
+            )
+            return
+
         pid = db.next_person_id()
         now = db.now_iso()
         person = {
@@ -472,11 +819,10 @@ class CreateCertPage(QtWidgets.QWidget):
         self._load_people()
 
     def _load_people(self):
-        con = db.connect()
+        con = db.get_connection()
         rows = con.execute(
             "SELECT person_id, official_name, call_name, gov_id_number FROM people ORDER BY person_id DESC"
         ).fetchall()
-        con.close()
 
         self.receiver.clear()
         self.giver.clear()
@@ -488,30 +834,17 @@ class CreateCertPage(QtWidgets.QWidget):
             self.giver.addItem(label, r["person_id"])
 
     def _create_cert(self) -> str:
-        if not self.cert_type.text().strip():
-            raise RuntimeError("Certificate type is required.")
         if self.receiver.count() == 0:
             raise RuntimeError("No people exist yet. Create people first.")
 
-        year = datetime.utcnow().year
-        cert_number = db.next_cert_number(year)
-        issued = db.now_iso()
-        valid_until = (datetime.utcnow() + timedelta(days=int(self.valid_days.value()))).isoformat(timespec="seconds") + "Z"
-
-        cert = {
-            "cert_number": cert_number,
-            "cert_type": self.cert_type.text().strip(),
-            "issued_at": issued,
-            "receiver_person_id": self.receiver.currentData(),
-            "giver_person_id": self.giver.currentData(),
-            "receiver_name_used": self.receiver_name_used.currentText(),
-            "giver_name_used": self.giver_name_used.currentText(),
-            "valid_until": valid_until,
-            "status": "ISSUED",
-            "pdf_relpath": None,
-        }
-        db.create_certificate(cert)
-        db.log_audit("CREATE_CERT", "CERT", cert_number, "OK", "Certificate created.")
+        cert_number = ledger.issue_certificate(
+            cert_type=self.cert_type.text(),
+            receiver_person_id=self.receiver.currentData(),
+            giver_person_id=self.giver.currentData(),
+            valid_days=int(self.valid_days.value()),
+            receiver_name_used=self.receiver_name_used.currentText(),
+            giver_name_used=self.giver_name_used.currentText(),
+        )
         self.last_created_cert = cert_number
         return cert_number
 
@@ -530,54 +863,38 @@ class CreateCertPage(QtWidgets.QWidget):
     def create_and_request_signature(self):
         try:
             cert = self._create_cert()
-            self._request_signature_for(cert)
-            QtWidgets.QMessageBox.information(
-                self, "Request sent",
-                f"Created {cert} and sent signature request email."
-            )
-            self.main.show_certs()
+            to_email, sign_code, summary = ledger.prepare_signature_request(cert)
         except Exception as e:
             self.main.logger.exception("Create+request failed.")
             QtWidgets.QMessageBox.critical(self, "Error", str(e))
+            return
 
-    def _request_signature_for(self, cert_number: str):
-        sign_code = "S-" + secrets.token_hex(4).upper()
-
-        con = db.connect()
-        cert = con.execute("SELECT * FROM certificates WHERE cert_number=?", (cert_number,)).fetchone()
-        recv = con.execute("SELECT * FROM people WHERE person_id=?", (cert["receiver_person_id"],)).fetchone()
-        give = con.execute("SELECT * FROM people WHERE person_id=?", (cert["giver_person_id"],)).fetchone()
-        con.close()
-
-        if not recv["email"]:
-            raise RuntimeError("Receiver has no email set. Add it in the person profile.")
-
-        summary = (
-            f"Cert: {cert_number}\n"
-            f"Type: {cert['cert_type']}\n"
-            f"Issued: {cert['issued_at']}\n"
-            f"Valid until: {cert['valid_until']}\n"
-            f"Receiver: {(recv['call_name'] or recv['official_name'])}\n"
-            f"Giver: {(give['call_name'] or give['official_name'])}\n"
-        )
+        # SMTP runs in the background; the window stays responsive meanwhile.
+        def send(task):
+            emailer.send_signature_request(
+                to_email=to_email,
+                cert_number=cert,
+                sign_code=sign_code,
+                cert_summary=summary,
+            )
+            db.log_audit("SEND_SIGN_EMAIL", "CERT", cert, "OK", f"Sent to {to_email}")
 
-        con = db.connect()
-        con.execute(
-            "UPDATE certificates SET status='SIGN_REQUESTED', sign_code=?, sign_requested_at=? WHERE cert_number=?",
-            (sign_code, db.now_iso(), cert_number),
-        )
-        con.commit()
-        con.close()
-
-        # If your emailer signature doesn't accept logger, remove logger=self.main.logger
-        emailer.send_signature_request(
-            to_email=recv["email"],
-            cert_number=cert_number,
-            sign_code=sign_code,
-            cert_summary=summary,
-        )
-        db.log_audit("SEND_SIGN_EMAIL", "CERT", cert_number, "OK", f"Sent to {recv['email']}")
+        def done(_):
+            self.main.statusBar().clearMessage()
+            QtWidgets.QMessageBox.information(
+                self.main, "Request sent",
+                f"Created {cert} and sent signature request email."
+            )
 
+        def failed(message):
+            self.main.statusBar().clearMessage()
+            QtWidgets.QMessageBox.critical(
+                self.main, "Error", f"Created {cert}, but sending the signature request failed:\n{message}"
+            )
+
+        self.main.statusBar().showMessage(f"Sending signature request for {cert}...")
+        self.main.tasks.submit(send, on_done=done, on_error=failed)
+        self.main.show_certs()
 
 class SettingsPage(QtWidgets.QWidget):
     def __init__(self, main: CertLedgerWindow):
@@ -597,27 +914,35 @@ class SettingsPage(QtWidgets.QWidget):
         self.imap_port = QtWidgets.QSpinBox()
         self.imap_port.setRange(1, 65535)
 
+        self.renewal_notice_days = QtWidgets.QSpinBox()
+        self.renewal_notice_days.setRange(0, 365)
+        self.renewal_notice_days.setSpecialValueText("Off")
+
         layout.addRow("System email (Gmail)", self.system_email)
         layout.addRow(self.require_from_match)
         layout.addRow("SMTP host", self.smtp_host)
         layout.addRow("SMTP port", self.smtp_port)
         layout.addRow("IMAP host", self.imap_host)
         layout.addRow("IMAP port", self.imap_port)
+        layout.addRow("Renewal notice (days before expiry)", self.renewal_notice_days)
 
         btns = QtWidgets.QHBoxLayout()
         btn_save = QtWidgets.QPushButton("Save settings")
         btn_set_pwd = QtWidgets.QPushButton("Set/Change app password")
         btn_test_scan = QtWidgets.QPushButton("Check mailbox now")
+        btn_backup = QtWidgets.QPushButton("Back up database...")
         btn_back = QtWidgets.QPushButton("Back")
 
         btn_save.clicked.connect(self.save_from_form)
         btn_set_pwd.clicked.connect(self.set_password_prompt)
         btn_test_scan.clicked.connect(self.scan_now)
+        btn_backup.clicked.connect(main.run_backup)
         btn_back.clicked.connect(main.show_home)
 
         btns.addWidget(btn_save)
         btns.addWidget(btn_set_pwd)
         btns.addWidget(btn_test_scan)
+        btns.addWidget(btn_backup)
         btns.addWidget(btn_back)
         layout.addRow(btns)
 
@@ -629,16 +954,19 @@ class SettingsPage(QtWidgets.QWidget):
         self.smtp_port.setValue(int(s.smtp_port))
         self.imap_host.setText(s.imap_host)
         self.imap_port.setValue(int(s.imap_port))
+        self.renewal_notice_days.setValue(int(s.renewal_notice_days))
 
     def save_from_form(self):
-        s = load_settings()
-        s.system_email = self.system_email.text().strip()
-        s.require_from_match = bool(self.require_from_match.isChecked())
-        s.smtp_host = self.smtp_host.text().strip()
-        s.smtp_port = int(self.smtp_port.value())
-        s.imap_host = self.imap_host.text().strip()
-        s.imap_port = int(self.imap_port.value())
-        save_settings(s)
+        # Only the form's fields: a scan may advance last_imap_uid meanwhile.
+        update_settings(
+            system_email=self.system_email.text().strip(),
+            require_from_match=bool(self.require_from_match.isChecked()),
+            smtp_host=self.smtp_host.text().strip(),
+            smtp_port=int(self.smtp_port.value()),
+            imap_host=self.imap_host.text().strip(),
+            imap_port=int(self.imap_port.value()),
+            renewal_notice_days=int(self.renewal_notice_days.value()),
+        )
         db.log_audit("UPDATE_SETTINGS", "SETTINGS", "settings.json", "OK", "Settings updated.")
         QtWidgets.QMessageBox.information(self, "Saved", "Settings saved.")
 
@@ -655,17 +983,18 @@ class SettingsPage(QtWidgets.QWidget):
             QtWidgets.QLineEdit.Password,
         )
         if ok and pwd.strip():
-            emailer.set_app_password(email_addr, pwd.strip())
-            db.log_audit("SET_EMAIL_PASSWORD", "SETTINGS", email_addr, "OK", "Stored app password in keyring.")
-            QtWidgets.QMessageBox.information(self, "Stored", "App password stored in Windows Credential Manager.")
+            try:
+                emailer.set_app_password(email_addr, pwd.strip())
+            except Exception as e:
+                self.main.logger.exception("Storing app password failed.")
+                QtWidgets.QMessageBox.critical(self, "Error", str(e))
+                return
+            where = credentials.backend_name()
+            db.log_audit("SET_EMAIL_PASSWORD", "SETTINGS", email_addr, "OK", f"Stored app password in {where}.")
+            QtWidgets.QMessageBox.information(self, "Stored", f"App password stored in {where}.")
 
     def scan_now(self):
-        try:
-            matched, processed = emailer.scan_inbox_and_apply_signatures(self.main.logger)
-            QtWidgets.QMessageBox.information(self, "Mailbox scan", f"Processed {processed} emails, matched {matched}.")
-        except Exception as e:
-            self.main.logger.exception("Mailbox scan failed.")
-            QtWidgets.QMessageBox.warning(self, "Mailbox scan failed", str(e))
+        self.main.start_mailbox_scan()
 
 
 class EditPersonDialog(QtWidgets.QDialog):
@@ -706,9 +1035,8 @@ class EditPersonDialog(QtWidgets.QDialog):
         self._load()
 
     def _load(self):
-        con = db.connect()
+        con = db.get_connection()
         row = con.execute("SELECT * FROM people WHERE person_id=?", (self.person_id,)).fetchone()
-        con.close()
         if not row:
             QtWidgets.QMessageBox.critical(self, "Error", "Person not found.")
             self.reject()
@@ -728,6 +1056,13 @@ class EditPersonDialog(QtWidgets.QDialog):
             QtWidgets.QMessageBox.warning(self, "Missing fields", "Gov ID, DOB, and Official name are required.")
             return
 
+        existing = db.find_person_by_gov_id(self.gov.text().strip())
+        if existing and existing["person_id"] != self.person_id:
+            QtWidgets.QMessageBox.warning(
+                self, "Duplicate Gov ID", f"{existing['person_id']} already has this Gov ID number."
+            )
+            return
+
         now = db.now_iso()
         after = {
             "person_id": self.person_id,
@@ -758,3 +1093,15 @@ class EditPersonDialog(QtWidgets.QDialog):
             self.main.logger.exception("Edit person failed.")
             db.log_audit("EDIT_PERSON", "PERSON", self.person_id, "ERROR", str(e))
             QtWidgets.QMessageBox.critical(self, "Error", str(e))
+
+
+# Page name -> class, for CertLedgerWindow._page.
+_PAGES = {
+    "home": HomePage,
+    "people": PeoplePage,
+    "certs": CertsPage,
+    "create_person": CreatePersonPage,
+    "create_cert": CreateCertPage,
+    "logs": LogsPage,
+    "settings": SettingsPage,
+}
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import atexit
+import queue
+import threading
+import time
+from typing import Optional
+
+from . import db
+
+
+class _Barrier:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class AuditSink:
+    # Buffers audit rows and writes them from a background thread in group-
+    # committed batches: a batch is written once batch_size rows are queued or
+    # max_latency seconds after its first row, whichever comes first.
+    # flush() is the durability barrier: it returns once every row submitted
+    # before the call has been committed.
+    def __init__(self, batch_size: int = 500, max_latency: float = 0.25, logger=None, retries: int = 3):
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.logger = logger
+        self.retries = retries
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def install(self) -> "AuditSink":
+        # Start the writer and route db.log_audit() through it.
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="AuditSink", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        db.set_audit_sink(self)
+        return self
+
+    def submit(self, row: tuple) -> None:
+        self._queue.put(row)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        barrier = _Barrier()
+        self._queue.put(barrier)
+        return barrier.done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        # Drain everything queued so far, then stop the writer.
+        if db.get_audit_sink() is self:
+            db.set_audit_sink(None)
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        atexit.unregister(self.close)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch: list[tuple] = []
+            barriers: list[_Barrier] = []
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, _Barrier):
+                    barriers.append(item)
+                else:
+                    batch.append(item)
+                # Barriers and shutdown write immediately; otherwise wait for a
+                # full batch or the latency deadline.
+                if stopping or barriers or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for barrier in barriers:
+                barrier.done.set()
+        db.close_connection()
+
+    def _write(self, batch: list[tuple]) -> None:
+        if not batch:
+            return
+        for attempt in range(1, self.retries + 1):
+            try:
+                db.log_audit_many(batch)
+                return
+            except Exception:
+                if attempt == self.retries:
+                    if self.logger:
+                        self.logger.exception(f"Audit sink dropped {len(batch)} rows: {batch!r}")
+                    return
+                time.sleep(0.1 * 2 ** attempt)
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import db
+
+# Online backups of the ledger while it is in use. The copy runs from one
+# read transaction, so it is a consistent snapshot, and WAL mode lets writers
+# carry on meanwhile; it copies BACKUP_PAGES pages per step, releasing the
+# GIL, so the GUI stays responsive even for multi-GB files.
+BACKUP_DIR = "backups"
+BACKUP_PAGES = 1024
+COPY_CHUNK = 1024 * 1024
+# A passive checkpoint every CHECKPOINT_INTERVAL seconds; once the WAL grows
+# past WAL_TRUNCATE_BYTES a truncating one is tried too, but only while no
+# backup runs and without ever waiting for readers (see checkpoint()).
+CHECKPOINT_INTERVAL = 5 * 60
+WAL_TRUNCATE_BYTES = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class BackupInfo:
+    path: Path
+    size: int
+    seconds: float
+
+
+def backups_dir() -> Path:
+    # Next to the database (data/backups for the default one).
+    path = db.database_file().parent / BACKUP_DIR
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def default_backup_path(compress: bool = False, prefix: str = "certs") -> Path:
+    name = datetime.now().strftime(f"{prefix}_%Y-%m-%d_%H%M%S.sqlite3")
+    return backups_dir() / (name + ".gz" if compress else name)
+
+
+def _gzip_into(src: Path, dest: Path) -> None:
+    with open(src, "rb") as inp, gzip.open(dest, "wb", compresslevel=6) as out:
+        shutil.copyfileobj(inp, out, COPY_CHUNK)
+
+
+def _finish(tmp: Path, dest: Path, compress: bool) -> None:
+    # Moves the finished snapshot into place (gzipped if asked), so dest
+    # never exists half-written.
+    if not compress:
+        os.replace(tmp, dest)
+        return
+    gz_tmp = tmp.with_suffix(".gz.tmp")
+    try:
+        _gzip_into(tmp, gz_tmp)
+        os.replace(gz_tmp, dest)
+    finally:
+        for leftover in (tmp, gz_tmp):
+            if leftover.exists():
+                leftover.unlink()
+
+
+def _temp_path(dest: Path) -> Path:
+    fd, name = tempfile.mkstemp(dir=dest.parent, prefix=".backup.", suffix=".tmp")
+    os.close(fd)
+    return Path(name)
+
+
+def backup(
+    dest: Optional[str | Path] = None,
+    compress: Optional[bool] = None,
+    pages: int = BACKUP_PAGES,
+    verify: bool = True,
+    progress: Optional[Callable[[int, int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    actor: str = "system",
+) -> BackupInfo:
+    # Copies the live database with the SQLite backup API to dest (default:
+    # backups/certs_<time>.sqlite3 next to the database). compress defaults
+    # to dest ending in .gz.
+    # progress(copied_pages, total_pages) follows every step; should_stop()
+    # returning True abandons the copy. With verify, the snapshot must pass
+    # integrity_check before it is kept.
+    compress = (str(dest).endswith(".gz") if dest else False) if compress is None else compress
+    dest = Path(dest) if dest else default_backup_path(compress)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    started = time.monotonic()
+    tmp = _temp_path(dest)
+
+    src = db.connect()
+    _backup_started()
+    try:
+        # Pin one read snapshot for the whole copy. Without it, every commit
+        # by another connection would restart the backup from page one.
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        out = sqlite3.connect(tmp)
+        try:
+            def step(status, remaining, total):
+                if should_stop and should_stop():
+                    raise RuntimeError("Backup cancelled.")
+                if progress:
+                    progress(total - remaining, total)
+
+            src.backup(out, pages=pages, progress=step)
+            # A backup is one self-contained file, not a WAL database.
+            out.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            out.close()
+        src.rollback()
+
+        if verify:
+            problems = check_database(tmp)
+            if problems:
+                raise RuntimeError(f"Backup failed verification: {problems[0]}")
+        _finish(tmp, dest, compress)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    finally:
+        src.close()
+        _backup_finished()
+
+    info = BackupInfo(dest, dest.stat().st_size, time.monotonic() - started)
+    db.log_audit(
+        "BACKUP", "FILE", str(dest), "OK", f"Backup written ({info.size} bytes in {info.seconds:.1f}s).", actor=actor
+    )
+    return info
+
+
+def compact(dest: Optional[str | Path] = None, actor: str = "system") -> BackupInfo:
+    # VACUUM INTO: a defragmented, minimal-size copy of the live database
+    # (free pages dropped, tables and indexes rewritten in order). It reads one
+    # snapshot like backup(), so writers are not blocked. To shrink the live
+    # file, stop CertLedger and put the compacted copy in its place.
+    dest = Path(dest) if dest else default_backup_path(prefix="certs_compact")
+    if dest.exists():
+        raise RuntimeError(f"{dest} already exists.")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    started = time.monotonic()
+    con = db.connect()
+    try:
+        con.execute("VACUUM INTO ?", (str(dest),))
+    except BaseException:
+        if dest.exists():
+            dest.unlink()
+        raise
+    finally:
+        con.close()
+    info = BackupInfo(dest, dest.stat().st_size, time.monotonic() - started)
+    db.log_audit(
+        "COMPACT", "FILE", str(dest), "OK", f"Compacted copy written ({info.size} bytes in {info.seconds:.1f}s).", actor=actor
+    )
+    return info
+
+
+def check_database(path: str | Path) -> list[str]:
+    # integrity_check and foreign_key_check of an uncompressed database file,
+    # opened read-only; empty when the file is sound.
+    con = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        problems = [r[0] for r in con.execute("PRAGMA integrity_check") if r[0] != "ok"]
+        for table, rowid, parent, _ in con.execute("PRAGMA foreign_key_check"):
+            problems.append(f"{table} row {rowid}: missing {parent} reference")
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        if version > db.SCHEMA_VERSION:
+            problems.append(f"schema version {version} is newer than this build ({db.SCHEMA_VERSION})")
+        return problems
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    finally:
+        con.close()
+
+
+def verify_backup(path: str | Path) -> list[str]:
+    # Restore check: what restoring this backup would give, checked as above.
+    # .gz backups are decompressed to a temporary file first.
+    path = Path(path)
+    if not path.is_file():
+        raise RuntimeError(f"{path} does not exist.")
+    if path.suffix != ".gz":
+        return check_database(path)
+    with tempfile.TemporaryDirectory() as tmp:
+        restored = Path(tmp) / path.stem
+        try:
+            with gzip.open(path, "rb") as inp, open(restored, "wb") as out:
+                shutil.copyfileobj(inp, out, COPY_CHUNK)
+        except (OSError, EOFError) as e:
+            return [f"cannot decompress: {e}"]
+        return check_database(restored)
+
+
+def checkpoint(truncate: bool = False) -> tuple[int, int, int]:
+    # (busy, wal pages, pages checkpointed) from PRAGMA wal_checkpoint.
+    # PASSIVE never waits for readers or writers. TRUNCATE also resets the WAL
+    # file to zero bytes, but holds the write lock while it waits for readers,
+    # so it runs on its own connection with busy_timeout = 0: if any reader
+    # (a backup, an export) still holds an old snapshot it gives up at once
+    # instead of stalling every writer for the 30 s busy timeout.
+    if not truncate:
+        return tuple(db.get_connection().execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone())
+    con = db.connect()
+    try:
+        con.execute("PRAGMA busy_timeout = 0")
+        try:
+            return tuple(con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone())
+        except sqlite3.OperationalError:
+            # Lock not available right now (SQLITE_BUSY).
+            return 1, -1, -1
+    finally:
+        con.close()
+
+
+_backups_lock = threading.Lock()
+_backups_running = 0
+
+
+def _backup_started() -> None:
+    global _backups_running
+    with _backups_lock:
+        _backups_running += 1
+
+
+def _backup_finished() -> None:
+    global _backups_running
+    with _backups_lock:
+        _backups_running -= 1
+
+
+def backup_running() -> bool:
+    with _backups_lock:
+        return _backups_running > 0
+
+
+def wal_size() -> int:
+    wal = Path(f"{db.database_file()}-wal")
+    return wal.stat().st_size if wal.exists() else 0
+
+
+class CheckpointScheduler(threading.Thread):
+    # Keeps the WAL short while the app runs: a passive checkpoint every
+    # interval, and a truncating attempt once the WAL outgrows truncate_bytes
+    # (e.g. after a bulk import), so reads do not slow down on a long WAL.
+    # While a backup runs only the passive one is done.
+    def __init__(self, logger, interval: float = CHECKPOINT_INTERVAL, truncate_bytes: int = WAL_TRUNCATE_BYTES):
+        super().__init__(name="CheckpointScheduler", daemon=True)
+        self.logger = logger
+        self.interval = interval
+        self.truncate_bytes = truncate_bytes
+        self._stopping = threading.Event()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                self.logger.exception("WAL checkpoint failed.")
+        db.close_connection()
+
+    def run_once(self) -> None:
+        size = wal_size()
+        truncate = size > self.truncate_bytes and not backup_running()
+        busy, log, done = checkpoint(truncate=truncate)
+        if truncate:
+            self.logger.info(f"WAL checkpoint ({size} bytes): {done}/{log} pages{', busy' if busy else ''}.")
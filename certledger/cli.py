@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import argparse
+import sys
+from typing import Optional
+
+from . import db
+
+# Headless entry point: python -m certledger <command>.
+# Only stdlib, db and ledger are imported up front. The mail stack (keyring,
+# imaplib, smtplib) is imported inside the commands that need it, and Qt is
+# never imported, so the CLI runs on servers without a display.
+
+
+def _logger():
+    from .logging_setup import setup_logging
+    from .settings_store import load_settings
+    return setup_logging(json_lines=load_settings().log_json)
+
+
+def cmd_scan(args) -> int:
+    from . import emailer
+    matched, processed = emailer.scan_inbox_and_apply_signatures(_logger())
+    print(f"Processed {processed} emails, matched {matched}.")
+    return 0
+
+
+def cmd_watch(args) -> int:
+    from .audit import AuditSink
+    from .watcher import MailboxWatcher
+    logger = _logger()
+    sink = AuditSink(logger=logger).install()
+    watcher = MailboxWatcher(logger, poll_interval=args.poll_interval)
+    watcher.start()
+    try:
+        # join() with a timeout keeps Ctrl+C responsive on Windows.
+        while watcher.is_alive():
+            watcher.join(1.0)
+    except KeyboardInterrupt:
+        print("Stopping...", file=sys.stderr)
+    finally:
+        watcher.stop(timeout=10)
+        sink.close()
+    return 0
+
+
+def _send_requests(cert_numbers: list[str], args) -> int:
+    from . import ledger
+    from .dispatcher import SignatureRequest, dispatch_signature_requests
+
+    logger = _logger()
+    requests, failed = [], 0
+    for cert in cert_numbers:
+        try:
+            to_email, sign_code, summary = ledger.prepare_signature_request(cert)
+        except RuntimeError as e:
+            print(f"{cert}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        requests.append(SignatureRequest(cert, to_email, sign_code, summary))
+
+    results = dispatch_signature_requests(
+        requests, logger=logger, workers=args.workers, rate_per_second=args.rate, actor="cli"
+    )
+    for r in results:
+        if not r.ok:
+            print(f"{r.cert_number}: {r.error}", file=sys.stderr)
+            failed += 1
+    print(f"Sent {sum(r.ok for r in results)}/{len(cert_numbers)} signature requests.")
+    return 1 if failed else 0
+
+
+def cmd_issue(args) -> int:
+    from . import ledger
+    cert = ledger.issue_certificate(
+        args.type, args.receiver, args.giver, args.days, args.receiver_name, args.giver_name
+    )
+    print(cert)
+    if args.request_signature:
+        return _send_requests([cert], args)
+    return 0
+
+
+def cmd_bulk_issue(args) -> int:
+    from . import importer
+    report = importer.import_certificates(
+        importer.read_records(args.file),
+        dry_run=args.dry_run,
+        default_valid_days=args.days,
+        actor="cli",
+        source=args.file,
+    )
+    return _finish_import(report, args)
+
+
+def _finish_import(report, args) -> int:
+    from . import importer
+    for e in report.errors[:20]:
+        print(f"line {e.line}: {e.message}", file=sys.stderr)
+    if len(report.errors) > 20:
+        print(f"... {len(report.errors) - 20} more errors", file=sys.stderr)
+    if args.errors and report.errors:
+        importer.write_error_report(report.errors, args.errors)
+    print(report.summary())
+    return 1 if report.errors else 0
+
+
+def cmd_import_people(args) -> int:
+    from . import importer
+    report = importer.import_people(
+        importer.read_records(args.file), dry_run=args.dry_run, actor="cli", source=args.file
+    )
+    return _finish_import(report, args)
+
+
+def cmd_request_signatures(args) -> int:
+    from . import ledger
+    certs = list(args.certs)
+    if args.all_issued:
+        certs += ledger.certificates_with_status("ISSUED", args.limit)
+    if not certs:
+        print("No certificates to request.", file=sys.stderr)
+        return 0
+    return _send_requests(certs, args)
+
+
+def cmd_export(args) -> int:
+    from . import exporter
+    count = exporter.export(
+        args.dataset,
+        args.output,
+        fmt=args.format,
+        compress=args.gzip or None,
+        status=args.status,
+        cert_type=args.type,
+        since=args.since,
+        until=args.until,
+        expired_as_of=args.expired_as_of,
+        action=args.action,
+        result=args.result,
+    )
+    print(f"Exported {count} {args.dataset} rows.", file=sys.stderr)
+    return 0
+
+
+def cmd_expiry(args) -> int:
+    from . import expiry
+    expired = expiry.mark_expired(actor="cli")
+    print(f"Marked {len(expired)} certificates expired.")
+    for r in db.certificates_expiring_within(args.days, limit=args.limit):
+        print(f"{r['cert_number']}\t{r['valid_until']}\t{r['status']}")
+    if args.notify:
+        sent, due = expiry.send_renewal_notices(args.days, _logger(), actor="cli", workers=args.workers, rate_per_second=args.rate)
+        print(f"Sent {sent}/{due} renewal notices.")
+        return 1 if sent < due else 0
+    return 0
+
+
+def cmd_pdf(args) -> int:
+    from . import pdfstore
+    if args.action == "attach":
+        if len(args.args) != 2:
+            raise RuntimeError("usage: pdf attach CERT_NUMBER FILE")
+        info = pdfstore.attach_pdf(args.args[0], args.args[1], actor="cli")
+        print(f"{args.args[0]}: {info.relpath} ({info.size} bytes)")
+        return 0
+    if args.action == "adopt":
+        print(f"Adopted {pdfstore.adopt_legacy(actor='cli')} legacy PDFs into the store.")
+        return 0
+    report = pdfstore.verify_store(workers=args.workers)
+    for cert in report.missing:
+        print(f"missing\t{cert}")
+    for cert in report.mismatched:
+        print(f"mismatched\t{cert}")
+    print(report.summary(), file=sys.stderr)
+    db.log_audit("VERIFY_PDFS", "FILE", "pdfs", "OK" if report.ok else "ERROR", report.summary(), actor="cli")
+    return 0 if report.ok else 1
+
+
+def cmd_verify(args) -> int:
+    con = db.get_connection()
+    problems = [r[0] for r in con.execute("PRAGMA integrity_check") if r[0] != "ok"]
+    for table, rowid, parent, _ in con.execute("PRAGMA foreign_key_check"):
+        problems.append(f"{table} row {rowid}: missing {parent} reference")
+    # Duplicate government ids keep people.gov_id_number from being unique;
+    # once they are merged the index is upgraded here (and on next start).
+    for gov_id, person_ids in db.duplicate_gov_ids():
+        problems.append(f"gov id {gov_id} is shared by {', '.join(person_ids)}; merge these people")
+    if not problems and not db.ensure_unique_gov_id_index():
+        problems.append("gov id index is not unique")
+    for p in problems:
+        print(p)
+    print(f"Schema version {db.schema_version(con)}; {'OK' if not problems else f'{len(problems)} problem(s)'}.")
+    return 1 if problems else 0
+
+
+def cmd_backup(args) -> int:
+    from . import backup
+    if args.action == "verify":
+        if not args.path:
+            raise RuntimeError("usage: backup verify FILE")
+        problems = backup.verify_backup(args.path)
+        for p in problems:
+            print(p)
+        print(f"{args.path}: {'OK' if not problems else f'{len(problems)} problem(s)'}.", file=sys.stderr)
+        return 1 if problems else 0
+    if args.action == "checkpoint":
+        busy, log, done = backup.checkpoint(truncate=True)
+        if busy:
+            print("Database busy (a reader holds an older snapshot); WAL not truncated, try again later.")
+            return 1
+        print(f"Checkpointed {done}/{log} WAL pages; WAL truncated.")
+        return 0
+    if args.action == "compact":
+        info = backup.compact(args.path, actor="cli")
+    else:
+        info = backup.backup(args.path, compress=args.gzip or None, verify=not args.no_verify, actor="cli")
+    print(f"{info.path} ({info.size} bytes, {info.seconds:.1f}s)")
+    return 0
+
+
+def cmd_stats(args) -> int:
+    from . import stats
+    if args.rebuild:
+        stats.rebuild(actor="cli")
+    if args.verify:
+        problems = stats.verify()
+        for p in problems:
+            print(p)
+        print(f"Counters {'OK' if not problems else f'differ in {len(problems)} place(s); run stats --rebuild'}.")
+        return 1 if problems else 0
+    d = stats.dashboard()
+    print(f"certificates\t{d.total}")
+    print(f"awaiting_signature\t{d.pending_signatures}")
+    print(f"expiring_this_month\t{d.expiring_this_month}")
+    print(f"unmatched_emails\t{d.unmatched_evidence}")
+    for status, n in sorted(d.by_status.items()):
+        print(f"status:{status}\t{n}")
+    for cert_type, n in sorted(d.by_type.items()):
+        print(f"type:{cert_type}\t{n}")
+    return 0
+
+
+def _add_send_options(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--workers", type=int, default=4, help="parallel SMTP sessions (default 4)")
+    p.add_argument("--rate", type=float, default=5.0, help="max emails per second (default 5)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="certledger", description="CertLedger command line.")
+    parser.add_argument("--db", help="database file (default: data/certs.sqlite3)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("scan", help="scan the mailbox once and apply signatures").set_defaults(func=cmd_scan)
+
+    p = sub.add_parser("watch", help="watch the mailbox (IMAP IDLE) until interrupted")
+    p.add_argument("--poll-interval", type=float, default=60.0, help="seconds between polls without IDLE")
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("issue", help="issue one certificate and print its number")
+    p.add_argument("--type", required=True, help="certificate type")
+    p.add_argument("--receiver", required=True, help="receiver person id")
+    p.add_argument("--giver", required=True, help="giver person id")
+    p.add_argument("--days", type=int, default=365, help="validity in days (default 365)")
+    p.add_argument("--receiver-name", default="official", choices=("official", "call", "nickname"))
+    p.add_argument("--giver-name", default="official", choices=("official", "call", "nickname"))
+    p.add_argument("--request-signature", action="store_true", help="also email the signature request")
+    _add_send_options(p)
+    p.set_defaults(func=cmd_issue)
+
+    p = sub.add_parser("bulk-issue", help="issue certificates from a CSV or JSONL file")
+    p.add_argument("file", help="columns: cert_type, receiver, giver, valid_days, receiver_name_used, giver_name_used")
+    p.add_argument("--days", type=int, default=365, help="validity when the row has none (default 365)")
+    p.add_argument("--dry-run", action="store_true", help="validate only; issue nothing")
+    p.add_argument("--errors", help="write the per-row error report to this CSV file")
+    p.set_defaults(func=cmd_bulk_issue)
+
+    p = sub.add_parser("import-people", help="create/update people from a CSV or JSONL file (keyed by gov id)")
+    p.add_argument("file", help="columns: gov_id_number, date_of_birth, official_name, call_name, nickname, email, nationality")
+    p.add_argument("--dry-run", action="store_true", help="validate only; write nothing")
+    p.add_argument("--errors", help="write the per-row error report to this CSV file")
+    p.set_defaults(func=cmd_import_people)
+
+    p = sub.add_parser("request-signatures", help="email signature requests")
+    p.add_argument("certs", nargs="*", help="certificate numbers")
+    p.add_argument("--all-issued", action="store_true", help="every certificate still in ISSUED")
+    p.add_argument("--limit", type=int, help="with --all-issued, at most this many")
+    _add_send_options(p)
+    p.set_defaults(func=cmd_request_signatures)
+
+    p = sub.add_parser("export", help="stream a table to CSV, JSONL or Parquet")
+    p.add_argument("dataset", nargs="?", default="certificates", choices=("certificates", "people", "evidence", "audit"))
+    p.add_argument("-o", "--output", default="-", help="output file; .gz compresses, format from extension (default: CSV to stdout)")
+    p.add_argument("--format", choices=("csv", "jsonl", "parquet"), help="override the format implied by the file name")
+    p.add_argument("--gzip", action="store_true", help="gzip the output whatever its name")
+    p.add_argument("--status", help="certificates: only this status")
+    p.add_argument("--type", help="certificates: only this certificate type")
+    p.add_argument("--expired-as-of", help="certificates: valid_until before this date/time")
+    p.add_argument("--since", help="from this date/time (inclusive; issued/created/received/ts)")
+    p.add_argument("--until", help="before this date/time (exclusive)")
+    p.add_argument("--action", help="audit: only this action")
+    p.add_argument("--result", help="audit: only this result")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("expiry", help="mark expired certificates and list those expiring soon")
+    p.add_argument("--days", type=int, default=30, help="list certificates expiring within this many days (default 30)")
+    p.add_argument("--limit", type=int, default=500, help="list at most this many (default 500)")
+    p.add_argument("--notify", action="store_true", help="email renewal notices for the listed window")
+    _add_send_options(p)
+    p.set_defaults(func=cmd_expiry)
+
+    p = sub.add_parser("pdf", help="content-addressed PDF store: attach, adopt legacy files, verify")
+    p.add_argument("action", choices=("attach", "adopt", "verify"))
+    p.add_argument("args", nargs="*", help="attach: CERT_NUMBER FILE")
+    p.add_argument("--workers", type=int, help="verify: worker processes (default: all cores)")
+    p.set_defaults(func=cmd_pdf)
+
+    p = sub.add_parser("backup", help="online backup, compacted copy, backup check, WAL checkpoint")
+    p.add_argument("action", nargs="?", default="create", choices=("create", "compact", "verify", "checkpoint"))
+    p.add_argument("path", nargs="?", help="output file (default: data/backups/...); for verify, the backup to check")
+    p.add_argument("--gzip", action="store_true", help="create: gzip the backup whatever its name")
+    p.add_argument("--no-verify", action="store_true", help="create: skip the integrity check of the snapshot")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("stats", help="dashboard counts (from the maintained counters)")
+    p.add_argument("--verify", action="store_true", help="compare the counters with a full recount")
+    p.add_argument("--rebuild", action="store_true", help="recompute the counters from scratch")
+    p.set_defaults(func=cmd_stats)
+
+    sub.add_parser("verify", help="check database integrity").set_defaults(func=cmd_verify)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.db:
+        db.set_database_file(args.db)
+    db.init_db()
+    try:
+        return args.func(args)
+    except RuntimeError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.flush_audit()
+        db.close_connection()
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Protocol
+
+# App passwords for the system mailbox, looked up through one provider per
+# process and cached in memory: a bulk send or a scan loop asks the OS
+# credential store once, not once per message. set_password() and
+# invalidate() drop the cache. "Not stored" is only remembered for
+# MISSING_TTL seconds, so a password saved by another process (the GUI,
+# the keyring tool) is picked up by a running watcher.
+#
+# The provider is chosen once, from the environment:
+#   CERTLEDGER_APP_PASSWORD        the password itself (servers, CI); read-only
+#   CERTLEDGER_CREDENTIALS_FILE    a JSON file {account: password} (tests)
+#   otherwise                      the OS keyring (Windows Credential Manager)
+SERVICE_NAME = "CertLedger"
+ENV_PASSWORD = "CERTLEDGER_APP_PASSWORD"
+ENV_FILE = "CERTLEDGER_CREDENTIALS_FILE"
+MISSING_TTL = 60.0
+
+
+class CredentialProvider(Protocol):
+    name: str
+
+    def get(self, account: str) -> Optional[str]: ...
+
+    def set(self, account: str, password: str) -> None: ...
+
+
+class KeyringProvider:
+    def __init__(self, service: str = SERVICE_NAME):
+        self.service = service
+        self.name = "keyring"
+        self._keyring = None
+
+    def _backend(self):
+        # keyring is imported, and its backend resolved, on first use only
+        # (discovery is slow). On Windows the Credential Manager backend is
+        # forced so a stray third-party backend cannot take over.
+        if self._keyring is None:
+            import keyring
+            if sys.platform == "win32":
+                from keyring.backends import Windows
+                keyring.set_keyring(Windows.WinVaultKeyring())
+            self.name = f"keyring ({type(keyring.get_keyring()).__name__})"
+            self._keyring = keyring
+        return self._keyring
+
+    def get(self, account: str) -> Optional[str]:
+        return self._backend().get_password(self.service, account)
+
+    def set(self, account: str, password: str) -> None:
+        self._backend().set_password(self.service, account, password)
+
+
+class EnvProvider:
+    def __init__(self, var: str = ENV_PASSWORD):
+        self.var = var
+        self.name = f"environment ({var})"
+
+    def get(self, account: str) -> Optional[str]:
+        return os.environ.get(self.var) or None
+
+    def set(self, account: str, password: str) -> None:
+        raise RuntimeError(f"The app password comes from {self.var}; change it there.")
+
+
+class FileProvider:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.name = f"file ({self.path})"
+
+    def _read(self) -> dict[str, str]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+
+    def get(self, account: str) -> Optional[str]:
+        return self._read().get(account)
+
+    def set(self, account: str, password: str) -> None:
+        data = self._read()
+        data[account] = password
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+
+def default_provider() -> CredentialProvider:
+    if os.environ.get(ENV_PASSWORD):
+        return EnvProvider()
+    if os.environ.get(ENV_FILE):
+        return FileProvider(os.environ[ENV_FILE])
+    return KeyringProvider()
+
+
+_lock = threading.Lock()
+_provider: Optional[CredentialProvider] = None
+# account -> password, or None for "looked up, not stored" (cached for
+# MISSING_TTL, so an unconfigured mailbox does not hit the store on every
+# watcher pass).
+_cache: dict[str, Optional[str]] = {}
+# account -> time.monotonic() after which a cached None is looked up again.
+_missing_until: dict[str, float] = {}
+
+
+def _normalize(account: str) -> str:
+    return (account or "").strip().lower()
+
+
+def get_provider() -> CredentialProvider:
+    global _provider
+    with _lock:
+        if _provider is None:
+            _provider = default_provider()
+        return _provider
+
+
+def set_provider(provider: Optional[CredentialProvider]) -> None:
+    # Replaces the provider (None: back to the default) and empties the cache.
+    global _provider
+    with _lock:
+        _provider = provider
+        _cache.clear()
+        _missing_until.clear()
+
+
+def backend_name() -> str:
+    return get_provider().name
+
+
+def get_password(account: str) -> Optional[str]:
+    account = _normalize(account)
+    with _lock:
+        if account in _cache and (_cache[account] is not None or time.monotonic() < _missing_until[account]):
+            return _cache[account]
+    provider = get_provider()
+    # Looked up outside the lock: the OS store may prompt or block.
+    password = provider.get(account)
+    with _lock:
+        if _provider is provider:
+            _cache[account] = password
+            if password is None:
+                _missing_until[account] = time.monotonic() + MISSING_TTL
+    return password
+
+
+def set_password(account: str, password: str) -> None:
+    account = _normalize(account)
+    get_provider().set(account, password)
+    with _lock:
+        _cache.pop(account, None)
+
+
+def invalidate(account: Optional[str] = None) -> None:
+    # Forget one cached account, or all of them.
+    with _lock:
+        if account is None:
+            _cache.clear()
+        else:
+            _cache.pop(_normalize(account), None)
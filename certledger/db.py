@@ -1,13 +1,43 @@
 from __future__ import annotations
 
 import sqlite3
-from datetime import datetime
-from typing import Any, Optional
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterator, Optional
 from .paths import db_path
 
 
+# One long-lived connection per thread. sqlite3 connections must not be shared
+# across threads, and reusing them keeps the per-connection statement cache warm
+# and avoids re-running the PRAGMAs (and the mkdir in db_path()) on every call.
+_local = threading.local()
+_db_file: Optional[Path] = None
+
+
+def _database_file() -> Path:
+    global _db_file
+    if _db_file is None:
+        _db_file = db_path()
+    return _db_file
+
+
+def database_file() -> Path:
+    return _database_file()
+
+
+def set_database_file(path: str | Path) -> None:
+    # Point this process at another database (CLI, benchmarks). Thread-local
+    # connections to the previous file are replaced on their next use.
+    global _db_file
+    close_connection()
+    _db_file = Path(path)
+
+
 def connect() -> sqlite3.Connection:
-    con = sqlite3.connect(db_path(), timeout=30)
+    # Fresh, dedicated connection in autocommit mode; transactions are explicit.
+    con = sqlite3.connect(_database_file(), timeout=30, isolation_level=None, cached_statements=256)
     con.row_factory = sqlite3.Row
     con.execute("PRAGMA foreign_keys = ON;")
     con.execute("PRAGMA journal_mode = WAL;")
@@ -15,88 +45,482 @@ def connect() -> sqlite3.Connection:
     return con
 
 
+def get_connection() -> sqlite3.Connection:
+    path = _database_file()
+    con = getattr(_local, "con", None)
+    if con is None or _local.path != path:
+        if con is not None:
+            con.close()
+        con = connect()
+        _local.con = con
+        _local.path = path
+        _local.depth = 0
+    return con
 
-def now_iso() -> str:
-    return datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
+def close_connection() -> None:
+    con = getattr(_local, "con", None)
+    if con is not None:
+        con.close()
+        _local.con = None
+        _local.depth = 0
 
-def init_db() -> None:
-    con = connect()
-    cur = con.cursor()
 
-    # Core tables (desired schema)
-    cur.executescript("""
-    CREATE TABLE IF NOT EXISTS people (
-        person_id TEXT PRIMARY KEY,
-        gov_id_number TEXT NOT NULL,
-        date_of_birth TEXT NOT NULL,
-        official_name TEXT NOT NULL,
-        call_name TEXT,
-        nickname TEXT,
-        email TEXT,
-        nationality TEXT,
-        created_at TEXT NOT NULL,
-        updated_at TEXT NOT NULL
-    );
+@contextmanager
+def transaction(immediate: bool = False) -> Iterator[sqlite3.Connection]:
+    """Run the block in one transaction on this thread's connection.
 
-    CREATE TABLE IF NOT EXISTS certificates (
-        cert_number TEXT PRIMARY KEY,
-        cert_type TEXT NOT NULL,
-        issued_at TEXT NOT NULL,
-        receiver_person_id TEXT NOT NULL,
-        giver_person_id TEXT NOT NULL,
-        receiver_name_used TEXT NOT NULL,
-        giver_name_used TEXT NOT NULL,
-        valid_until TEXT NOT NULL,
-        status TEXT NOT NULL,
-        sign_code TEXT,
-        sign_requested_at TEXT,
-        signed_at TEXT,
-        pdf_relpath TEXT,
-        FOREIGN KEY(receiver_person_id) REFERENCES people(person_id),
-        FOREIGN KEY(giver_person_id) REFERENCES people(person_id)
-    );
+    Nested blocks become savepoints, so helpers can open their own transaction
+    and still join a caller's outer one.
+    """
+    con = get_connection()
+    depth = _local.depth
+    if depth:
+        name = f"sp{depth}"
+        con.execute(f"SAVEPOINT {name}")
+        _local.depth = depth + 1
+        try:
+            yield con
+        except BaseException:
+            con.execute(f"ROLLBACK TO {name}")
+            con.execute(f"RELEASE {name}")
+            raise
+        else:
+            con.execute(f"RELEASE {name}")
+        finally:
+            _local.depth = depth
+        return
 
-    -- Evidence must be able to store unmatched emails too (cert_number nullable, no FK)
-    CREATE TABLE IF NOT EXISTS email_evidence (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        cert_number TEXT,
-        received_at TEXT NOT NULL,
-        from_email TEXT NOT NULL,
-        subject TEXT NOT NULL,
-        body_hash TEXT NOT NULL,
-        message_id TEXT,
-        matched INTEGER NOT NULL,
-        notes TEXT NOT NULL
-    );
+    con.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    _local.depth = 1
+    try:
+        yield con
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    finally:
+        _local.depth = 0
+
+
+def now_iso() -> str:
+    return datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
-    CREATE TABLE IF NOT EXISTS audit_log (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ts TEXT NOT NULL,
-        actor TEXT NOT NULL,
-        action TEXT NOT NULL,
-        entity_type TEXT NOT NULL,
-        entity_id TEXT NOT NULL,
-        before_json TEXT,
-        after_json TEXT,
-        result TEXT NOT NULL,
-        message TEXT NOT NULL
-    );
-    """)
-    con.commit()
 
-    # Self-heal older DBs: add nationality if missing
+def _migration_1_base_schema(con: sqlite3.Connection) -> None:
+    # Core tables (desired schema)
+    for ddl in (
+        """
+        CREATE TABLE IF NOT EXISTS people (
+            person_id TEXT PRIMARY KEY,
+            gov_id_number TEXT NOT NULL,
+            date_of_birth TEXT NOT NULL,
+            official_name TEXT NOT NULL,
+            call_name TEXT,
+            nickname TEXT,
+            email TEXT,
+            nationality TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS certificates (
+            cert_number TEXT PRIMARY KEY,
+            cert_type TEXT NOT NULL,
+            issued_at TEXT NOT NULL,
+            receiver_person_id TEXT NOT NULL,
+            giver_person_id TEXT NOT NULL,
+            receiver_name_used TEXT NOT NULL,
+            giver_name_used TEXT NOT NULL,
+            valid_until TEXT NOT NULL,
+            status TEXT NOT NULL,
+            sign_code TEXT,
+            sign_requested_at TEXT,
+            signed_at TEXT,
+            pdf_relpath TEXT,
+            FOREIGN KEY(receiver_person_id) REFERENCES people(person_id),
+            FOREIGN KEY(giver_person_id) REFERENCES people(person_id)
+        )
+        """,
+        # Evidence must be able to store unmatched emails too (cert_number nullable, no FK)
+        """
+        CREATE TABLE IF NOT EXISTS email_evidence (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cert_number TEXT,
+            received_at TEXT NOT NULL,
+            from_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body_hash TEXT NOT NULL,
+            message_id TEXT,
+            matched INTEGER NOT NULL,
+            notes TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            actor TEXT NOT NULL,
+            action TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            entity_id TEXT NOT NULL,
+            before_json TEXT,
+            after_json TEXT,
+            result TEXT NOT NULL,
+            message TEXT NOT NULL
+        )
+        """,
+    ):
+        con.execute(ddl)
+
+    # Databases created before versioning may predate these columns/constraints.
     cols = [r[1] for r in con.execute("PRAGMA table_info(people)").fetchall()]
     if "nationality" not in cols:
         con.execute("ALTER TABLE people ADD COLUMN nationality TEXT;")
-        con.commit()
 
-    # Self-heal older email_evidence schemas that had FK constraints
-    fk_list = con.execute("PRAGMA foreign_key_list(email_evidence)").fetchall()
-    if fk_list:
+    if con.execute("PRAGMA foreign_key_list(email_evidence)").fetchall():
         _migrate_email_evidence_remove_fk(con)
 
-    con.close()
+
+def _migration_2_sequences(con: sqlite3.Connection) -> None:
+    # Number allocators (person ids, per-year cert numbers); value = last issued
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS sequences (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """)
+
+
+def _migration_3_indexes(con: sqlite3.Connection) -> None:
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS idx_certificates_status ON certificates(status, cert_number)",
+        "CREATE INDEX IF NOT EXISTS idx_certificates_receiver ON certificates(receiver_person_id)",
+        "CREATE INDEX IF NOT EXISTS idx_certificates_giver ON certificates(giver_person_id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_ts ON audit_log(ts)",
+        "CREATE INDEX IF NOT EXISTS idx_email_evidence_message_id ON email_evidence(message_id)",
+        "CREATE INDEX IF NOT EXISTS idx_email_evidence_cert ON email_evidence(cert_number)",
+    ):
+        con.execute(ddl)
+
+
+def _migration_4_app_state(con: sqlite3.Connection) -> None:
+    # Small key/value store for state that must commit atomically with data
+    # (e.g. the IMAP UID checkpoint alongside the evidence rows it covers).
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS app_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """)
+
+
+def _migration_5_sign_index_generation(con: sqlite3.Connection) -> None:
+    # Bumped by triggers whenever data the signature matcher caches changes
+    # (pending certs, their sign codes and participants' emails).
+    con.execute("INSERT OR IGNORE INTO app_state(key, value) VALUES ('sign_index_generation', '0')")
+    bump = "UPDATE app_state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'sign_index_generation';"
+    for ddl in (
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_certificates_sign_index_ins
+        AFTER INSERT ON certificates WHEN NEW.status = 'SIGN_REQUESTED'
+        BEGIN {bump} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_certificates_sign_index_upd
+        AFTER UPDATE OF status, sign_code, receiver_person_id, giver_person_id ON certificates
+        BEGIN {bump} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_certificates_sign_index_del
+        AFTER DELETE ON certificates WHEN OLD.status = 'SIGN_REQUESTED'
+        BEGIN {bump} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_people_sign_index_email
+        AFTER UPDATE OF email ON people WHEN NEW.email IS NOT OLD.email
+        BEGIN {bump} END
+        """,
+    ):
+        con.execute(ddl)
+
+
+def _migration_6_cert_sort_indexes(con: sqlite3.Connection) -> None:
+    # Keyset pages of the certificate list ORDER BY <column>, cert_number.
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS idx_certificates_type ON certificates(cert_type, cert_number)",
+        "CREATE INDEX IF NOT EXISTS idx_certificates_issued_at ON certificates(issued_at, cert_number)",
+    ):
+        con.execute(ddl)
+
+
+_PEOPLE_FTS_COLUMNS = "person_id, official_name, call_name, nickname, gov_id_number, nationality"
+
+
+def _migration_7_people_fts(con: sqlite3.Connection) -> None:
+    # Trigram full-text index over the searchable people columns, kept in sync
+    # by triggers. Builds without FTS5/trigram (SQLite < 3.34) skip it and
+    # search_people() falls back to a bounded LIKE scan.
+    try:
+        with transaction():
+            con.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS people_fts USING fts5(
+                {_PEOPLE_FTS_COLUMNS},
+                content='people', content_rowid='rowid', tokenize='trigram'
+            )
+            """)
+    except sqlite3.OperationalError:
+        return
+
+    new_cols = ", ".join(f"new.{c.strip()}" for c in _PEOPLE_FTS_COLUMNS.split(","))
+    old_cols = ", ".join(f"old.{c.strip()}" for c in _PEOPLE_FTS_COLUMNS.split(","))
+    insert = f"INSERT INTO people_fts(rowid, {_PEOPLE_FTS_COLUMNS}) VALUES (new.rowid, {new_cols});"
+    delete = (
+        f"INSERT INTO people_fts(people_fts, rowid, {_PEOPLE_FTS_COLUMNS}) "
+        f"VALUES ('delete', old.rowid, {old_cols});"
+    )
+    for ddl in (
+        f"CREATE TRIGGER IF NOT EXISTS trg_people_fts_ins AFTER INSERT ON people BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_people_fts_del AFTER DELETE ON people BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_people_fts_upd AFTER UPDATE ON people BEGIN {delete} {insert} END",
+    ):
+        con.execute(ddl)
+    con.execute("INSERT INTO people_fts(people_fts) VALUES ('rebuild')")
+
+
+def _migration_8_audit_indexes(con: sqlite3.Connection) -> None:
+    # Keyset pages of the audit log run ORDER BY id DESC within each filter.
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_entity ON audit_log(entity_type, entity_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log(action, id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_result ON audit_log(result, id)",
+    ):
+        con.execute(ddl)
+
+
+def _migration_9_people_gov_id_index(con: sqlite3.Connection) -> None:
+    # One person per government id. Older databases may already hold
+    # duplicates; those get a plain index (lookups stay fast) until merged,
+    # and init_db() upgrades it once they are (see ensure_unique_gov_id_index).
+    duplicate = con.execute(
+        "SELECT 1 FROM people GROUP BY gov_id_number HAVING COUNT(*) > 1 LIMIT 1"
+    ).fetchone()
+    unique = "" if duplicate else "UNIQUE "
+    con.execute(f"CREATE {unique}INDEX IF NOT EXISTS idx_people_gov_id ON people(gov_id_number)")
+
+
+def gov_id_index_unique(con: Optional[sqlite3.Connection] = None) -> bool:
+    con = con or get_connection()
+    return any(r["name"] == "idx_people_gov_id" and r["unique"] for r in con.execute("PRAGMA index_list(people)"))
+
+
+def duplicate_gov_ids(limit: Optional[int] = None) -> list[tuple[str, list[str]]]:
+    # (gov_id_number, person_ids) for every government id held by more than
+    # one person; these must be merged before the id can be made unique.
+    rows = get_connection().execute(
+        """
+        SELECT gov_id_number, group_concat(person_id, ' ') AS ids FROM people
+        GROUP BY gov_id_number HAVING COUNT(*) > 1 ORDER BY gov_id_number LIMIT ?
+        """,
+        (-1 if limit is None else limit,),
+    ).fetchall()
+    return [(r["gov_id_number"], r["ids"].split()) for r in rows]
+
+
+def ensure_unique_gov_id_index() -> bool:
+    # Upgrades the plain gov id index of a database that had duplicates once
+    # none remain. Returns whether the index is (now) unique.
+    con = get_connection()
+    if gov_id_index_unique(con):
+        return True
+    with transaction(immediate=True):
+        if duplicate_gov_ids(limit=1):
+            return False
+        con.execute("DROP INDEX IF EXISTS idx_people_gov_id")
+        con.execute("CREATE UNIQUE INDEX idx_people_gov_id ON people(gov_id_number)")
+    return True
+
+
+# Canonical stored timestamp form (see now_iso); sorts and compares as text.
+ISO_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]:[0-9][0-9]:[0-9][0-9]Z"
+
+
+def _migration_10_expiry(con: sqlite3.Connection) -> None:
+    # Older rows may hold valid_until as a bare date or with an offset; bring
+    # everything SQLite can parse to the canonical UTC form so range scans on
+    # the index compare like with like.
+    con.execute(
+        """
+        UPDATE certificates SET valid_until = strftime('%Y-%m-%dT%H:%M:%SZ', valid_until)
+        WHERE valid_until NOT GLOB ? AND strftime('%Y-%m-%dT%H:%M:%SZ', valid_until) IS NOT NULL
+        """,
+        (ISO_GLOB,),
+    )
+    cols = [r[1] for r in con.execute("PRAGMA table_info(certificates)").fetchall()]
+    if "expired_at" not in cols:
+        con.execute("ALTER TABLE certificates ADD COLUMN expired_at TEXT")
+    if "renewal_notice_at" not in cols:
+        con.execute("ALTER TABLE certificates ADD COLUMN renewal_notice_at TEXT")
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS idx_certificates_valid_until ON certificates(valid_until, cert_number)",
+        # Only certificates the expiry scheduler has not marked yet.
+        "CREATE INDEX IF NOT EXISTS idx_certificates_unexpired ON certificates(valid_until) WHERE expired_at IS NULL",
+    ):
+        con.execute(ddl)
+
+
+def _migration_11_pdf_store(con: sqlite3.Connection) -> None:
+    # Content-addressed PDFs (see pdfstore): hash and size recorded per certificate.
+    cols = [r[1] for r in con.execute("PRAGMA table_info(certificates)").fetchall()]
+    if "pdf_sha256" not in cols:
+        con.execute("ALTER TABLE certificates ADD COLUMN pdf_sha256 TEXT")
+    if "pdf_size" not in cols:
+        con.execute("ALTER TABLE certificates ADD COLUMN pdf_size INTEGER")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_certificates_pdf_sha256 ON certificates(pdf_sha256) WHERE pdf_sha256 IS NOT NULL")
+
+
+# Dashboard counters (see stats.py): (name, key) -> row count, kept current by
+# triggers so reading them never scans certificates or email_evidence.
+# name -> SELECT key, COUNT(*) ... GROUP BY key, the from-scratch definition.
+STATS_SOURCES = {
+    "status": "SELECT status, COUNT(*) FROM certificates GROUP BY status",
+    "type": "SELECT cert_type, COUNT(*) FROM certificates GROUP BY cert_type",
+    "expiry_month": "SELECT substr(valid_until, 1, 7), COUNT(*) FROM certificates GROUP BY 1",
+    "evidence": (
+        "SELECT CASE WHEN matched THEN 'matched' ELSE 'unmatched' END, COUNT(*) "
+        "FROM email_evidence GROUP BY 1"
+    ),
+}
+# name -> key expression over a row (NEW./OLD. prefixed in the triggers).
+_CERT_STATS_KEYS = {
+    "status": "{r}.status",
+    "type": "{r}.cert_type",
+    "expiry_month": "substr({r}.valid_until, 1, 7)",
+}
+_EVIDENCE_STATS_KEYS = {
+    "evidence": "CASE WHEN {r}.matched THEN 'matched' ELSE 'unmatched' END",
+}
+
+
+def fill_stats(con: sqlite3.Connection) -> None:
+    # Recomputes every counter from the base tables.
+    con.execute("DELETE FROM stats_counters")
+    for name, sql in STATS_SOURCES.items():
+        con.execute(f"INSERT INTO stats_counters(name, key, value) SELECT ?, * FROM ({sql})", (name,))
+
+
+def _stats_triggers(table: str, keys: dict[str, str]) -> list[str]:
+    def add(name: str, key: str) -> str:
+        return (
+            f"INSERT INTO stats_counters(name, key, value) VALUES ('{name}', {key.format(r='NEW')}, 1) "
+            f"ON CONFLICT(name, key) DO UPDATE SET value = value + 1;"
+        )
+
+    def sub(name: str, key: str) -> str:
+        return f"UPDATE stats_counters SET value = value - 1 WHERE name = '{name}' AND key = {key.format(r='OLD')};"
+
+    adds = " ".join(add(name, key) for name, key in keys.items())
+    subs = " ".join(sub(name, key) for name, key in keys.items())
+    ddl = [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_ins AFTER INSERT ON {table} BEGIN {adds} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_del AFTER DELETE ON {table} BEGIN {subs} END",
+    ]
+    # One update trigger per counter, firing only when its key moved, so
+    # unrelated updates (expired_at, PDFs, sign codes) touch no counter.
+    for name, key in keys.items():
+        ddl.append(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_{name}_upd AFTER UPDATE ON {table} "
+            f"WHEN {key.format(r='NEW')} IS NOT {key.format(r='OLD')} "
+            f"BEGIN {sub(name, key)} {add(name, key)} END"
+        )
+    return ddl
+
+
+def _migration_12_stats(con: sqlite3.Connection) -> None:
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (name, key)
+    ) WITHOUT ROWID
+    """)
+    for ddl in _stats_triggers("certificates", _CERT_STATS_KEYS) + _stats_triggers("email_evidence", _EVIDENCE_STATS_KEYS):
+        con.execute(ddl)
+    fill_stats(con)
+
+
+def _migration_13_renewal_notice_error(con: sqlite3.Connection) -> None:
+    # Why a renewal notice was permanently refused; such certificates also get
+    # renewal_notice_at so they are not retried every scheduler pass.
+    cols = [r[1] for r in con.execute("PRAGMA table_info(certificates)").fetchall()]
+    if "renewal_notice_error" not in cols:
+        con.execute("ALTER TABLE certificates ADD COLUMN renewal_notice_error TEXT")
+
+
+def _migration_14_audit_entity_id_index(con: sqlite3.Connection) -> None:
+    # The Logs page is usually searched by id alone (a certificate number,
+    # entity type left blank), which (entity_type, entity_id, id) cannot
+    # serve. (entity_id, id) serves that in newest-first order, and with a
+    # type too only filters the few rows of one id. entity_type alone is too
+    # unselective to need an index (newest-first pages walk the id order).
+    con.execute("DROP INDEX IF EXISTS idx_audit_log_entity")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_entity_id ON audit_log(entity_id, id)")
+
+
+# Append-only: migration N brings the schema to PRAGMA user_version = N.
+_MIGRATIONS = (
+    _migration_1_base_schema,
+    _migration_2_sequences,
+    _migration_3_indexes,
+    _migration_4_app_state,
+    _migration_5_sign_index_generation,
+    _migration_6_cert_sort_indexes,
+    _migration_7_people_fts,
+    _migration_8_audit_indexes,
+    _migration_9_people_gov_id_index,
+    _migration_10_expiry,
+    _migration_11_pdf_store,
+    _migration_12_stats,
+    _migration_13_renewal_notice_error,
+    _migration_14_audit_entity_id_index,
+)
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+# Database file whose schema has already been verified in this process.
+_schema_ready: Optional[Path] = None
+
+
+def schema_version(con: Optional[sqlite3.Connection] = None) -> int:
+    con = con or get_connection()
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db() -> None:
+    global _schema_ready
+    path = _database_file()
+    if _schema_ready == path:
+        return
+
+    con = get_connection()
+    version = schema_version(con)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this CertLedger build ({SCHEMA_VERSION})."
+        )
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        with transaction(immediate=True):
+            # Another process may have migrated while we waited for the write lock.
+            if schema_version(con) >= target:
+                continue
+            _MIGRATIONS[target - 1](con)
+            con.execute(f"PRAGMA user_version = {target}")
+
+    # Only databases that once held duplicate gov ids lack the unique index;
+    # for them this costs one scan of the index per process.
+    ensure_unique_gov_id_index()
+    _schema_ready = path
 
 
 def _migrate_email_evidence_remove_fk(con: sqlite3.Connection) -> None:
@@ -137,7 +561,66 @@ def _migrate_email_evidence_remove_fk(con: sqlite3.Connection) -> None:
         """)
 
     con.execute("DROP TABLE email_evidence_old;")
-    con.commit()
+
+
+def get_state(key: str, default: Optional[str] = None) -> Optional[str]:
+    row = get_connection().execute("SELECT value FROM app_state WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else default
+
+
+def set_state(key: str, value: Any) -> None:
+    with transaction() as con:
+        con.execute(
+            "INSERT INTO app_state(key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value)),
+        )
+
+
+_AUDIT_INSERT = (
+    "INSERT INTO audit_log(ts, actor, action, entity_type, entity_id, before_json, after_json, result, message) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def audit_row(
+    action: str,
+    entity_type: str,
+    entity_id: str,
+    result: str,
+    message: str,
+    actor: str = "system",
+    before_json: Optional[str] = None,
+    after_json: Optional[str] = None,
+) -> tuple:
+    # Same arguments as log_audit(), for writing many rows with log_audit_many().
+    return (now_iso(), actor, action, entity_type, entity_id, before_json, after_json, result, message)
+
+
+def log_audit_many(rows: list[tuple]) -> None:
+    if not rows:
+        return
+    with transaction() as con:
+        con.executemany(_AUDIT_INSERT, rows)
+
+
+# Optional buffered writer (audit.AuditSink) that log_audit() hands rows to.
+_audit_sink: Any = None
+
+
+def set_audit_sink(sink: Any) -> None:
+    global _audit_sink
+    _audit_sink = sink
+
+
+def get_audit_sink() -> Any:
+    return _audit_sink
+
+
+def flush_audit(timeout: Optional[float] = None) -> None:
+    # Durability barrier: returns once every queued audit row is committed.
+    if _audit_sink is not None:
+        _audit_sink.flush(timeout)
 
 
 def log_audit(
@@ -150,97 +633,318 @@ def log_audit(
     before_json: Optional[str] = None,
     after_json: Optional[str] = None,
 ) -> None:
-    con = connect()
-    con.execute(
-        "INSERT INTO audit_log(ts, actor, action, entity_type, entity_id, before_json, after_json, result, message) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (now_iso(), actor, action, entity_type, entity_id, before_json, after_json, result, message),
+    row = audit_row(action, entity_type, entity_id, result, message, actor, before_json, after_json)
+    # Inside a caller's transaction the row must commit (or roll back) with it.
+    if _audit_sink is not None and not getattr(_local, "depth", 0):
+        _audit_sink.submit(row)
+        return
+    with transaction() as con:
+        con.execute(_AUDIT_INSERT, row)
+
+
+def _reserve_block(name: str, count: int, seed_sql: str, seed_args: tuple) -> int:
+    # Returns the first number of a block of `count` consecutive numbers.
+    # BEGIN IMMEDIATE takes the write lock up front, so concurrent allocators
+    # queue on busy_timeout instead of racing on read-then-insert.
+    if count < 1:
+        raise ValueError("count must be >= 1")
+    with transaction(immediate=True) as con:
+        rows = con.execute(
+            "UPDATE sequences SET value = value + ? WHERE name = ? RETURNING value",
+            (count, name),
+        ).fetchall()
+        if rows:
+            last = rows[0][0]
+        else:
+            # First use of this sequence: seed from the highest number already issued.
+            seed = con.execute(seed_sql, seed_args).fetchone()[0] or 0
+            last = seed + count
+            con.execute("INSERT INTO sequences(name, value) VALUES (?, ?)", (name, last))
+    return last - count + 1
+
+
+def reserve_person_ids(count: int) -> list[str]:
+    first = _reserve_block(
+        "person",
+        count,
+        "SELECT MAX(CAST(substr(person_id, 3) AS INTEGER)) FROM people WHERE person_id LIKE 'P-%'",
+        (),
     )
-    con.commit()
-    con.close()
+    return [f"P-{n:06d}" for n in range(first, first + count)]
+
+
+def reserve_cert_numbers(year: int, count: int) -> list[str]:
+    prefix = f"C-{year}-"
+    first = _reserve_block(
+        f"cert:{year}",
+        count,
+        "SELECT MAX(CAST(substr(cert_number, ?) AS INTEGER)) FROM certificates WHERE cert_number LIKE ?",
+        (len(prefix) + 1, prefix + "%"),
+    )
+    return [f"{prefix}{n:06d}" for n in range(first, first + count)]
 
 
 def next_person_id() -> str:
-    con = connect()
-    row = con.execute("SELECT person_id FROM people ORDER BY person_id DESC LIMIT 1").fetchone()
-    con.close()
-    if not row:
-        return "P-000001"
-    n = int(row["person_id"].split("-")[1]) + 1
-    return f"P-{n:06d}"
+    return reserve_person_ids(1)[0]
 
 
 def next_cert_number(year: int) -> str:
-    prefix = f"C-{year}-"
-    con = connect()
-    row = con.execute(
-        "SELECT cert_number FROM certificates WHERE cert_number LIKE ? ORDER BY cert_number DESC LIMIT 1",
-        (prefix + "%",),
-    ).fetchone()
-    con.close()
-    if not row:
-        return f"{prefix}000001"
-    n = int(row["cert_number"].split("-")[2]) + 1
-    return f"{prefix}{n:06d}"
+    return reserve_cert_numbers(year, 1)[0]
+
+
+_PERSON_UPSERT = """
+    INSERT INTO people(person_id, gov_id_number, date_of_birth, official_name, call_name, nickname, email, nationality, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(person_id) DO UPDATE SET
+        gov_id_number=excluded.gov_id_number,
+        date_of_birth=excluded.date_of_birth,
+        official_name=excluded.official_name,
+        call_name=excluded.call_name,
+        nickname=excluded.nickname,
+        email=excluded.email,
+        nationality=excluded.nationality,
+        updated_at=excluded.updated_at
+"""
+
+PERSON_COLUMNS = (
+    "person_id", "gov_id_number", "date_of_birth", "official_name", "call_name",
+    "nickname", "email", "nationality", "created_at", "updated_at",
+)
+
+
+def person_row(person: dict[str, Any]) -> tuple:
+    # Same dict as upsert_person(), for writing many with upsert_people().
+    return (
+        person["person_id"],
+        person["gov_id_number"],
+        person["date_of_birth"],
+        person["official_name"],
+        person.get("call_name"),
+        person.get("nickname"),
+        person.get("email"),
+        person.get("nationality"),
+        person["created_at"],
+        person["updated_at"],
+    )
 
 
 def upsert_person(person: dict[str, Any]) -> None:
-    con = connect()
-    con.execute(
-        """
-        INSERT INTO people(person_id, gov_id_number, date_of_birth, official_name, call_name, nickname, email, nationality, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(person_id) DO UPDATE SET
-            gov_id_number=excluded.gov_id_number,
-            date_of_birth=excluded.date_of_birth,
-            official_name=excluded.official_name,
-            call_name=excluded.call_name,
-            nickname=excluded.nickname,
-            email=excluded.email,
-            nationality=excluded.nationality,
-            updated_at=excluded.updated_at
-        """,
-        (
-            person["person_id"],
-            person["gov_id_number"],
-            person["date_of_birth"],
-            person["official_name"],
-            person.get("call_name"),
-            person.get("nickname"),
-            person.get("email"),
-            person.get("nationality"),
-            person["created_at"],
-            person["updated_at"],
-        ),
+    with transaction() as con:
+        con.execute(_PERSON_UPSERT, person_row(person))
+
+
+def upsert_people(rows: list[tuple]) -> None:
+    if not rows:
+        return
+    with transaction() as con:
+        con.executemany(_PERSON_UPSERT, rows)
+
+
+def find_person_by_gov_id(gov_id_number: str) -> Optional[sqlite3.Row]:
+    return get_connection().execute(
+        "SELECT * FROM people WHERE gov_id_number=? ORDER BY person_id LIMIT 1", (gov_id_number,)
+    ).fetchone()
+
+
+_CERT_INSERT = """
+    INSERT INTO certificates(cert_number, cert_type, issued_at, receiver_person_id, giver_person_id,
+                             receiver_name_used, giver_name_used, valid_until, status,
+                             sign_code, sign_requested_at, signed_at, pdf_relpath)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def cert_row(cert: dict[str, Any]) -> tuple:
+    # Same dict as create_certificate(), for inserting many with create_certificates().
+    return (
+        cert["cert_number"],
+        cert["cert_type"],
+        cert["issued_at"],
+        cert["receiver_person_id"],
+        cert["giver_person_id"],
+        cert["receiver_name_used"],
+        cert["giver_name_used"],
+        cert["valid_until"],
+        cert["status"],
+        cert.get("sign_code"),
+        cert.get("sign_requested_at"),
+        cert.get("signed_at"),
+        cert.get("pdf_relpath"),
     )
-    con.commit()
-    con.close()
 
 
 def create_certificate(cert: dict[str, Any]) -> None:
-    con = connect()
-    con.execute(
-        """
-        INSERT INTO certificates(cert_number, cert_type, issued_at, receiver_person_id, giver_person_id,
-                                 receiver_name_used, giver_name_used, valid_until, status,
-                                 sign_code, sign_requested_at, signed_at, pdf_relpath)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            cert["cert_number"],
-            cert["cert_type"],
-            cert["issued_at"],
-            cert["receiver_person_id"],
-            cert["giver_person_id"],
-            cert["receiver_name_used"],
-            cert["giver_name_used"],
-            cert["valid_until"],
-            cert["status"],
-            cert.get("sign_code"),
-            cert.get("sign_requested_at"),
-            cert.get("signed_at"),
-            cert.get("pdf_relpath"),
-        ),
+    with transaction() as con:
+        con.execute(_CERT_INSERT, cert_row(cert))
+
+
+def create_certificates(rows: list[tuple]) -> None:
+    if not rows:
+        return
+    with transaction() as con:
+        con.executemany(_CERT_INSERT, rows)
+
+
+# Sortable certificate list columns -> SQL expression (see fetch_certificates_page).
+CERT_SORT_KEYS = {
+    "cert_number": "c.cert_number",
+    "cert_type": "c.cert_type",
+    "receiver": "TRIM(COALESCE(NULLIF(pr.call_name, ''), pr.official_name))",
+    "giver": "TRIM(COALESCE(NULLIF(pg.call_name, ''), pg.official_name))",
+    "issued_at": "c.issued_at",
+    "valid_until": "c.valid_until",
+    "validity": "CASE WHEN c.valid_until >= :now THEN 'VALID' ELSE 'EXPIRED' END",
+    "status": "c.status",
+}
+
+
+def fetch_certificates_page(
+    sort: str = "cert_number",
+    descending: bool = True,
+    after: Optional[tuple[Any, str]] = None,
+    limit: int = 500,
+    now: Optional[str] = None,
+) -> list[sqlite3.Row]:
+    # One keyset page of the certificate list, display names resolved and
+    # VALID/EXPIRED computed in SQL. `after` is the (sort_key, cert_number) of
+    # the last row of the previous page.
+    key = CERT_SORT_KEYS[sort]
+    op, direction = ("<", "DESC") if descending else (">", "ASC")
+    where = f"WHERE ({key}, c.cert_number) {op} (:after_key, :after_cert)" if after else ""
+    params = {"now": now or now_iso(), "limit": limit}
+    if after:
+        params["after_key"], params["after_cert"] = after
+    return get_connection().execute(f"""
+    SELECT c.cert_number, c.cert_type, c.issued_at, c.valid_until, c.status,
+           {CERT_SORT_KEYS["receiver"]} AS receiver,
+           {CERT_SORT_KEYS["giver"]} AS giver,
+           {CERT_SORT_KEYS["validity"]} AS validity,
+           {key} AS sort_key
+      FROM certificates c
+      JOIN people pr ON pr.person_id = c.receiver_person_id
+      JOIN people pg ON pg.person_id = c.giver_person_id
+      {where}
+     ORDER BY sort_key {direction}, c.cert_number {direction}
+     LIMIT :limit
+    """, params).fetchall()
+
+
+_people_fts: dict[Path, bool] = {}
+
+
+def _has_people_fts() -> bool:
+    path = _database_file()
+    if path not in _people_fts:
+        row = get_connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'people_fts'"
+        ).fetchone()
+        _people_fts[path] = row is not None
+    return _people_fts[path]
+
+
+def search_people(query: str, limit: int = 200) -> list[sqlite3.Row]:
+    # Top `limit` people matching every word of `query` (case-insensitive
+    # substring) across names, gov id, person id and nationality.
+    con = get_connection()
+    words = query.split()
+    if not words:
+        return con.execute("SELECT * FROM people ORDER BY person_id DESC LIMIT ?", (limit,)).fetchall()
+
+    # Trigram tokens need at least three characters per word. Newest-first rowid
+    # order lets FTS5 stop after `limit` hits instead of ranking every match.
+    if _has_people_fts() and all(len(w) >= 3 for w in words):
+        match = " AND ".join('"' + w.replace('"', '""') + '"' for w in words)
+        return con.execute(
+            "SELECT p.* FROM people_fts JOIN people p ON p.rowid = people_fts.rowid "
+            "WHERE people_fts MATCH ? ORDER BY people_fts.rowid DESC LIMIT ?",
+            (match, limit),
+        ).fetchall()
+
+    haystack = (
+        "(COALESCE(official_name, '') || ' ' || COALESCE(call_name, '') || ' ' || COALESCE(nickname, '') || ' ' || "
+        "gov_id_number || ' ' || person_id || ' ' || COALESCE(nationality, ''))"
     )
-    con.commit()
-    con.close()
+    where = " AND ".join(f"{haystack} LIKE ? ESCAPE '\\'" for _ in words)
+    patterns = ["%" + w.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for w in words]
+    return con.execute(
+        f"SELECT * FROM people WHERE {where} ORDER BY person_id DESC LIMIT ?",
+        (*patterns, limit),
+    ).fetchall()
+
+
+def query_audit(
+    before_id: Optional[int] = None,
+    limit: int = 500,
+    action: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    result: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> list[sqlite3.Row]:
+    # Newest-first page of audit rows. Pass the smallest id of the previous
+    # page as before_id for the next one. since/until are ISO timestamps
+    # compared against ts (since inclusive, until exclusive).
+    clauses = []
+    params: list[Any] = []
+    for column, value in (
+        ("action", action),
+        ("entity_type", entity_type),
+        ("entity_id", entity_id),
+        ("result", result),
+    ):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until:
+        clauses.append("ts < ?")
+        params.append(until)
+    if before_id is not None:
+        clauses.append("id < ?")
+        params.append(before_id)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return get_connection().execute(
+        f"SELECT * FROM audit_log {where} ORDER BY id DESC LIMIT ?",
+        (*params, limit),
+    ).fetchall()
+
+
+def iso_after(ts: str, days: float) -> str:
+    # ts (canonical form, see now_iso) moved forward by `days`.
+    moved = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ") + timedelta(days=days)
+    return moved.isoformat(timespec="seconds") + "Z"
+
+
+def _expiry_page(where: str, params: tuple, after: Optional[tuple[str, str]], limit: int) -> list[sqlite3.Row]:
+    if after is not None:
+        where += " AND (valid_until, cert_number) > (?, ?)"
+        params += tuple(after)
+    return get_connection().execute(
+        f"""
+        SELECT cert_number, cert_type, receiver_person_id, giver_person_id, valid_until, status, expired_at
+        FROM certificates WHERE {where}
+        ORDER BY valid_until, cert_number LIMIT ?
+        """,
+        (*params, limit),
+    ).fetchall()
+
+
+def certificates_expired_as_of(
+    as_of: Optional[str] = None, after: Optional[tuple[str, str]] = None, limit: int = 500
+) -> list[sqlite3.Row]:
+    # Certificates whose validity ended before as_of (default now), oldest
+    # first. Pass (valid_until, cert_number) of the last row as after for the
+    # next page; every page is a range scan of idx_certificates_valid_until.
+    return _expiry_page("valid_until < ?", (as_of or now_iso(),), after, limit)
+
+
+def certificates_expiring_within(
+    days: int, now: Optional[str] = None, after: Optional[tuple[str, str]] = None, limit: int = 500
+) -> list[sqlite3.Row]:
+    # Still valid at now (default: current time) but ending within `days`.
+    now = now or now_iso()
+    return _expiry_page("valid_until >= ? AND valid_until < ?", (now, iso_after(now, days)), after, limit)
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Any, Callable, Optional, Sequence
+
+from . import db
+from . import emailer
+from .settings_store import load_settings
+
+
+@dataclass(frozen=True)
+class SignatureRequest:
+    cert_number: str
+    to_email: str
+    sign_code: str
+    cert_summary: str
+
+
+@dataclass(frozen=True)
+class RenewalNotice:
+    cert_number: str
+    to_email: str
+    valid_until: str
+    cert_summary: str
+
+
+@dataclass
+class SendResult:
+    cert_number: str
+    to_email: str
+    ok: bool
+    attempts: int
+    error: Optional[str] = None
+    # The server refused the message for good (5xx); sending again will not help.
+    permanent: bool = False
+
+
+def _is_transient(e: Exception) -> bool:
+    # 4xx replies and dropped connections are worth retrying; 5xx are final.
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    # SMTPException subclasses OSError; the remaining ones (e.g.
+    # SMTPNotSupportedError) are protocol problems a retry will not fix.
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+class _BatchAborted(Exception):
+    # Raised instead of connecting once a login/connect failure has ended the batch.
+    pass
+
+
+class _RateLimiter:
+    # Spaces sends evenly across all workers; per_second <= 0 disables it.
+    def __init__(self, per_second: float):
+        self._interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class _SessionPool:
+    # One authenticated SMTP session per worker thread, reused across messages
+    # and recycled after max_per_session sends or any transient failure.
+    # Sessions are opened one at a time. A permanent connect/login failure
+    # (e.g. a bad password), or more than `retries` transient ones in a row,
+    # sets `failed` and no session is opened after that: a bad password costs
+    # one login attempt per batch, not one per message (which can get the
+    # account locked).
+    def __init__(self, factory: Callable[[], smtplib.SMTP], max_per_session: int, retries: int, logger=None):
+        self._factory = factory
+        self._max_per_session = max_per_session
+        self._retries = retries
+        self._logger = logger
+        self._local = threading.local()
+        self._all: list[smtplib.SMTP] = []
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._connect_failures = 0
+        self.failed: Optional[str] = None
+
+    def get(self) -> smtplib.SMTP:
+        smtp = getattr(self._local, "smtp", None)
+        if smtp is not None and self._local.sent >= self._max_per_session:
+            self.discard()
+            smtp = None
+        if smtp is None:
+            with self._connect_lock:
+                if self.failed is not None:
+                    raise _BatchAborted(self.failed)
+                try:
+                    smtp = self._factory()
+                except Exception as e:
+                    self._connect_failures += 1
+                    if not _is_transient(e) or self._connect_failures > self._retries:
+                        self.failed = f"SMTP connect/login failed: {e}"
+                        if self._logger:
+                            self._logger.error(f"{self.failed}; remaining messages not sent.")
+                    raise
+                self._connect_failures = 0
+            self._local.smtp = smtp
+            self._local.sent = 0
+            with self._lock:
+                self._all.append(smtp)
+        self._local.sent += 1
+        return smtp
+
+    def discard(self) -> None:
+        smtp = getattr(self._local, "smtp", None)
+        self._local.smtp = None
+        if smtp is not None:
+            with self._lock:
+                if smtp in self._all:
+                    self._all.remove(smtp)
+            _close_quietly(smtp)
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions, self._all = self._all, []
+        for smtp in sessions:
+            _close_quietly(smtp)
+
+
+def _close_quietly(smtp: smtplib.SMTP) -> None:
+    try:
+        smtp.quit()
+    except Exception:
+        smtp.close()
+
+
+def dispatch_emails(
+    requests: Sequence[Any],
+    build_message: Callable[[str, Any], EmailMessage],
+    audit_action: str,
+    logger=None,
+    workers: int = 4,
+    rate_per_second: float = 5.0,
+    retries: int = 3,
+    retry_delay: float = 2.0,
+    max_per_session: int = 100,
+    session_factory: Optional[Callable[[], smtplib.SMTP]] = None,
+    actor: str = "system",
+) -> list[SendResult]:
+    # Sends one email per request over a small pool of reused SMTP sessions.
+    # Requests need cert_number and to_email; build_message(from_email, req)
+    # makes the message. Returns one SendResult per request (same order) and
+    # records all outcomes under audit_action in a single transaction.
+    # session_factory() must return a ready-to-send SMTP connection; by default
+    # it connects to the configured server with STARTTLS and logs in.
+    if not requests:
+        return []
+
+    s = load_settings()
+    system_email, pwd = emailer.smtp_credentials(s)
+    if session_factory is None:
+        session_factory = lambda: emailer.open_smtp(s, system_email, pwd)  # noqa: E731
+
+    pool = _SessionPool(session_factory, max_per_session, retries, logger)
+    limiter = _RateLimiter(rate_per_second)
+
+    def send_one(req) -> SendResult:
+        msg = build_message(system_email, req)
+        attempt = 0
+        while True:
+            attempt += 1
+            limiter.wait()
+            try:
+                smtp = pool.get()
+            except _BatchAborted as e:
+                return SendResult(req.cert_number, req.to_email, False, attempt - 1, f"not sent: {e}")
+            except Exception as e:
+                # Connecting or logging in failed; the pool decides whether
+                # that ends the batch.
+                if pool.failed is not None:
+                    return SendResult(req.cert_number, req.to_email, False, attempt, str(e))
+                time.sleep(retry_delay * 2 ** min(attempt - 1, retries))
+                continue
+            try:
+                smtp.send_message(msg)
+                return SendResult(req.cert_number, req.to_email, True, attempt)
+            except Exception as e:
+                # A permanent refusal leaves the session usable; anything else may not.
+                refused = not _is_transient(e) and isinstance(
+                    e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException)
+                )
+                if not refused:
+                    pool.discard()
+                if attempt > retries or not _is_transient(e):
+                    if logger:
+                        logger.warning(f"{audit_action} for {req.cert_number} failed: {e}")
+                    return SendResult(req.cert_number, req.to_email, False, attempt, str(e), refused)
+                time.sleep(retry_delay * 2 ** (attempt - 1))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="smtp") as ex:
+            results = list(ex.map(send_one, requests))
+    finally:
+        pool.close_all()
+
+    db.log_audit_many([
+        db.audit_row(
+            audit_action, "CERT", r.cert_number,
+            "OK" if r.ok else "ERROR",
+            f"Sent to {r.to_email}" if r.ok
+            else f"Send to {r.to_email} failed after {r.attempts} attempt(s): {r.error}" if r.attempts
+            else f"Send to {r.to_email} skipped, {r.error}",
+            actor=actor,
+        )
+        for r in results
+    ])
+    if logger:
+        sent = sum(r.ok for r in results)
+        logger.info(f"{audit_action}: dispatched {sent}/{len(results)} emails.")
+    return results
+
+
+def dispatch_signature_requests(requests: Sequence[SignatureRequest], logger=None, **options) -> list[SendResult]:
+    # options: see dispatch_emails().
+    return dispatch_emails(
+        requests,
+        lambda sender, r: emailer.build_signature_request(sender, r.to_email, r.cert_number, r.sign_code, r.cert_summary),
+        "SEND_SIGN_EMAIL",
+        logger,
+        **options,
+    )
+
+
+def dispatch_renewal_notices(notices: Sequence[RenewalNotice], logger=None, **options) -> list[SendResult]:
+    # options: see dispatch_emails().
+    return dispatch_emails(
+        notices,
+        lambda sender, n: emailer.build_renewal_notice(sender, n.to_email, n.cert_number, n.valid_until, n.cert_summary),
+        "SEND_RENEWAL_NOTICE",
+        logger,
+        **options,
+    )
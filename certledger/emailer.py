@@ -1,65 +1,69 @@
 from __future__ import annotations
 
 import hashlib
-import imaplib
-import smtplib
+import re
+import threading
 import email
+from dataclasses import dataclass, field
 from email.message import EmailMessage
 from email.header import decode_header
 from email.utils import parseaddr
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
 
-import keyring
-
-from .settings_store import load_settings, save_settings
+from .settings_store import Settings, load_settings, update_settings
+from . import credentials
 from . import db
 
-SERVICE_NAME = "CertLedger"
+if TYPE_CHECKING:
+    import smtplib
+
+SERVICE_NAME = credentials.SERVICE_NAME
 
 
 def _normalize_email(addr: str) -> str:
     return (addr or "").strip().lower()
 
 
-def _ensure_windows_keyring(logger=None) -> None:
-    # Only attempt to force WinVault backend if it exists.
-    try:
-        from keyring.backends import Windows
-        keyring.set_keyring(Windows.WinVaultKeyring())
-        if logger:
-            logger.info(f"Keyring backend forced: {keyring.get_keyring()}")
-    except Exception as e:
-        if logger:
-            logger.info(f"Keyring backend not forced (ok): {e}")
-
-
 def set_app_password(system_email: str, app_password: str) -> None:
-    system_email = _normalize_email(system_email)
-    keyring.set_password(SERVICE_NAME, system_email, app_password)
+    credentials.set_password(_normalize_email(system_email), app_password)
 
 
 def get_app_password(system_email: str) -> Optional[str]:
-    system_email = _normalize_email(system_email)
-    return keyring.get_password(SERVICE_NAME, system_email)
+    # Cached per process; set_app_password() refreshes it.
+    return credentials.get_password(_normalize_email(system_email))
 
 
-def send_signature_request(to_email: str, cert_number: str, sign_code: str, cert_summary: str, logger=None) -> None:
-    s = load_settings()
+def smtp_credentials(s: Settings) -> Tuple[str, str]:
     system_email = _normalize_email(s.system_email)
-
-    _ensure_windows_keyring(logger)
-
     pwd = get_app_password(system_email) if system_email else None
     if not system_email:
         raise RuntimeError("System email not set in Settings.")
     if not pwd:
         raise RuntimeError(
-            f"App password not found in keyring for {system_email}. "
+            f"App password not found in {credentials.backend_name()} for {system_email}. "
             "Go to Settings -> Set/Change app password."
         )
+    return system_email, pwd
+
+
+def open_smtp(s: Settings, system_email: str, pwd: str) -> smtplib.SMTP:
+    import smtplib
+    smtp = smtplib.SMTP(s.smtp_host, s.smtp_port)
+    try:
+        smtp.starttls()
+        smtp.login(system_email, pwd)
+    except Exception as e:
+        smtp.close()
+        if isinstance(e, smtplib.SMTPAuthenticationError):
+            # The stored password may have changed outside CertLedger; look it up again next time.
+            credentials.invalidate(system_email)
+        raise
+    return smtp
+
 
+def build_signature_request(from_email: str, to_email: str, cert_number: str, sign_code: str, cert_summary: str) -> EmailMessage:
     msg = EmailMessage()
-    msg["From"] = system_email
+    msg["From"] = from_email
     msg["To"] = to_email
     msg["Subject"] = f"SIGN REQUEST: {cert_number}"
 
@@ -72,10 +76,29 @@ def send_signature_request(to_email: str, cert_number: str, sign_code: str, cert
         f"{cert_summary}\n"
     )
     msg.set_content(body)
+    return msg
 
-    with smtplib.SMTP(s.smtp_host, s.smtp_port) as smtp:
-        smtp.starttls()
-        smtp.login(system_email, pwd)
+
+def build_renewal_notice(from_email: str, to_email: str, cert_number: str, valid_until: str, cert_summary: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = from_email
+    msg["To"] = to_email
+    msg["Subject"] = f"RENEWAL NOTICE: {cert_number} expires {valid_until[:10]}"
+    msg.set_content(
+        f"Certificate {cert_number} is valid until {valid_until}.\n"
+        "Please arrange a renewal with the issuer before then.\n\n"
+        "Certificate summary:\n"
+        f"{cert_summary}\n"
+    )
+    return msg
+
+
+def send_signature_request(to_email: str, cert_number: str, sign_code: str, cert_summary: str, logger=None) -> None:
+    s = load_settings()
+    system_email, pwd = smtp_credentials(s)
+    msg = build_signature_request(system_email, to_email, cert_number, sign_code, cert_summary)
+
+    with open_smtp(s, system_email, pwd) as smtp:
         smtp.send_message(msg)
 
 
@@ -113,149 +136,472 @@ def _hash_text(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
-def _store_evidence(
-    con,
+_EVIDENCE_INSERT = (
+    "INSERT INTO email_evidence(cert_number, received_at, from_email, subject, body_hash, message_id, matched, notes) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _evidence_row(
     cert_number: str | None,
     subject: str,
     from_email: str,
-    body: str,
+    body: str | None,
     message_id: str | None,
     matched: int,
     notes: str,
-) -> None:
-    con.execute(
-        "INSERT INTO email_evidence(cert_number, received_at, from_email, subject, body_hash, message_id, matched, notes) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (cert_number, db.now_iso(), from_email, subject, _hash_text(body), message_id, matched, notes),
+) -> tuple:
+    # body is None when the scanner never downloaded it (subject matched no pending cert).
+    return (cert_number, db.now_iso(), from_email, subject, "" if body is None else _hash_text(body), message_id, matched, notes)
+
+
+# Mailbox scan pipeline: headers for UID chunks -> pre-filter subjects against
+# certificates awaiting signature -> size-capped body fetch for candidates only.
+FETCH_CHUNK = 500
+BODY_FETCH_LIMIT = 64 * 1024
+_HEADER_FIELDS = "FROM SUBJECT MESSAGE-ID CONTENT-TYPE CONTENT-TRANSFER-ENCODING"
+_UID_RE = re.compile(rb"UID (\d+)")
+# A BODY[...] value sent inline rather than as a {n} literal: "..." or NIL
+# (servers commonly answer an empty body with "").
+_INLINE_BODY_RE = re.compile(rb'BODY\[[^\]]*\](?:<\d+>)?\s+("(?:[^"\\]|\\.)*"|NIL)', re.IGNORECASE)
+# Scans in a row that may miss a candidate's body before it is given up on.
+BODY_FETCH_ATTEMPTS = 3
+
+
+@dataclass
+class _Envelope:
+    uid: int
+    from_email: str
+    subject: str
+    message_id: Optional[str]
+    header: bytes
+
+
+def _uid_set(uids: list[int]) -> str:
+    # Compress sorted UIDs into an IMAP sequence set: 1:4,7,9:12
+    parts = []
+    start = prev = uids[0]
+    for uid in uids[1:]:
+        if uid == prev + 1:
+            prev = uid
+            continue
+        parts.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = uid
+    parts.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(parts)
+
+
+def _parse_fetch(data) -> dict[int, bytes]:
+    # imaplib yields (prefix, literal) tuples followed by b")" closers. Most servers
+    # put "UID n" in the prefix, but it may also trail the literal.
+    out: dict[int, bytes] = {}
+    pending: Optional[bytes] = None
+    for item in data or []:
+        if isinstance(item, tuple):
+            m = _UID_RE.search(item[0])
+            if m:
+                out[int(m.group(1))] = item[1]
+                pending = None
+            else:
+                pending = item[1]
+        elif isinstance(item, bytes) and pending is not None:
+            m = _UID_RE.search(item)
+            if m:
+                out[int(m.group(1))] = pending
+            pending = None
+        elif isinstance(item, bytes):
+            m, value = _UID_RE.search(item), _INLINE_BODY_RE.search(item)
+            if m and value:
+                out[int(m.group(1))] = _inline_value(value.group(1))
+    return out
+
+
+def _inline_value(token: bytes) -> bytes:
+    if token.upper() == b"NIL":
+        return b""
+    return re.sub(rb"\\(.)", rb"\1", token[1:-1])
+
+
+def _fetch_envelopes(imap, uids: list[int]) -> list[_Envelope]:
+    typ, data = imap.uid("fetch", _uid_set(uids), f"(UID BODY.PEEK[HEADER.FIELDS ({_HEADER_FIELDS})])")
+    if typ != "OK":
+        raise RuntimeError("IMAP header fetch failed.")
+    envelopes = []
+    for uid, header in sorted(_parse_fetch(data).items()):
+        msg = email.message_from_bytes(header)
+        envelopes.append(_Envelope(
+            uid=uid,
+            from_email=_normalize_email(parseaddr(msg.get("From", ""))[1]),
+            subject=_decode_mime_header(msg.get("Subject", "")).strip(),
+            message_id=msg.get("Message-ID", None),
+            header=header,
+        ))
+    return envelopes
+
+
+def _fetch_bodies(imap, envelopes: list[_Envelope]) -> dict[int, str]:
+    if not envelopes:
+        return {}
+    typ, data = imap.uid(
+        "fetch", _uid_set([e.uid for e in envelopes]), f"(UID BODY.PEEK[TEXT]<0.{BODY_FETCH_LIMIT}>)"
     )
+    if typ != "OK":
+        raise RuntimeError("IMAP body fetch failed.")
+    raw = _parse_fetch(data)
+    bodies = {}
+    for e in envelopes:
+        if e.uid in raw:
+            # Re-attach the content headers so MIME parts decode as before.
+            msg = email.message_from_bytes(e.header.rstrip(b"\r\n") + b"\r\n\r\n" + raw[e.uid])
+            bodies[e.uid] = _norm_body(_extract_text_plain(msg))
+    return bodies
+
+
+def _search_new_uids(imap, last_uid: int) -> list[int]:
+    typ, data = imap.uid("search", None, f"UID {last_uid + 1}:*")
+    if typ != "OK":
+        raise RuntimeError("IMAP search failed.")
+    # "n:*" always matches the newest message, even when its UID is below n.
+    uids = [int(u) for u in (data[0].split() if data and data[0] else [])]
+    return sorted(u for u in uids if u > last_uid)
+
+
+@dataclass(frozen=True)
+class _PendingCert:
+    sign_code: str
+    allowed: frozenset[str]
+
+
+class SignRequestIndex:
+    # In-memory map of certs awaiting signature: cert_number -> sign code and the
+    # receiver/giver addresses allowed to sign. Reloaded only when the trigger-
+    # maintained sign_index_generation changes, so matching never hits the DB.
+    def __init__(self) -> None:
+        self._entries: dict[str, _PendingCert] = {}
+        self._generation: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        with self._lock, db.transaction() as con:
+            generation = db.get_state("sign_index_generation")
+            if generation is not None and generation == self._generation:
+                return
+            rows = con.execute("""
+            SELECT c.cert_number, c.sign_code, pr.email AS r_email, pg.email AS g_email
+              FROM certificates c
+              LEFT JOIN people pr ON pr.person_id = c.receiver_person_id
+              LEFT JOIN people pg ON pg.person_id = c.giver_person_id
+             WHERE c.status = 'SIGN_REQUESTED'
+            """).fetchall()
+            self._entries = {
+                r["cert_number"]: _PendingCert(
+                    sign_code=(r["sign_code"] or "").strip(),
+                    allowed=frozenset(_normalize_email(a) for a in (r["r_email"], r["g_email"]) if a),
+                )
+                for r in rows
+            }
+            self._generation = generation
 
+    def invalidate(self) -> None:
+        self._generation = None
 
-def scan_inbox_and_apply_signatures(logger) -> Tuple[int, int]:
-    db.init_db()
+    def get(self, cert_number: str) -> Optional[_PendingCert]:
+        return self._entries.get(cert_number)
 
-    s = load_settings()
-    system_email = _normalize_email(s.system_email)
+    def discard(self, cert_number: str) -> None:
+        self._entries.pop(cert_number, None)
+
+    def __contains__(self, cert_number: str) -> bool:
+        return cert_number in self._entries
+
+
+_sign_index = SignRequestIndex()
+
+
+# DB-side checkpoints, one per mailbox, committed in the same transaction as
+# each scanned chunk: app_state[IMAP_CHECKPOINT_PREFIX + "<email>|<host>:<port>|<folder>"]
+# holds "<UIDVALIDITY>:<last scanned UID>". A different UIDVALIDITY means the
+# server renumbered the folder, which is then scanned from the start again.
+IMAP_CHECKPOINT_PREFIX = "imap_checkpoint:"
+# The value scans last mirrored into Settings.last_imap_uid. Any other value
+# there was set by hand (lowered to rescan, or raised to skip) and is used once.
+IMAP_SETTINGS_UID_KEY = "imap_settings_uid"
+# The single checkpoint of older versions; adopted by the first mailbox scanned.
+_LEGACY_CHECKPOINT_KEY = "imap_last_uid"
+
+
+@dataclass
+class _ScanBatch:
+    evidence: list[tuple] = field(default_factory=list)
+    signed: list[tuple] = field(default_factory=list)
+    audit: list[tuple] = field(default_factory=list)
+    signed_log: list[tuple[str, str]] = field(default_factory=list)
+
+
+def _commit_batch(batch: _ScanBatch, checkpoint_key: str, checkpoint: str) -> None:
+    with db.transaction(immediate=True) as con:
+        con.executemany(_EVIDENCE_INSERT, batch.evidence)
+        con.executemany(
+            "UPDATE certificates SET status='SIGNED', signed_at=? WHERE cert_number=? AND status='SIGN_REQUESTED'",
+            batch.signed,
+        )
+        db.log_audit_many(batch.audit)
+        db.set_state(checkpoint_key, checkpoint)
+
+
+def _checkpoint_key(s: Settings) -> str:
+    server = f"{s.imap_host.strip().lower()}:{int(s.imap_port)}"
+    return f"{IMAP_CHECKPOINT_PREFIX}{_normalize_email(s.system_email)}|{server}|{s.imap_folder}"
+
+
+def _uidvalidity(imap) -> str:
+    # From the SELECT response; imaplib keeps it until someone reads it.
+    values = imap.untagged_responses.get("UIDVALIDITY") or []
+    value = values[-1] if values else b""
+    return (value.decode() if isinstance(value, bytes) else str(value)).strip()
+
+
+def _start_uid(s: Settings, key: str, uidvalidity: str, logger) -> int:
+    # The UID this mailbox's scan continues after, with the checkpoint (and a
+    # hand-edited Settings.last_imap_uid, once used) recorded.
+    stored = db.get_state(key)
+    mirrored = db.get_state(IMAP_SETTINGS_UID_KEY)
+    wanted = int(s.last_imap_uid)
+    edited = mirrored is not None and wanted != int(mirrored)
+    if edited:
+        logger.info(f"Mailbox scan continuing after UID {wanted}, as set in settings.")
+        start = wanted
+    elif stored is None and mirrored is None:
+        # First scan since checkpoints became per mailbox: the old ones
+        # belonged to the only mailbox used so far.
+        start = max(wanted, int(db.get_state(_LEGACY_CHECKPOINT_KEY, "0")))
+    elif stored is None:
+        logger.info(f"Mailbox {s.system_email} on {s.imap_host}:{s.imap_port}/{s.imap_folder} not scanned before; scanning all of it.")
+        start = 0
+    else:
+        validity, _, last = stored.partition(":")
+        start = int(last)
+        if validity != uidvalidity:
+            logger.warning(
+                f"UIDVALIDITY of {s.imap_host}/{s.imap_folder} changed ({validity or '-'} -> {uidvalidity or '-'}); "
+                "its UIDs were renumbered, so it is scanned from the start."
+            )
+            start = 0
+    with db.transaction(immediate=True) as con:
+        db.set_state(key, f"{uidvalidity}:{start}")
+        if edited or mirrored is None:
+            db.set_state(IMAP_SETTINGS_UID_KEY, wanted)
+        con.execute("DELETE FROM app_state WHERE key = ?", (_LEGACY_CHECKPOINT_KEY,))
+    return start
+
+
+# Manual scans and the background watcher may overlap; only one runs at a time
+# and the next one resumes from the DB checkpoint the previous one committed.
+_scan_lock = threading.Lock()
+# (checkpoint key, UIDVALIDITY, UID) -> scans that could not fetch this
+# candidate's body (guarded by _scan_lock).
+_body_fetch_failures: dict[tuple[str, str, int], int] = {}
+
+
+def scan_mailbox(
+    imap,
+    s: Settings,
+    logger,
+    progress: Optional[Callable[[int, int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Tuple[int, int]:
+    # Runs one scan pass over the already selected folder of an authenticated
+    # IMAP connection. Each fetched chunk is written in one transaction
+    # together with the folder's UID checkpoint, so a crash resumes exactly
+    # after the last committed chunk. The checkpoint reached is mirrored into
+    # s.last_imap_uid and settings.json. progress(done, total) is called after
+    # each chunk; should_stop() is checked before the next one.
+    with _scan_lock:
+        return _scan_mailbox(imap, s, logger, progress, should_stop)
+
+
+def _scan_mailbox(imap, s: Settings, logger, progress, should_stop) -> Tuple[int, int]:
+    matched = 0
+    processed = 0
 
-    _ensure_windows_keyring(logger)
+    key, uidvalidity = _checkpoint_key(s), _uidvalidity(imap)
+    s.last_imap_uid = _start_uid(s, key, uidvalidity, logger)
+    uids = _search_new_uids(imap, s.last_imap_uid)
+    pending = _sign_index
+    pending.refresh()
+
+    for i in range(0, len(uids), FETCH_CHUNK):
+        if should_stop and should_stop():
+            logger.info(f"Mailbox scan cancelled after {processed} of {len(uids)} emails.")
+            break
+        chunk = uids[i:i + FETCH_CHUNK]
+        envelopes = _fetch_envelopes(imap, chunk)
+        wanted = [e for e in envelopes if e.subject in pending]
+        bodies = _fetch_bodies(imap, wanted)
+        missing = [e for e in wanted if e.uid not in bodies]
+        if missing:
+            # Some servers drop bodies from a large FETCH response; ask once more.
+            bodies.update(_fetch_bodies(imap, missing))
+            missing = [e for e in missing if e.uid not in bodies]
+        unfetchable = set()
+        for e in wanted:
+            if e.uid in bodies:
+                _body_fetch_failures.pop((key, uidvalidity, e.uid), None)
+        for e in missing:
+            failure = (key, uidvalidity, e.uid)
+            _body_fetch_failures[failure] = _body_fetch_failures.get(failure, 0) + 1
+            if _body_fetch_failures[failure] >= BODY_FETCH_ATTEMPTS:
+                del _body_fetch_failures[failure]
+                unfetchable.add(e.uid)
+                logger.warning(
+                    f"Mailbox scan skipped UID {e.uid} ({e.subject}): its body could not be fetched "
+                    f"in {BODY_FETCH_ATTEMPTS} scans."
+                )
+        missing = [e for e in missing if e.uid not in unfetchable]
+
+        # Advance past the whole chunk, including UIDs expunged since the search,
+        # unless a possible signature's body is still missing: then the chunk
+        # ends just before it, so the next scan starts with that message again.
+        last_uid = missing[0].uid - 1 if missing else chunk[-1]
+
+        batch = _ScanBatch()
+        for e in envelopes:
+            if e.uid > last_uid:
+                break
+            processed += 1
+            if e.uid in unfetchable:
+                batch.evidence.append(_evidence_row(
+                    e.subject, e.subject, e.from_email, None, e.message_id, 0,
+                    "Body could not be fetched from the server; not applied.",
+                ))
+                continue
+            if _apply_message(s, e, bodies.get(e.uid), pending, batch):
+                matched += 1
+                pending.discard(e.subject)
+
+        try:
+            _commit_batch(batch, key, f"{uidvalidity}:{last_uid}")
+        except Exception:
+            # Certs discarded above were not signed after all; reload next time.
+            pending.invalidate()
+            raise
+        s.last_imap_uid = last_uid
+
+        for cert_number, from_email in batch.signed_log:
+            logger.info(f"SIGNED: {cert_number} via {from_email}")
+        if progress:
+            progress(processed, len(uids))
+        if missing:
+            logger.warning(
+                f"Mailbox scan stopped at UID {missing[0].uid} ({missing[0].subject}): "
+                "its body could not be fetched. It is tried again next scan."
+            )
+            break
+
+    # Settings first: should this stop in between, the next scan only sees an
+    # "edited" value equal to the checkpoint.
+    update_settings(last_imap_uid=s.last_imap_uid)
+    db.set_state(IMAP_SETTINGS_UID_KEY, s.last_imap_uid)
+    return matched, processed
 
+
+def _apply_message(s: Settings, e: _Envelope, body_n: Optional[str], pending: SignRequestIndex, batch: _ScanBatch) -> bool:
+    from_email, subject, message_id = e.from_email, e.subject, e.message_id
+
+    cert = pending.get(subject) if body_n is not None else None
+    if not cert:
+        batch.evidence.append(_evidence_row(
+            None, subject, from_email, body_n, message_id, 0,
+            "No matching cert in SIGN_REQUESTED with subject=cert_number.",
+        ))
+        return False
+
+    cert_number = subject
+
+    if s.require_from_match:
+        if not cert.allowed:
+            batch.evidence.append(_evidence_row(
+                cert_number, subject, from_email, body_n, message_id, 0,
+                "From-match enabled but receiver/giver have no email on file.",
+            ))
+            return False
+
+        if from_email not in cert.allowed:
+            batch.evidence.append(_evidence_row(
+                cert_number, subject, from_email, body_n, message_id, 0,
+                "From-address did not match receiver/giver email on file.",
+            ))
+            return False
+
+    if not cert.sign_code or body_n != cert.sign_code:
+        batch.evidence.append(_evidence_row(
+            cert_number, subject, from_email, body_n, message_id, 0,
+            "Body did not exactly equal sign_code.",
+        ))
+        return False
+
+    batch.signed.append((db.now_iso(), cert_number))
+    batch.evidence.append(_evidence_row(
+        cert_number, subject, from_email, body_n, message_id, 1,
+        "Signature matched and certificate signed.",
+    ))
+    batch.audit.append(db.audit_row("CONFIRM_SIGN", "CERT", cert_number, "OK", f"Signed via email from {from_email}."))
+    batch.signed_log.append((cert_number, from_email))
+    return True
+
+
+IMAP_TIMEOUT = 60.0
+
+
+def open_imap(s: Settings, logger, imap_factory=None):
+    # Returns an authenticated connection with s.imap_folder selected, or None
+    # when the mailbox is not configured. imap_factory(host, port, timeout=...)
+    # defaults to IMAP4_SSL; pass imaplib.IMAP4 to talk to a local plain-text
+    # test server. Every socket read gives up after IMAP_TIMEOUT seconds, so a
+    # half-open connection raises instead of hanging the caller.
+    system_email = _normalize_email(s.system_email)
     pwd = get_app_password(system_email) if system_email else None
 
     # Do NOT error if not configured; just skip.
     if not system_email or not pwd:
         logger.info(
-            f"Mailbox scan skipped. system_email='{system_email}' pwd_present={bool(pwd)} backend={keyring.get_keyring()}"
+            f"Mailbox scan skipped. system_email='{system_email}' pwd_present={bool(pwd)} backend={credentials.backend_name()}"
         )
-        return 0, 0
-
-    matched = 0
-    processed = 0
+        return None
 
-    con = db.connect()
+    if imap_factory is None:
+        import imaplib
+        imap_factory = imaplib.IMAP4_SSL
+    imap = imap_factory(s.imap_host, s.imap_port, timeout=IMAP_TIMEOUT)
     try:
-        with imaplib.IMAP4_SSL(s.imap_host, s.imap_port) as imap:
+        try:
             imap.login(system_email, pwd)
-            imap.select(s.imap_folder)
-
-            start_uid = int(s.last_imap_uid) + 1
-            typ, data = imap.uid("search", None, f"UID {start_uid}:*")
-            if typ != "OK":
-                raise RuntimeError("IMAP search failed.")
-
-            uids = data[0].split() if data and data[0] else []
-
-            for uid_b in uids:
-                uid = int(uid_b.decode("ascii"))
-                typ, msg_data = imap.uid("fetch", uid_b, "(RFC822)")
-                if typ != "OK" or not msg_data or not msg_data[0]:
-                    continue
-
-                raw = msg_data[0][1]
-                msg = email.message_from_bytes(raw)
-
-                from_email = _normalize_email(parseaddr(msg.get("From", ""))[1])
-                subject = _decode_mime_header(msg.get("Subject", "")).strip()
-                message_id = msg.get("Message-ID", None)
-
-                body = _extract_text_plain(msg)
-                body_n = _norm_body(body)
-
-                processed += 1
-                s.last_imap_uid = max(int(s.last_imap_uid), uid)
-
-                cert_row = con.execute(
-                    "SELECT * FROM certificates WHERE cert_number = ? AND status = 'SIGN_REQUESTED'",
-                    (subject,),
-                ).fetchone()
-
-                if not cert_row:
-                    _store_evidence(
-                        con, None, subject, from_email, body_n, message_id, 0,
-                        "No matching cert in SIGN_REQUESTED with subject=cert_number.",
-                    )
-                    con.commit()
-                    continue
-
-                cert_number = cert_row["cert_number"]
-
-                if s.require_from_match:
-                    recv = con.execute(
-                        "SELECT email FROM people WHERE person_id = ?",
-                        (cert_row["receiver_person_id"],),
-                    ).fetchone()
-                    give = con.execute(
-                        "SELECT email FROM people WHERE person_id = ?",
-                        (cert_row["giver_person_id"],),
-                    ).fetchone()
-
-                    allowed = set()
-                    if recv and recv["email"]:
-                        allowed.add(_normalize_email(recv["email"]))
-                    if give and give["email"]:
-                        allowed.add(_normalize_email(give["email"]))
-
-                    if not allowed:
-                        _store_evidence(
-                            con, cert_number, subject, from_email, body_n, message_id, 0,
-                            "From-match enabled but receiver/giver have no email on file.",
-                        )
-                        con.commit()
-                        continue
-
-                    if from_email not in allowed:
-                        _store_evidence(
-                            con, cert_number, subject, from_email, body_n, message_id, 0,
-                            "From-address did not match receiver/giver email on file.",
-                        )
-                        con.commit()
-                        continue
-
-                sign_code = (cert_row["sign_code"] or "").strip()
-                if not sign_code or body_n != sign_code:
-                    _store_evidence(
-                        con, cert_number, subject, from_email, body_n, message_id, 0,
-                        "Body did not exactly equal sign_code.",
-                    )
-                    con.commit()
-                    continue
-
-                con.execute(
-                    "UPDATE certificates SET status='SIGNED', signed_at=? WHERE cert_number=?",
-                    (db.now_iso(), cert_number),
-                )
-                _store_evidence(
-                    con, cert_number, subject, from_email, body_n, message_id, 1,
-                    "Signature matched and certificate signed.",
-                )
-                con.commit()
-
-                db.log_audit("CONFIRM_SIGN", "CERT", cert_number, "OK", f"Signed via email from {from_email}.")
-                matched += 1
-                logger.info(f"SIGNED: {cert_number} via {from_email}")
-
-            imap.logout()
+        except imap.error:
+            # Possibly a password changed outside CertLedger; look it up again next time.
+            credentials.invalidate(system_email)
+            raise
+        typ, _ = imap.select(s.imap_folder)
+        if typ != "OK":
+            raise RuntimeError(f"IMAP select failed for folder {s.imap_folder}.")
+    except Exception:
+        imap.shutdown()
+        raise
+    return imap
+
+
+def scan_inbox_and_apply_signatures(
+    logger,
+    progress: Optional[Callable[[int, int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Tuple[int, int]:
+    db.init_db()
 
-    finally:
-        con.close()
+    s = load_settings()
+    imap = open_imap(s, logger)
+    if imap is None:
+        return 0, 0
 
-    save_settings(s)
+    with imap:
+        matched, processed = scan_mailbox(imap, s, logger, progress, should_stop)
+        imap.logout()
     return matched, processed
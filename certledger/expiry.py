@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+from . import db
+from . import ledger
+from .settings_store import load_settings
+
+# How many due notices one scheduler pass sends at most.
+NOTICE_BATCH = 500
+# Certificates marked expired per transaction, so catching up on a large
+# backlog never holds the write lock for long.
+EXPIRE_BATCH = 1000
+
+
+def mark_expired(now: Optional[str] = None, actor: str = "system", batch_size: int = EXPIRE_BATCH) -> list[str]:
+    # Records the expiry of every certificate whose validity has ended and
+    # that has not been marked yet: expired_at = valid_until plus an EXPIRE
+    # audit row, batch_size certificates per transaction. Only the partial
+    # index of unmarked rows is scanned, so a pass with nothing to do costs
+    # one index probe.
+    now = now or db.now_iso()
+    marked: list[str] = []
+    while True:
+        with db.transaction(immediate=True) as con:
+            rows = con.execute(
+                "SELECT cert_number, valid_until FROM certificates WHERE expired_at IS NULL AND valid_until < ? "
+                "ORDER BY valid_until LIMIT ?",
+                (now, batch_size),
+            ).fetchall()
+            if not rows:
+                return marked
+            con.executemany(
+                "UPDATE certificates SET expired_at = valid_until WHERE cert_number = ?",
+                [(r["cert_number"],) for r in rows],
+            )
+            db.log_audit_many([
+                db.audit_row("EXPIRE", "CERT", r["cert_number"], "OK", f"Validity ended {r['valid_until']}.", actor=actor)
+                for r in rows
+            ])
+        marked += [r["cert_number"] for r in rows]
+        if len(rows) < batch_size:
+            return marked
+
+
+def renewal_notices_due(days: int, now: Optional[str] = None, limit: int = NOTICE_BATCH) -> list[sqlite3.Row]:
+    # Certificates expiring within `days` whose receiver has an email address
+    # and has not been notified (or permanently refused) yet, soonest first,
+    # with everything the notice needs (see ledger.summary_from_row).
+    now = now or db.now_iso()
+    return db.get_connection().execute(
+        """
+        SELECT c.cert_number, c.cert_type, c.issued_at, c.valid_until, p.email,
+               p.call_name AS receiver_call_name, p.official_name AS receiver_official_name,
+               g.call_name AS giver_call_name, g.official_name AS giver_official_name
+        FROM certificates c
+        JOIN people p ON p.person_id = c.receiver_person_id
+        JOIN people g ON g.person_id = c.giver_person_id
+        WHERE c.valid_until >= ? AND c.valid_until < ?
+          AND c.renewal_notice_at IS NULL AND COALESCE(p.email, '') <> ''
+        ORDER BY c.valid_until, c.cert_number LIMIT ?
+        """,
+        (now, db.iso_after(now, days), limit),
+    ).fetchall()
+
+
+def send_renewal_notices(days: int, logger=None, actor: str = "system", **options) -> tuple[int, int]:
+    # Emails receivers of certificates expiring within `days` (one notice per
+    # certificate) through the bulk dispatcher. Returns (sent, due).
+    # Certificates whose notice the server refused for good (5xx) are marked
+    # too, with the reason in renewal_notice_error, so they are not retried
+    # every pass and cannot crowd the others out of the batch; transient
+    # failures stay due.
+    from .dispatcher import RenewalNotice, dispatch_renewal_notices
+
+    notices = [
+        RenewalNotice(r["cert_number"], r["email"], r["valid_until"], ledger.summary_from_row(r))
+        for r in renewal_notices_due(days)
+    ]
+    if not notices:
+        return 0, 0
+
+    results = dispatch_renewal_notices(notices, logger=logger, actor=actor, **options)
+    done = [(r.cert_number, None if r.ok else r.error) for r in results if r.ok or r.permanent]
+    if done:
+        now = db.now_iso()
+        with db.transaction() as con:
+            con.executemany(
+                "UPDATE certificates SET renewal_notice_at = ?, renewal_notice_error = ? WHERE cert_number = ?",
+                [(now, error, n) for n, error in done],
+            )
+    return sum(r.ok for r in results), len(notices)
+
+
+class ExpiryScheduler(threading.Thread):
+    # Periodically marks expired certificates and, when renewal_notice_days is
+    # set, emails renewal notices. on_change(expired) is called after a pass
+    # that marked anything. Without a usable SMTP account the notices are
+    # skipped, with one warning until the problem changes.
+    def __init__(self, logger, on_change: Optional[Callable[[int], None]] = None, interval: float = 15 * 60):
+        super().__init__(name="ExpiryScheduler", daemon=True)
+        self.logger = logger
+        self.on_change = on_change
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._smtp_problem: Optional[str] = None
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self) -> None:
+        db.init_db()
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                self.logger.exception("Expiry scheduler pass failed.")
+            self._stopping.wait(self.interval)
+        db.close_connection()
+
+    def run_once(self) -> None:
+        expired = mark_expired()
+        if expired:
+            self.logger.info(f"Marked {len(expired)} certificates expired.")
+            if self.on_change:
+                self.on_change(len(expired))
+        s = load_settings()
+        if s.renewal_notice_days > 0 and self._smtp_ready(s):
+            sent, due = send_renewal_notices(s.renewal_notice_days, self.logger)
+            if due:
+                self.logger.info(f"Sent {sent}/{due} renewal notices.")
+
+    def _smtp_ready(self, s) -> bool:
+        from . import emailer
+
+        try:
+            emailer.smtp_credentials(s)
+        except RuntimeError as e:
+            if str(e) != self._smtp_problem:
+                self.logger.warning(f"Renewal notices skipped until email is set up: {e}")
+            self._smtp_problem = str(e)
+            return False
+        self._smtp_problem = None
+        return True
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import json
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from . import db
+
+# Rows fetched per round trip; also the Parquet row group size.
+EXPORT_CHUNK = 5000
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+
+@dataclass(frozen=True)
+class _Dataset:
+    table: str
+    order: str
+    # filter name -> SQL condition with one placeholder
+    filters: dict[str, str]
+
+
+def _date_filters(column: str) -> dict[str, str]:
+    # since inclusive, until exclusive; plain dates compare fine against ISO timestamps.
+    return {"since": f"{column} >= ?", "until": f"{column} < ?"}
+
+
+DATASETS = {
+    "certificates": _Dataset("certificates", "cert_number", {
+        "status": "status = ?",
+        "cert_type": "cert_type = ?",
+        "expired_as_of": "valid_until < ?",
+        **_date_filters("issued_at"),
+    }),
+    "people": _Dataset("people", "person_id", {
+        "nationality": "nationality = ?",
+        **_date_filters("created_at"),
+    }),
+    "evidence": _Dataset("email_evidence", "id", {
+        "cert_number": "cert_number = ?",
+        "matched": "matched = ?",
+        **_date_filters("received_at"),
+    }),
+    "audit": _Dataset("audit_log", "id", {
+        "action": "action = ?",
+        "entity_type": "entity_type = ?",
+        "entity_id": "entity_id = ?",
+        "result": "result = ?",
+        **_date_filters("ts"),
+    }),
+}
+
+
+def format_for(path: str | Path) -> tuple[str, bool]:
+    # (format, gzip) from a file name such as audit.jsonl.gz.
+    suffixes = [s.lower() for s in Path(path).suffixes]
+    compressed = bool(suffixes) and suffixes[-1] == ".gz"
+    if compressed:
+        suffixes.pop()
+    ext = suffixes[-1].lstrip(".") if suffixes else ""
+    if ext == "ndjson":
+        ext = "jsonl"
+    return (ext if ext in FORMATS else "csv"), compressed
+
+
+def _query(dataset: str, filters: dict[str, Any]) -> tuple[str, list[Any]]:
+    spec = DATASETS.get(dataset)
+    if spec is None:
+        raise RuntimeError(f"Unknown dataset {dataset!r}; choose from {', '.join(DATASETS)}.")
+    clauses, params = [], []
+    for name, value in filters.items():
+        if value in (None, ""):
+            continue
+        if name not in spec.filters:
+            raise RuntimeError(f"{dataset} cannot be filtered by {name!r}.")
+        clauses.append(spec.filters[name])
+        params.append(value)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return f"SELECT * FROM {spec.table}{where} ORDER BY {spec.order}", params
+
+
+def _chunks(cur, chunk_size: int) -> Iterator[list[tuple]]:
+    while rows := cur.fetchmany(chunk_size):
+        yield rows
+
+
+def export(
+    dataset: str,
+    path: str | Path,
+    fmt: Optional[str] = None,
+    compress: Optional[bool] = None,
+    chunk_size: int = EXPORT_CHUNK,
+    progress: Optional[Callable[[int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    **filters: Any,
+) -> int:
+    # Streams one dataset (see DATASETS) to path and returns the row count.
+    # Rows go from the cursor to the file chunk by chunk, so memory stays
+    # bounded by chunk_size whatever the table size. fmt and compress default
+    # to what the file name says (.csv/.jsonl/.parquet, optional .gz);
+    # path "-" writes csv/jsonl to stdout.
+    guessed, gz = format_for(path)
+    fmt = fmt or guessed
+    compress = gz if compress is None else compress
+    if fmt not in FORMATS:
+        raise RuntimeError(f"Unknown export format {fmt!r}; choose from {', '.join(FORMATS)}.")
+
+    sql, params = _query(dataset, filters)
+    # Own short-lived connection returning plain tuples (much cheaper than
+    # sqlite3.Row at millions of rows); closing it ends the read snapshot.
+    con = db.connect()
+    con.row_factory = None
+    try:
+        cur = con.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        chunks = _chunks(cur, chunk_size)
+        if fmt == "parquet":
+            types = {r[1]: r[2].upper() for r in con.execute(f"PRAGMA table_info({DATASETS[dataset].table})")}
+            return _write_parquet(path, columns, types, chunks, progress, should_stop)
+
+        if str(path) == "-":
+            out = sys.stdout
+        elif compress:
+            out = io.TextIOWrapper(gzip.open(path, "wb", compresslevel=6), encoding="utf-8", newline="")
+        else:
+            out = open(path, "w", encoding="utf-8", newline="")
+        try:
+            return _write_text(out, fmt, columns, chunks, progress, should_stop)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    finally:
+        con.close()
+
+
+def _write_text(out, fmt, columns, chunks, progress, should_stop) -> int:
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        write = writer.writerows
+    else:
+        def write(rows):
+            out.writelines(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in rows)
+    for rows in chunks:
+        if should_stop and should_stop():
+            break
+        write(rows)
+        count += len(rows)
+        if progress:
+            progress(count)
+    return count
+
+
+def _write_parquet(path, columns, types, chunks, progress, should_stop) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).") from None
+
+    # Every CertLedger column is declared TEXT or INTEGER.
+    schema = pa.schema([
+        pa.field(name, pa.int64() if types.get(name) == "INTEGER" else pa.string()) for name in columns
+    ])
+    count = 0
+    # One row group per chunk keeps memory bounded; zstd keeps files small.
+    with pq.ParquetWriter(str(path), schema, compression="zstd") as writer:
+        for rows in chunks:
+            if should_stop and should_stop():
+                break
+            data = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=f.type) for values, f in zip(data, schema)], schema=schema
+            ))
+            count += len(rows)
+            if progress:
+                progress(count)
+    return count
@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import csv
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from . import db
+from .ledger import MAX_VALID_DAYS, NAME_CHOICES, valid_until_for
+
+# Rows per transaction: large enough to amortise the commit, small enough
+# that a failed chunk is cheap to retry and the write lock is held briefly.
+IMPORT_CHUNK = 5000
+
+
+@dataclass
+class RowError:
+    line: int
+    message: str
+
+
+@dataclass
+class ImportReport:
+    total: int = 0
+    imported: int = 0
+    dry_run: bool = False
+    errors: list[RowError] = field(default_factory=list)
+    first: Optional[str] = None
+    last: Optional[str] = None
+    stopped: bool = False
+    # People imports only: how the imported rows split up.
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    # Rows folded into a later row for the same government id.
+    merged: int = 0
+
+    def summary(self) -> str:
+        verb = "Would import" if self.dry_run else "Imported"
+        text = f"{verb} {self.imported} of {self.total} rows; {len(self.errors)} errors."
+        if self.updated or self.unchanged:
+            text += f" {self.created} new, {self.updated} updated, {self.unchanged} unchanged."
+        if self.merged:
+            text += f" {self.merged} duplicate rows merged into a later row."
+        if self.first:
+            text += f" Numbers {self.first} .. {self.last}."
+        if self.stopped:
+            text += " Stopped early."
+        return text
+
+
+def read_records(path: str | Path) -> Iterator[tuple[int, dict[str, Any]]]:
+    # Streams (line number, record) from a CSV file with a header row, or from
+    # JSON lines when the extension is .jsonl/.ndjson. Blank lines are skipped.
+    path = Path(path)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            for line, text in enumerate(f, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    record = json.loads(text)
+                except ValueError as e:
+                    record = {"__error__": f"Invalid JSON: {e}"}
+                if not isinstance(record, dict):
+                    record = {"__error__": "Expected a JSON object."}
+                yield line, record
+        else:
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+
+
+def write_error_report(errors: Iterable[RowError], path: str | Path) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["line", "error"])
+        writer.writerows((e.line, e.message) for e in errors)
+
+
+def _text(record: dict[str, Any], *keys: str) -> str:
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+class _PersonResolver:
+    # Maps a receiver/giver reference (person id or government id) to a
+    # person_id, one query per chunk for all references not seen before.
+    def __init__(self):
+        self._cache: dict[str, Optional[str]] = {}
+
+    def load(self, refs: set[str]) -> None:
+        missing = [r for r in refs if r not in self._cache]
+        if not missing:
+            return
+        for r in missing:
+            self._cache[r] = None
+        con = db.get_connection()
+        keys = json.dumps(missing)
+        for person_id, gov_id in con.execute(
+            """
+            SELECT person_id, gov_id_number FROM people
+            WHERE person_id IN (SELECT value FROM json_each(?1))
+               OR gov_id_number IN (SELECT value FROM json_each(?1))
+            """,
+            (keys,),
+        ):
+            # An exact person id wins over a government id that happens to match.
+            if gov_id in self._cache and self._cache[gov_id] is None:
+                self._cache[gov_id] = person_id
+            if person_id in self._cache:
+                self._cache[person_id] = person_id
+
+    def get(self, ref: str) -> Optional[str]:
+        return self._cache.get(ref)
+
+
+def _validate(record: dict[str, Any], people: _PersonResolver, default_days: int) -> dict[str, Any]:
+    if "__error__" in record:
+        raise ValueError(record["__error__"])
+    cert_type = _text(record, "cert_type", "type")
+    if not cert_type:
+        raise ValueError("Certificate type is required.")
+
+    parties = {}
+    for role in ("receiver", "giver"):
+        ref = _text(record, f"{role}_person_id", role)
+        if not ref:
+            raise ValueError(f"{role.capitalize()} is required.")
+        person_id = people.get(ref)
+        if person_id is None:
+            raise ValueError(f"{role.capitalize()} {ref!r} does not exist.")
+        name_used = _text(record, f"{role}_name_used", "name_used") or "official"
+        if name_used not in NAME_CHOICES:
+            raise ValueError(f"{role.capitalize()} name used must be one of: {', '.join(NAME_CHOICES)}.")
+        parties[role] = (person_id, name_used)
+
+    days_text = _text(record, "valid_days", "validity")
+    try:
+        days = int(days_text) if days_text else default_days
+    except ValueError:
+        raise ValueError(f"Validity {days_text!r} is not a number of days.") from None
+    if not 1 <= days <= MAX_VALID_DAYS:
+        raise ValueError(f"Validity must be between 1 and {MAX_VALID_DAYS} days.")
+
+    return {
+        "cert_type": cert_type,
+        "receiver_person_id": parties["receiver"][0],
+        "giver_person_id": parties["giver"][0],
+        "receiver_name_used": parties["receiver"][1],
+        "giver_name_used": parties["giver"][1],
+        "valid_days": days,
+    }
+
+
+def import_certificates(
+    records: Iterable[tuple[int, dict[str, Any]]],
+    dry_run: bool = False,
+    default_valid_days: int = 365,
+    chunk_size: int = IMPORT_CHUNK,
+    actor: str = "system",
+    source: str = "",
+    progress: Optional[Callable[[int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> ImportReport:
+    # Issues one certificate per valid record; invalid records are reported
+    # and skipped. Each chunk allocates its number block, inserts the
+    # certificates and writes their audit rows in one transaction, so a chunk
+    # is either fully imported or not at all.
+    # records are (line, dict) pairs as produced by read_records().
+    report = ImportReport(dry_run=dry_run)
+    people = _PersonResolver()
+    note = f"Certificate created (bulk import{' ' + source if source else ''})."
+
+    for chunk in _chunks(records, chunk_size):
+        if should_stop and should_stop():
+            report.stopped = True
+            break
+        report.total += len(chunk)
+        people.load({
+            ref
+            for _, record in chunk
+            for ref in (_text(record, "receiver_person_id", "receiver"), _text(record, "giver_person_id", "giver"))
+            if ref
+        })
+
+        valid = []
+        for line, record in chunk:
+            try:
+                valid.append(_validate(record, people, default_valid_days))
+            except ValueError as e:
+                report.errors.append(RowError(line, str(e)))
+
+        if valid and not dry_run:
+            now = datetime.utcnow()
+            issued = db.now_iso()
+            with db.transaction(immediate=True):
+                numbers = db.reserve_cert_numbers(now.year, len(valid))
+                certs, audit = [], []
+                for number, v in zip(numbers, valid):
+                    days = v.pop("valid_days")
+                    v.update(
+                        cert_number=number,
+                        issued_at=issued,
+                        valid_until=valid_until_for(days, now),
+                        status="ISSUED",
+                    )
+                    certs.append(db.cert_row(v))
+                    audit.append(db.audit_row("CREATE_CERT", "CERT", number, "OK", note, actor=actor))
+                db.create_certificates(certs)
+                db.log_audit_many(audit)
+            report.first = report.first or numbers[0]
+            report.last = numbers[-1]
+        report.imported += len(valid)
+        if progress:
+            progress(report.total)
+
+    if not dry_run and report.total:
+        db.log_audit(
+            "BULK_IMPORT_CERTS", "FILE", source or "-",
+            "OK" if not report.errors else "PARTIAL", report.summary(), actor=actor,
+        )
+    return report
+
+
+# Person fields a people import may set; optional ones may be blanked.
+_PERSON_REQUIRED = ("gov_id_number", "date_of_birth", "official_name")
+_PERSON_OPTIONAL = ("call_name", "nickname", "email", "nationality")
+
+
+def _person_fields(record: dict[str, Any]) -> dict[str, Any]:
+    # Only columns present in the record are returned, so an update leaves
+    # fields the file does not mention untouched.
+    if "__error__" in record:
+        raise ValueError(record["__error__"])
+    fields: dict[str, Any] = {}
+    for key in _PERSON_REQUIRED:
+        if key in record:
+            value = _text(record, key)
+            if not value:
+                raise ValueError(f"{key} must not be empty.")
+            fields[key] = value
+    for key in _PERSON_OPTIONAL:
+        if key in record:
+            fields[key] = _text(record, key) or None
+    if "gov_id_number" not in fields:
+        raise ValueError("gov_id_number is required.")
+    return fields
+
+
+def import_people(
+    records: Iterable[tuple[int, dict[str, Any]]],
+    dry_run: bool = False,
+    chunk_size: int = IMPORT_CHUNK,
+    actor: str = "system",
+    source: str = "",
+    progress: Optional[Callable[[int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> ImportReport:
+    # Creates or updates people keyed by gov_id_number (see
+    # _migration_9_people_gov_id_index). Rows identical to the stored person
+    # are skipped; changed rows are written with an EDIT_PERSON audit row
+    # holding only the changed fields. A later row for the same government id
+    # overrides an earlier one. Works chunk by chunk, so memory does not grow
+    # with the file; a dry run does remember the people it would have written,
+    # so a government id seen again in a later chunk counts as it would for real.
+    report = ImportReport(dry_run=dry_run)
+    note = f" (bulk import{' ' + source if source else ''})"
+    would_write: dict[str, dict[str, Any]] = {}
+
+    for chunk in _chunks(records, chunk_size):
+        if should_stop and should_stop():
+            report.stopped = True
+            break
+        report.total += len(chunk)
+
+        # Last row per government id wins within the chunk.
+        incoming: dict[str, tuple[int, dict[str, Any]]] = {}
+        for line, record in chunk:
+            try:
+                fields = _person_fields(record)
+            except ValueError as e:
+                report.errors.append(RowError(line, str(e)))
+                continue
+            gov = fields["gov_id_number"]
+            if gov in incoming:
+                incoming[gov] = (line, {**incoming[gov][1], **fields})
+                report.merged += 1
+            else:
+                incoming[gov] = (line, fields)
+                report.imported += 1
+
+        con = db.get_connection()
+        existing = {
+            r["gov_id_number"]: dict(r)
+            for r in con.execute(
+                # ORDER BY DESC so the lowest person_id wins if legacy duplicates exist.
+                "SELECT * FROM people WHERE gov_id_number IN (SELECT value FROM json_each(?)) ORDER BY person_id DESC",
+                (json.dumps(list(incoming)),),
+            )
+        }
+        existing.update((gov, would_write[gov]) for gov in incoming if gov in would_write)
+
+        now = db.now_iso()
+        new, changed = [], []
+        for gov, (line, fields) in incoming.items():
+            before = existing.get(gov)
+            if before is None:
+                missing = [k for k in _PERSON_REQUIRED if k not in fields]
+                if missing:
+                    report.errors.append(RowError(line, f"New person needs {', '.join(missing)}."))
+                    report.imported -= 1
+                    continue
+                new.append({**dict.fromkeys(_PERSON_OPTIONAL), **fields, "created_at": now, "updated_at": now})
+                continue
+            diff = {k: v for k, v in fields.items() if before[k] != v}
+            if not diff:
+                report.unchanged += 1
+                continue
+            changed.append((before, diff))
+
+        report.created += len(new)
+        report.updated += len(changed)
+        if dry_run:
+            for person in new:
+                would_write[person["gov_id_number"]] = person
+            for before, diff in changed:
+                would_write[before["gov_id_number"]] = {**before, **diff}
+        if dry_run or not (new or changed):
+            if progress:
+                progress(report.total)
+            continue
+
+        with db.transaction(immediate=True):
+            rows, audit = [], []
+            if new:
+                for person_id, person in zip(db.reserve_person_ids(len(new)), new):
+                    person["person_id"] = person_id
+                    rows.append(db.person_row(person))
+                    audit.append(db.audit_row(
+                        "CREATE_PERSON", "PERSON", person_id, "OK", "Person created" + note + ".",
+                        actor=actor, after_json=json.dumps(person, ensure_ascii=False),
+                    ))
+                report.first = report.first or new[0]["person_id"]
+                report.last = new[-1]["person_id"]
+            for before, diff in changed:
+                rows.append(db.person_row({**before, **diff, "updated_at": now}))
+                audit.append(db.audit_row(
+                    "EDIT_PERSON", "PERSON", before["person_id"], "OK",
+                    f"Person edited{note}: {', '.join(diff)}.", actor=actor,
+                    before_json=json.dumps({k: before[k] for k in diff}, ensure_ascii=False),
+                    after_json=json.dumps(diff, ensure_ascii=False),
+                ))
+            db.upsert_people(rows)
+            db.log_audit_many(audit)
+        if progress:
+            progress(report.total)
+
+    if not dry_run and report.total:
+        db.log_audit(
+            "BULK_IMPORT_PEOPLE", "FILE", source or "-",
+            "OK" if not report.errors else "PARTIAL", report.summary(), actor=actor,
+        )
+    return report
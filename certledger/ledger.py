@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional
+
+from . import db
+
+# Core certificate operations shared by the GUI and the CLI. Keep this module
+# free of Qt and of the mail/keyring stack so headless commands start fast.
+
+NAME_CHOICES = ("official", "call", "nickname")
+MAX_VALID_DAYS = 3650
+
+
+def valid_until_for(valid_days: int, issued: datetime) -> str:
+    return (issued + timedelta(days=int(valid_days))).isoformat(timespec="seconds") + "Z"
+
+
+def _require_person(con, person_id: str, role: str) -> None:
+    if not con.execute("SELECT 1 FROM people WHERE person_id=?", (person_id,)).fetchone():
+        raise RuntimeError(f"{role} {person_id!r} does not exist.")
+
+
+def issue_certificate(
+    cert_type: str,
+    receiver_person_id: str,
+    giver_person_id: str,
+    valid_days: int = 365,
+    receiver_name_used: str = "official",
+    giver_name_used: str = "official",
+) -> str:
+    cert_type = (cert_type or "").strip()
+    if not cert_type:
+        raise RuntimeError("Certificate type is required.")
+    if receiver_name_used not in NAME_CHOICES or giver_name_used not in NAME_CHOICES:
+        raise RuntimeError(f"Name used must be one of: {', '.join(NAME_CHOICES)}.")
+    if not 1 <= int(valid_days) <= MAX_VALID_DAYS:
+        raise RuntimeError(f"Validity must be between 1 and {MAX_VALID_DAYS} days.")
+    con = db.get_connection()
+    _require_person(con, receiver_person_id, "Receiver")
+    _require_person(con, giver_person_id, "Giver")
+
+    year = datetime.utcnow().year
+    cert_number = db.next_cert_number(year)
+    issued = db.now_iso()
+    valid_until = valid_until_for(valid_days, datetime.utcnow())
+
+    cert = {
+        "cert_number": cert_number,
+        "cert_type": cert_type,
+        "issued_at": issued,
+        "receiver_person_id": receiver_person_id,
+        "giver_person_id": giver_person_id,
+        "receiver_name_used": receiver_name_used,
+        "giver_name_used": giver_name_used,
+        "valid_until": valid_until,
+        "status": "ISSUED",
+        "pdf_relpath": None,
+    }
+    db.create_certificate(cert)
+    db.log_audit("CREATE_CERT", "CERT", cert_number, "OK", "Certificate created.")
+    return cert_number
+
+
+def _summary(cert, recv, give) -> str:
+    return (
+        f"Cert: {cert['cert_number']}\n"
+        f"Type: {cert['cert_type']}\n"
+        f"Issued: {cert['issued_at']}\n"
+        f"Valid until: {cert['valid_until']}\n"
+        f"Receiver: {(recv['call_name'] or recv['official_name'])}\n"
+        f"Giver: {(give['call_name'] or give['official_name'])}\n"
+    )
+
+
+def summary_from_row(row) -> str:
+    # The same summary from one joined row: the certificate's columns plus
+    # receiver_call_name, receiver_official_name, giver_call_name and
+    # giver_official_name (see expiry.renewal_notices_due).
+    recv = {"call_name": row["receiver_call_name"], "official_name": row["receiver_official_name"]}
+    give = {"call_name": row["giver_call_name"], "official_name": row["giver_official_name"]}
+    return _summary(row, recv, give)
+
+
+def certificate_summary(cert_number: str) -> tuple[Optional[str], str]:
+    # (receiver email, plain-text summary) for notification emails.
+    con = db.get_connection()
+    cert = con.execute("SELECT * FROM certificates WHERE cert_number=?", (cert_number,)).fetchone()
+    if cert is None:
+        raise RuntimeError(f"Certificate {cert_number} does not exist.")
+    recv = con.execute("SELECT * FROM people WHERE person_id=?", (cert["receiver_person_id"],)).fetchone()
+    give = con.execute("SELECT * FROM people WHERE person_id=?", (cert["giver_person_id"],)).fetchone()
+    return recv["email"], _summary(cert, recv, give)
+
+
+def prepare_signature_request(cert_number: str) -> tuple[str, str, str]:
+    # Assigns a fresh sign code, marks the certificate SIGN_REQUESTED and
+    # returns (receiver email, sign code, summary) for the request email.
+    sign_code = "S-" + secrets.token_hex(4).upper()
+
+    con = db.get_connection()
+    cert = con.execute("SELECT * FROM certificates WHERE cert_number=?", (cert_number,)).fetchone()
+    if cert is None:
+        raise RuntimeError(f"Certificate {cert_number} does not exist.")
+    recv = con.execute("SELECT * FROM people WHERE person_id=?", (cert["receiver_person_id"],)).fetchone()
+    give = con.execute("SELECT * FROM people WHERE person_id=?", (cert["giver_person_id"],)).fetchone()
+
+    if not recv["email"]:
+        raise RuntimeError("Receiver has no email set. Add it in the person profile.")
+
+    summary = _summary(cert, recv, give)
+
+    with db.transaction() as con:
+        con.execute(
+            "UPDATE certificates SET status='SIGN_REQUESTED', sign_code=?, sign_requested_at=? WHERE cert_number=?",
+            (sign_code, db.now_iso(), cert_number),
+        )
+
+    return recv["email"], sign_code, summary
+
+
+def certificates_with_status(status: str, limit: Optional[int] = None) -> list[str]:
+    con = db.get_connection()
+    sql = "SELECT cert_number FROM certificates WHERE status=? ORDER BY cert_number"
+    args: tuple = (status,)
+    if limit:
+        sql += " LIMIT ?"
+        args += (limit,)
+    return [r[0] for r in con.execute(sql, args)]
@@ -1,9 +1,42 @@
 from __future__ import annotations
+import atexit
+import json
 import logging
-from datetime import datetime
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from typing import Optional
 from .paths import ensure_dirs
 
-def setup_logging() -> logging.Logger:
+# Size-based rotation: app.log plus up to LOG_BACKUP_COUNT rotated files.
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    # One compact JSON object per line: ts, level, logger, thread, msg.
+    # QueueHandler has already folded any traceback into msg.
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(
+    json_lines: bool = False,
+    max_bytes: int = LOG_MAX_BYTES,
+    backup_count: int = LOG_BACKUP_COUNT,
+) -> logging.Logger:
+    # Log calls only enqueue the record; a QueueListener thread does the
+    # formatting and file I/O, so the GUI thread never blocks on disk.
+    global _listener
     dirs = ensure_dirs()
     logs_dir = dirs["logs"]
 
@@ -16,20 +49,42 @@ def setup_logging() -> logging.Logger:
 
     fmt = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
 
-    # Rolling-ish main log
-    file_handler = logging.FileHandler(logs_dir / "app.log", encoding="utf-8")
+    # Main log, rotated by size
+    file_handler = logging.handlers.RotatingFileHandler(
+        logs_dir / "app.log", maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+    )
     file_handler.setFormatter(fmt)
-    logger.addHandler(file_handler)
+    handlers: list[logging.Handler] = [file_handler]
 
-    # Session log
-    session_name = datetime.now().strftime("%Y-%m-%d_session.log")
-    session_handler = logging.FileHandler(logs_dir / session_name, encoding="utf-8")
-    session_handler.setFormatter(fmt)
-    logger.addHandler(session_handler)
+    # Structured log for grep/ingest (app.jsonl)
+    if json_lines:
+        json_handler = logging.handlers.RotatingFileHandler(
+            logs_dir / "app.jsonl", maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
 
     # Console (VS Code terminal)
     console = logging.StreamHandler()
     console.setFormatter(fmt)
-    logger.addHandler(console)
+    handlers.append(console)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
 
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
     return logger
+
+
+def shutdown_logging() -> None:
+    # Flush queued records and close the files; safe to call more than once.
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+from PySide6 import QtCore
+
+from . import db
+
+
+class KeysetTableModel(QtCore.QAbstractTableModel):
+    # Read-only table fed one keyset page at a time. The view pulls further
+    # pages through canFetchMore/fetchMore as it scrolls. Subclasses provide
+    # COLUMNS as (header, row key) pairs and _load_page(cursor) returning rows
+    # after the cursor, plus _cursor(row) for the last row of a page.
+    PAGE_SIZE = 500
+    COLUMNS: list[tuple[str, str]] = []
+
+    def __init__(self, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self._rows: list[tuple] = []
+        self._cursor_value: Any = None
+        self._has_more = True
+
+    def _load_page(self, cursor: Any) -> list:
+        raise NotImplementedError
+
+    def _cursor(self, row) -> Any:
+        raise NotImplementedError
+
+    def rowCount(self, parent=QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and index.isValid():
+            return self._rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.COLUMNS[section][0]
+        return None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()) -> bool:
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QtCore.QModelIndex()) -> None:
+        if parent.isValid():
+            return
+        page = self._load_page(self._cursor_value)
+        self._has_more = len(page) == self.PAGE_SIZE
+        if not page:
+            return
+        self._cursor_value = self._cursor(page[-1])
+        first = len(self._rows)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(page) - 1)
+        self._rows.extend(tuple(r[key] for _, key in self.COLUMNS) for r in page)
+        self.endInsertRows()
+
+    def refresh(self) -> None:
+        self.beginResetModel()
+        self._rows = []
+        self._cursor_value = None
+        self._has_more = True
+        self.endResetModel()
+        self.fetchMore()
+
+
+class CertTableModel(KeysetTableModel):
+    # Sorting re-queries SQL (see db.fetch_certificates_page).
+    COLUMNS = [
+        ("Cert #", "cert_number"),
+        ("Type", "cert_type"),
+        ("Receiver", "receiver"),
+        ("Giver", "giver"),
+        ("Issued", "issued_at"),
+        ("Valid until", "valid_until"),
+        ("Valid?", "validity"),
+        ("Status", "status"),
+    ]
+
+    def __init__(self, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self._sort = "cert_number"
+        self._descending = True
+        self._now = db.now_iso()
+
+    def _load_page(self, cursor):
+        return db.fetch_certificates_page(self._sort, self._descending, cursor, self.PAGE_SIZE, self._now)
+
+    def _cursor(self, row):
+        return (row["sort_key"], row["cert_number"])
+
+    def sort(self, column: int, order=QtCore.Qt.AscendingOrder) -> None:
+        self._sort = self.COLUMNS[column][1]
+        self._descending = order == QtCore.Qt.DescendingOrder
+        self.refresh()
+
+    def refresh(self) -> None:
+        self._now = db.now_iso()
+        super().refresh()
+
+    def cert_number_at(self, row: int) -> str:
+        return self._rows[row][0]
+
+
+class AuditLogModel(KeysetTableModel):
+    # Newest-first audit log, filtered with db.query_audit() keyword arguments.
+    COLUMNS = [
+        ("Timestamp", "ts"),
+        ("Action", "action"),
+        ("Entity", "entity"),
+        ("Result", "result"),
+        ("Message", "message"),
+    ]
+
+    def __init__(self, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self._filters: dict[str, Any] = {}
+
+    def set_filters(self, **filters: Any) -> None:
+        self._filters = {k: v for k, v in filters.items() if v}
+        self.refresh()
+
+    def _load_page(self, cursor):
+        rows = db.query_audit(before_id=cursor, limit=self.PAGE_SIZE, **self._filters)
+        return [{**dict(r), "entity": f"{r['entity_type']} {r['entity_id']}"} for r in rows]
+
+    def _cursor(self, row):
+        return row["id"]
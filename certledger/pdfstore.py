@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import db
+from .paths import ensure_dirs
+
+# PDFs live under data/pdfs/store/<2 hex>/<sha256>.pdf, so identical files are
+# stored once however many certificates point at them. certificates.pdf_relpath
+# is relative to data/pdfs; older installs kept data/pdfs/<CERT_NUMBER>.pdf,
+# which pdf_path() still falls back to.
+STORE_DIR = "store"
+HASH_CHUNK = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class PdfInfo:
+    sha256: str
+    size: int
+    relpath: str
+
+
+@dataclass
+class VerifyReport:
+    checked: int = 0
+    missing: list[str] = field(default_factory=list)
+    mismatched: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing and not self.mismatched
+
+    def summary(self) -> str:
+        return f"Checked {self.checked} PDFs: {len(self.missing)} missing, {len(self.mismatched)} mismatched."
+
+
+def hash_file(path: str | Path, chunk: int = HASH_CHUNK) -> tuple[str, int]:
+    # (sha256 hex, size). The file is memory-mapped and fed to the hash in
+    # chunks, so large PDFs are neither copied into Python memory nor read
+    # through a buffer twice.
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for offset in range(0, size, chunk):
+                        h.update(view[offset:offset + chunk])
+                finally:
+                    view.release()
+    return h.hexdigest(), size
+
+
+def _pdfs_dir() -> Path:
+    return ensure_dirs()["pdfs"]
+
+
+def _relpath_for(sha256: str) -> str:
+    return f"{STORE_DIR}/{sha256[:2]}/{sha256}.pdf"
+
+
+def store_file(src: str | Path) -> PdfInfo:
+    # Copies src into the store (unless identical content is already there)
+    # and returns its hash, size and store path.
+    src = Path(src)
+    with open(src, "rb") as f:
+        if f.read(5) != b"%PDF-":
+            raise RuntimeError(f"{src.name} is not a PDF file.")
+    sha256, size = hash_file(src)
+    relpath = _relpath_for(sha256)
+    dest = _pdfs_dir() / relpath
+    if not dest.exists():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # Copy under a temporary name and rename, so a crash never leaves a
+        # truncated file under a content hash it does not match.
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out, open(src, "rb") as inp:
+                shutil.copyfileobj(inp, out, HASH_CHUNK)
+            os.replace(tmp, dest)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+    return PdfInfo(sha256, size, relpath)
+
+
+def attach_pdf(cert_number: str, src: str | Path, actor: str = "system") -> PdfInfo:
+    con = db.get_connection()
+    before = con.execute(
+        "SELECT pdf_relpath, pdf_sha256, pdf_size FROM certificates WHERE cert_number=?", (cert_number,)
+    ).fetchone()
+    if before is None:
+        raise RuntimeError(f"Certificate {cert_number} does not exist.")
+    info = store_file(src)
+    with db.transaction() as con:
+        con.execute(
+            "UPDATE certificates SET pdf_relpath=?, pdf_sha256=?, pdf_size=? WHERE cert_number=?",
+            (info.relpath, info.sha256, info.size, cert_number),
+        )
+        db.log_audit(
+            "ATTACH_PDF", "CERT", cert_number, "OK", f"PDF attached ({info.size} bytes, sha256 {info.sha256[:12]}).",
+            actor=actor,
+            before_json=json.dumps(dict(before)) if before["pdf_sha256"] else None,
+            after_json=json.dumps({"pdf_relpath": info.relpath, "pdf_sha256": info.sha256, "pdf_size": info.size}),
+        )
+    return info
+
+
+def pdf_path(cert_number: str) -> Optional[Path]:
+    # The certificate's stored PDF, or the legacy <CERT_NUMBER>.pdf; None if neither exists.
+    row = db.get_connection().execute(
+        "SELECT pdf_relpath FROM certificates WHERE cert_number=?", (cert_number,)
+    ).fetchone()
+    pdfs = _pdfs_dir()
+    for candidate in ([pdfs / row["pdf_relpath"]] if row and row["pdf_relpath"] else []) + [pdfs / f"{cert_number}.pdf"]:
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def adopt_legacy(actor: str = "system", progress: Optional[Callable[[int], None]] = None) -> int:
+    # Moves old data/pdfs/<CERT_NUMBER>.pdf files into the store for
+    # certificates that have no stored PDF yet. The original file is kept.
+    pdfs = _pdfs_dir()
+    con = db.get_connection()
+    adopted = 0
+    for path in sorted(pdfs.glob("*.pdf")):
+        row = con.execute(
+            "SELECT pdf_sha256 FROM certificates WHERE cert_number=?", (path.stem,)
+        ).fetchone()
+        if row is None or row["pdf_sha256"]:
+            continue
+        attach_pdf(path.stem, path, actor=actor)
+        adopted += 1
+        if progress:
+            progress(adopted)
+    return adopted
+
+
+def _check(item: tuple[str, str, int]) -> tuple[str, Optional[str]]:
+    # Runs in a worker process: (relpath, problem or None).
+    path, sha256, size = item
+    try:
+        if os.path.getsize(path) != size:
+            return path, "mismatched"
+        return path, None if hash_file(path)[0] == sha256 else "mismatched"
+    except FileNotFoundError:
+        return path, "missing"
+
+
+def verify_store(
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> VerifyReport:
+    # Re-hashes every stored PDF referenced by a certificate across all cores
+    # and reports the certificates whose file is missing or no longer matches
+    # the recorded hash/size. Each distinct file is hashed once, however many
+    # certificates share it.
+    pdfs = _pdfs_dir()
+    by_file: dict[tuple[str, str, int], list[str]] = {}
+    for r in db.get_connection().execute(
+        "SELECT cert_number, pdf_relpath, pdf_sha256, pdf_size FROM certificates "
+        "WHERE pdf_sha256 IS NOT NULL ORDER BY pdf_sha256"
+    ):
+        key = (str(pdfs / r["pdf_relpath"]), r["pdf_sha256"], r["pdf_size"])
+        by_file.setdefault(key, []).append(r["cert_number"])
+
+    report = VerifyReport()
+    items = list(by_file)
+    if not items:
+        return report
+    # Imported here: it pulls in multiprocessing, which nothing else at startup needs.
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        # Small files dominate, so hand each worker batches rather than single paths.
+        chunksize = max(1, min(256, len(items) // (workers * 8)))
+        for done, (item, (_, problem)) in enumerate(zip(items, ex.map(_check, items, chunksize=chunksize)), start=1):
+            report.checked += len(by_file[item])
+            if problem == "missing":
+                report.missing += by_file[item]
+            elif problem:
+                report.mismatched += by_file[item]
+            if progress and (done % 1000 == 0 or done == len(items)):
+                progress(done, len(items))
+    return report
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
 import json
-from dataclasses import dataclass, asdict
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, asdict, fields, replace
 from pathlib import Path
+from typing import Callable, Optional
 
 from .paths import settings_path
 
@@ -19,20 +24,43 @@ class Settings:
     imap_port: int = 993
     imap_folder: str = "INBOX"
 
-    # Last processed IMAP UID
+    # Last processed IMAP UID of the current mailbox folder, mirrored from the
+    # database checkpoint after each scan. Lower it to rescan from there.
     last_imap_uid: int = 0
 
     # Security rules
     require_from_match: bool = True
 
+    # Email receivers this many days before a certificate expires (0 = off)
+    renewal_notice_days: int = 0
+
+    # Also write logs/app.jsonl (one JSON object per record)
+    log_json: bool = False
+
+
+# settings.json is parsed once and cached for the whole process. Each
+# load_settings() only stats the file: a different mtime, size or inode
+# (another process saved, or the file was replaced) triggers a re-read.
+# Callers always get their own copy, so mutating it never touches the cache.
+# Subscribers are called as callback(old, new) whenever the values change,
+# on the thread that saved or noticed the change; GUI code must hop to its
+# own thread (e.g. through a Qt signal).
+SettingsCallback = Callable[[Settings, Settings], None]
+
+
+def changed_fields(old: Settings, new: Settings) -> set[str]:
+    return {f.name for f in fields(Settings) if getattr(old, f.name) != getattr(new, f.name)}
+
+
+def _stamp(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
 
-def load_settings() -> Settings:
-    path: Path = settings_path()
-    if not path.exists():
-        s = Settings()
-        save_settings(s)
-        return s
 
+def _parse(path: Path) -> Settings:
     data = json.loads(path.read_text(encoding="utf-8"))
     # Ignore unknown fields if you previously had different settings.json keys
     valid_keys = set(Settings.__dataclass_fields__.keys())
@@ -40,6 +68,116 @@ def load_settings() -> Settings:
     return Settings(**filtered)
 
 
+def _write_atomic(path: Path, s: Settings) -> None:
+    # Written to a temporary file and renamed over settings.json, so readers
+    # (and a crash mid-write) never see a half-written file.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".settings.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps(asdict(s), indent=2))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class SettingsService:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._path: Optional[Path] = None
+        self._stamp: Optional[tuple] = None
+        self._cached: Optional[Settings] = None
+        self._subscribers: list[SettingsCallback] = []
+
+    def subscribe(self, callback: SettingsCallback) -> Callable[[], None]:
+        # Returns a function that removes the subscription again.
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def load(self) -> Settings:
+        with self._lock:
+            old, new = self._refresh()
+        self._notify(old, new)
+        return replace(new)
+
+    def save(self, s: Settings) -> None:
+        with self._lock:
+            old, _ = self._refresh()
+            self._store(s)
+        self._notify(old, s)
+
+    def update(self, **changes) -> Settings:
+        # Read-modify-write of just these fields under the lock, so a
+        # background writer (e.g. the last seen IMAP UID) cannot undo a
+        # concurrent save of other fields.
+        with self._lock:
+            old, current = self._refresh()
+            new = replace(current, **changes)
+            if new != current:
+                self._store(new)
+        self._notify(old, new)
+        return replace(new)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._stamp = None
+
+    def _refresh(self) -> tuple[Optional[Settings], Settings]:
+        # (previous cached value, current value); re-reads only when the file changed.
+        path = settings_path()
+        old = self._cached if path == self._path else None
+        stamp = _stamp(path)
+        if stamp is None:
+            self._store(Settings())
+        elif old is None or stamp != self._stamp:
+            self._path, self._stamp, self._cached = path, stamp, _parse(path)
+        return old, self._cached
+
+    def _store(self, s: Settings) -> None:
+        path = settings_path()
+        _write_atomic(path, s)
+        self._path, self._stamp, self._cached = path, _stamp(path), replace(s)
+
+    def _notify(self, old: Optional[Settings], new: Settings) -> None:
+        if old is None or old == new:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(replace(old), replace(new))
+            except Exception:
+                # A broken subscriber must not fail the save that triggered it.
+                logging.getLogger("certledger").exception("Settings subscriber failed.")
+
+
+_service = SettingsService()
+
+
+def settings_service() -> SettingsService:
+    return _service
+
+
+def load_settings() -> Settings:
+    return _service.load()
+
+
 def save_settings(s: Settings) -> None:
-    path: Path = settings_path()
-    path.write_text(json.dumps(asdict(s), indent=2), encoding="utf-8")
+    _service.save(s)
+
+
+def update_settings(**changes) -> Settings:
+    return _service.update(**changes)
+
+
+def subscribe(callback: SettingsCallback) -> Callable[[], None]:
+    return _service.subscribe(callback)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import os
+import sys
+import time
+from importlib.abc import MetaPathFinder
+from typing import Optional
+
+# Startup timing report, for catching time-to-interactive regressions:
+#   python main.py --startup-report     (or CERTLEDGER_STARTUP_REPORT=1)
+# logs the wall clock of each startup phase up to the first paint, plus an
+# -X importtime style breakdown of the slowest imports. Costs nothing when off.
+ENV_VAR = "CERTLEDGER_STARTUP_REPORT"
+FLAG = "--startup-report"
+TOP_IMPORTS = 25
+
+
+class _TimingLoader:
+    # Wraps a module's loader and records how long executing it took
+    # (including the imports it triggers, like -X importtime's "cumulative").
+    def __init__(self, loader, timer: StartupTimer):
+        self._loader = loader
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        t = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer.imports.append((module.__name__, time.perf_counter() - t))
+
+
+class _TimingFinder(MetaPathFinder):
+    def __init__(self, timer: StartupTimer):
+        self._timer = timer
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(spec.loader, self._timer)
+                return spec
+        return None
+
+
+class StartupTimer:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.marks: list[tuple[str, float]] = []
+        self.imports: list[tuple[str, float]] = []
+        self._finder: Optional[_TimingFinder] = None
+
+    @classmethod
+    def from_environment(cls, argv: Optional[list[str]] = None) -> Optional[StartupTimer]:
+        # A running timer when the report was asked for (the flag is removed
+        # from argv), else None.
+        argv = sys.argv if argv is None else argv
+        wanted = FLAG in argv or os.environ.get(ENV_VAR, "") not in ("", "0")
+        while FLAG in argv:
+            argv.remove(FLAG)
+        if not wanted:
+            return None
+        timer = cls()
+        timer._finder = _TimingFinder(timer)
+        sys.meta_path.insert(0, timer._finder)
+        return timer
+
+    def mark(self, label: str) -> None:
+        self.marks.append((label, time.perf_counter() - self.t0))
+
+    def stop(self) -> None:
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def report(self, top: int = TOP_IMPORTS) -> str:
+        lines = ["Startup timing (ms since main() started):"]
+        prev = 0.0
+        for label, at in self.marks:
+            lines.append(f"  {at * 1000:8.1f}  (+{(at - prev) * 1000:7.1f})  {label}")
+            prev = at
+        if self.imports:
+            lines.append("Slowest imports (ms, including the imports each one triggers):")
+            for name, d in sorted(self.imports, key=lambda x: x[1], reverse=True)[:top]:
+                lines.append(f"  {d * 1000:8.1f}  {name}")
+        return "\n".join(lines)
+
+
+def report_after_first_paint(timer: StartupTimer, widget, logger=None) -> None:
+    # Marks "first paint" once widget has finished painting for the first
+    # time, then logs the report (and prints it to stderr).
+    from PySide6 import QtCore
+
+    class _FirstPaint(QtCore.QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QtCore.QEvent.Paint:
+                widget.removeEventFilter(self)
+                # The filter runs before the paint; the timer fires after it.
+                QtCore.QTimer.singleShot(0, finish)
+            return False
+
+    def finish():
+        timer.mark("first paint")
+        timer.stop()
+        text = timer.report()
+        if logger:
+            logger.info(text)
+        print(text, file=sys.stderr)
+
+    # Parented to widget, which keeps it alive until it removes itself.
+    widget.installEventFilter(_FirstPaint(widget))
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+from . import db
+
+# Dashboard numbers, read from the trigger-maintained stats_counters table
+# (see db.STATS_SOURCES): one small read whatever the database size.
+# recompute()/verify() rebuild the same counters from the base tables.
+
+Counters = dict[str, dict[str, int]]
+
+
+@dataclass
+class Dashboard:
+    total: int = 0
+    by_status: dict[str, int] = field(default_factory=dict)
+    by_type: dict[str, int] = field(default_factory=dict)
+    expiring_this_month: int = 0
+    pending_signatures: int = 0
+    unmatched_evidence: int = 0
+
+
+def _collect(rows) -> Counters:
+    out: Counters = {}
+    for name, key, value in rows:
+        # Counters that dropped to zero keep their row; they are not data.
+        if value:
+            out.setdefault(name, {})[key] = value
+    return out
+
+
+def counters() -> Counters:
+    return _collect(db.get_connection().execute("SELECT name, key, value FROM stats_counters"))
+
+
+def recompute() -> Counters:
+    # The same counters from full scans of the base tables.
+    con = db.get_connection()
+    return _collect(
+        (name, key, value) for name, sql in db.STATS_SOURCES.items() for key, value in con.execute(sql)
+    )
+
+
+def dashboard(now: Optional[str] = None) -> Dashboard:
+    c = counters()
+    month = (now or db.now_iso())[:7]
+    by_status = c.get("status", {})
+    return Dashboard(
+        total=sum(by_status.values()),
+        by_status=by_status,
+        by_type=c.get("type", {}),
+        expiring_this_month=c.get("expiry_month", {}).get(month, 0),
+        pending_signatures=by_status.get("SIGN_REQUESTED", 0),
+        unmatched_evidence=c.get("evidence", {}).get("unmatched", 0),
+    )
+
+
+def verify() -> list[str]:
+    # Differences between the stored and the recomputed counters; empty when
+    # they agree.
+    with db.transaction():
+        # One read snapshot for both sides.
+        stored, actual = counters(), recompute()
+    problems = []
+    for name in sorted(set(stored) | set(actual)):
+        s, a = stored.get(name, {}), actual.get(name, {})
+        for key in sorted(set(s) | set(a)):
+            if s.get(key, 0) != a.get(key, 0):
+                problems.append(f"{name}[{key}]: stored {s.get(key, 0)}, actual {a.get(key, 0)}")
+    return problems
+
+
+def rebuild(actor: str = "system") -> None:
+    with db.transaction(immediate=True) as con:
+        db.fill_stats(con)
+        db.log_audit("REBUILD_STATS", "STATS", "stats_counters", "OK", "Dashboard counters recomputed.", actor=actor)
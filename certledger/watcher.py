@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import imaplib
+import select
+import ssl
+import threading
+import time
+from typing import Callable, Optional
+
+from . import db
+from . import emailer
+from .settings_store import changed_fields, load_settings, subscribe
+
+
+# A change to any of these reconnects the watcher with the new account.
+_CONNECTION_FIELDS = {"system_email", "imap_host", "imap_port", "imap_folder"}
+
+
+def _buffered(imap) -> bool:
+    # Whether a line can be read without waiting. imaplib's reader may already
+    # hold the next line (a "* 3 EXISTS" that came in the same packet as
+    # "+ idling"), and TLS may hold decrypted bytes; select() sees neither.
+    # A non-blocking peek fills the reader from either without ever waiting.
+    sock = imap.socket()
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return bool(imap.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+
+def _readable(imap, timeout: float) -> bool:
+    if _buffered(imap):
+        return True
+    r, _, _ = select.select([imap.socket()], [], [], timeout)
+    return bool(r)
+
+
+class MailboxWatcher(threading.Thread):
+    # Keeps one authenticated IMAP connection open and scans as soon as the
+    # server reports new mail (IDLE), falling back to NOOP polling when the
+    # server lacks IDLE. Reconnects with exponential backoff on any error.
+    def __init__(
+        self,
+        logger,
+        on_scan: Optional[Callable[[int, int], None]] = None,
+        imap_factory=None,
+        idle_timeout: float = 29 * 60,
+        poll_interval: float = 60.0,
+        max_backoff: float = 300.0,
+    ):
+        super().__init__(name="MailboxWatcher", daemon=True)
+        self.logger = logger
+        self.on_scan = on_scan
+        self.imap_factory = imap_factory
+        # RFC 2177: re-issue IDLE before the server's 30 minute inactivity timeout.
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self._stopping = threading.Event()
+        # Set by stop() and by connection settings changes; cuts waits short.
+        self._reconnect = threading.Event()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        self._reconnect.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self) -> None:
+        backoff = 1.0
+        db.init_db()
+        unsubscribe = subscribe(self._on_settings_changed)
+        while not self._stopping.is_set():
+            self._reconnect.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                imap = emailer.open_imap(load_settings(), self.logger, self.imap_factory)
+                if imap is None:
+                    # Not configured yet; look again later (or once settings change).
+                    self._reconnect.wait(self.poll_interval)
+                    continue
+                backoff = 1.0
+                try:
+                    self._watch(imap)
+                finally:
+                    try:
+                        imap.logout()
+                    except Exception:
+                        pass
+            except Exception:
+                self.logger.exception(f"Mailbox watcher error; reconnecting in {backoff:.0f}s.")
+                self._reconnect.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        unsubscribe()
+        db.close_connection()
+        self.logger.info("Mailbox watcher stopped.")
+
+    def _watch(self, imap) -> None:
+        use_idle = "IDLE" in imap.capabilities
+        self.logger.info(f"Mailbox watcher connected ({'IDLE' if use_idle else 'NOOP polling'}).")
+        while not self._reconnect.is_set():
+            self._scan(imap)
+            if use_idle:
+                self._idle(imap)
+            elif not self._reconnect.wait(self.poll_interval):
+                imap.noop()
+
+    def _scan(self, imap) -> None:
+        s = load_settings()
+        matched, processed = emailer.scan_mailbox(imap, s, self.logger)
+        if processed:
+            self.logger.info(f"Mailbox watcher processed {processed} emails, matched {matched}.")
+            if self.on_scan:
+                self.on_scan(matched, processed)
+
+    def _on_settings_changed(self, old, new) -> None:
+        if changed_fields(old, new) & _CONNECTION_FIELDS:
+            self.logger.info("Mailbox settings changed; reconnecting.")
+            self._reconnect.set()
+
+    def _idle(self, imap) -> None:
+        # imaplib has no IDLE support; drive the exchange by hand (RFC 2177).
+        tag = imap._new_tag()
+        imap.send(tag + b" IDLE\r\n")
+        line = imap.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+        deadline = time.monotonic() + self.idle_timeout
+        # Wake once a second so stop() is honoured promptly.
+        while not self._reconnect.is_set() and time.monotonic() < deadline:
+            if not _readable(imap, 1.0):
+                continue
+            line = imap.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed during IDLE.")
+            if line.startswith(b"*") and (b"EXISTS" in line or b"RECENT" in line):
+                break
+
+        imap.send(b"DONE\r\n")
+        while True:
+            line = imap.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed while leaving IDLE.")
+            if line.startswith(tag):
+                if not line[len(tag):].lstrip().startswith(b"OK"):
+                    raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+                return
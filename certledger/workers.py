@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Optional
+
+from PySide6 import QtCore
+
+
+class TaskSignals(QtCore.QObject):
+    # Lives on the GUI thread, so slots connected here run there even though
+    # the task emits from a pool thread.
+    progress = QtCore.Signal(str)
+    finished = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+
+
+class Task(QtCore.QRunnable):
+    # fn(task) runs on a pool thread. Long-running work should poll
+    # task.cancelled between steps and call task.report() for progress.
+    def __init__(self, fn: Callable[["Task"], Any], logger=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.logger = logger
+        self.signals = TaskSignals()
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def report(self, message: str) -> None:
+        self.signals.progress.emit(message)
+
+    def run(self) -> None:
+        try:
+            result = self.fn(self)
+        except Exception as e:
+            if self.logger:
+                self.logger.exception("Background task failed.")
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+
+class TaskRunner(QtCore.QObject):
+    # Runs Tasks on a QThreadPool. Tasks submitted with a key are exclusive:
+    # while one with that key is in flight, further submits are refused.
+    def __init__(self, logger, max_threads: int = 4, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self.logger = logger
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        # Keep worker threads (and their thread-local DB connections) alive.
+        self.pool.setExpiryTimeout(-1)
+        self._active: dict[int, Task] = {}
+        self._keyed: dict[str, Task] = {}
+
+    def is_running(self, key: str) -> bool:
+        return key in self._keyed
+
+    def submit(
+        self,
+        fn: Callable[[Task], Any],
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[str], None]] = None,
+        on_progress: Optional[Callable[[str], None]] = None,
+        key: Optional[str] = None,
+    ) -> Optional[Task]:
+        if key is not None and key in self._keyed:
+            return None
+
+        task = Task(fn, self.logger)
+        # Release first so callbacks may submit a follow-up task with the same key.
+        task.signals.finished.connect(lambda _=None: self._release(task, key))
+        task.signals.failed.connect(lambda _=None: self._release(task, key))
+        if on_progress:
+            task.signals.progress.connect(on_progress)
+        if on_done:
+            task.signals.finished.connect(on_done)
+        if on_error:
+            task.signals.failed.connect(on_error)
+
+        self._active[id(task)] = task
+        if key is not None:
+            self._keyed[key] = task
+        self.pool.start(task)
+        return task
+
+    def cancel(self, key: str) -> None:
+        task = self._keyed.get(key)
+        if task:
+            task.cancel()
+
+    def shutdown(self, timeout_ms: int = 5000) -> None:
+        for task in self._active.values():
+            task.cancel()
+        self.pool.waitForDone(timeout_ms)
+
+    def _release(self, task: Task, key: Optional[str]) -> None:
+        self._active.pop(id(task), None)
+        if key is not None and self._keyed.get(key) is task:
+            del self._keyed[key]
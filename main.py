@@ -1,11 +1,24 @@
 from __future__ import annotations
-from PySide6 import QtWidgets
+import multiprocessing
 import sys
-from certledger.app import CertLedgerWindow
+from certledger.startup import StartupTimer, report_after_first_paint
 
 def main():
+    # PDF verification uses worker processes; needed for frozen Windows builds.
+    multiprocessing.freeze_support()
+    # --startup-report: log phase timings and slow imports up to the first paint.
+    timer = StartupTimer.from_environment()
+    from PySide6 import QtWidgets
+    from certledger.app import CertLedgerWindow
+    if timer:
+        timer.mark("imports")
     app = QtWidgets.QApplication(sys.argv)
+    if timer:
+        timer.mark("QApplication")
     win = CertLedgerWindow()
+    if timer:
+        timer.mark("main window built")
+        report_after_first_paint(timer, win, win.logger)
     win.show()
     sys.exit(app.exec())
 